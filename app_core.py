@@ -1,23 +1,45 @@
 import tkinter as tk
-from PIL import ImageTk
+import threading
 from tkinter import filedialog, messagebox, simpledialog
-import json
+from workspace import Workspace
+from document_model import DocumentModel
+from perf_monitor import monitor
 from ui_toolbar import UIToolbar
 from pdf_manager import PDFManager
 from shape_manager import ShapeManager
-from event_handlers import EventHandlers, NumericInputDialog
+from snap_manager import SnapManager
+from search_manager import SearchManager
+from event_handlers import EventHandlers, NumericInputDialog, BulkEditDialog
+import bulk_ops
 import math_eval
 import math
 
+def _model_attr(name):
+    """プロジェクトの状態は DocumentModel が持つ（app.xxx は model.xxx の別名）"""
+    return property(
+        lambda self: getattr(self.model, name),
+        lambda self, value: setattr(self.model, name, value),
+    )
+
+
 class PDFAnnotator:
+    doc = _model_attr("doc")
+    pdf_path = _model_attr("pdf_path")
+    page_map = _model_attr("page_map")
+    shapes_by_page = _model_attr("shapes_by_page")
+    page_slope_default = _model_attr("page_slope_default")
+    slope_presets = _model_attr("slope_presets")
+
     def __init__(self, root):
         self.root = root
         self.root.title("PDF Annotator")
         self.root.geometry("1100x1000")
 
         # ====== 状態 ======
-        self.doc = None
-        self.pdf_path = None
+        # 図形・屋根倍率・PDF は model（GUIなしでも使える）、表示の状態はここで持つ
+        # 複数の図面はタブ（workspace）で開き、self.model は選択中のタブのもの
+        self.workspace = Workspace()
+        self.model = self.workspace.current.model
         self.page_index = 0
         self.scale = 1.0
         self.offset_x = 0
@@ -26,13 +48,15 @@ class PDFAnnotator:
         self.shape_type = None
         self.active_button = None
         self.selected_shape = None
-        self.shapes_by_page = {}
-        self.slope_presets = []   # [1.021, 1.05, ...] 過去に作った倍率記録
-        self.page_slope_default = {} 
+        self.selection = []       # 複数選択（Shift+クリック・Ctrl+A）。表示中ページの図形
+        self.hud_visible = False  # 性能HUD（F3で切替）
+        self._hud_job = None
 
         # ====== Manager群 ======
         self.pdf = PDFManager(self)
         self.shapes = ShapeManager(self)
+        self.snap = SnapManager(self)
+        self.search = SearchManager(self)
         self.ui = UIToolbar(self)
         self.handlers = EventHandlers(self)
 
@@ -56,6 +80,27 @@ class PDFAnnotator:
         self.canvas.bind("<MouseWheel>", self.handlers.on_mousewheel)
         root.bind("<Delete>", self.delete_selected)
         root.bind("<BackSpace>", self.delete_selected)
+        root.protocol("WM_DELETE_WINDOW", self.on_close)
+        root.bind("<F3>", self.toggle_hud)
+        root.bind("<Control-z>", self.undo)
+        root.bind("<Control-a>", self.select_all_on_page)
+
+        # ウィンドウ表示後に重いモジュールを裏で読み込んでおく
+        self.root.after(200, self.warm_up_modules)
+
+    def warm_up_modules(self):
+        """fitz / PIL をバックグラウンドで import（初回 Open の待ち時間を減らす）"""
+        def work():
+            import fitz  # noqa: F401
+            from PIL import Image, ImageTk  # noqa: F401
+        threading.Thread(target=work, daemon=True).start()
+        self.pdf.warm_up()
+
+    def on_close(self):
+        self.pdf.shutdown()
+        self.snap.shutdown()
+        self.search.shutdown()
+        self.root.destroy()
 
     # ======================================================
     # ページ描画
@@ -64,18 +109,33 @@ class PDFAnnotator:
         """PDF＋図形再描画（必要に応じて強調）"""
         if not self.doc:
             return
-        img = self.pdf.render_page()
-        if not img:
-            return
+        self._display_page(highlight_shape)
+        # 吸着用の線分索引を裏で作っておく（作成済みなら何もしない）
+        self.snap.prepare()
+        monitor.frame()
+        if self.hud_visible:
+            self.draw_hud()
+
+    @monitor.timed("display_page")
+    def _display_page(self, highlight_shape=None):
+        # ページ画像はワーカーで描画し、届いたら show_page_image で差し替える
+        placed = self.pdf.page_image()
 
-        self.tk_img = ImageTk.PhotoImage(img)
         self.canvas.delete("all")
-        self.canvas.create_image(self.offset_x, self.offset_y, anchor=tk.NW, image=self.tk_img)
+        if placed:
+            self.show_page_image(*placed)
+        else:
+            # 描画待ちの間はページの枠だけ表示
+            x0, y0, x1, y1 = self.pdf.page_rect(self.page_index)
+            cx0, cy0 = self.pdf_to_canvas(x0, y0)
+            cx1, cy1 = self.pdf_to_canvas(x1, y1)
+            self.canvas.create_rectangle(cx0, cy0, cx1, cy1, fill="white", outline="#bbb", tags="page")
+
+        # 図形描画（表示範囲外は描かず、小さく見えるものは簡略化）
+        self.shapes.draw_page_shapes(self.shapes_by_page.get(self.page_index, []), highlight_shape)
 
-        # 図形描画
-        for s in self.shapes_by_page.get(self.page_index, []):
-            highlight = (s is highlight_shape or s is self.selected_shape)
-            self.shapes.draw_shape(s, highlight=highlight)
+        # 文字検索のヒット
+        self.search.draw_highlight()
 
         # ページラベル更新
         self.page_label.config(text=f"Page {self.page_index+1} / {len(self.doc)}")
@@ -96,48 +156,236 @@ class PDFAnnotator:
             font=("Arial", 14)
         )
 
+    def show_page_image(self, photo, x, y):
+        """ページ画像を差し替える（図形は描き直さず最背面に置く）"""
+        self.tk_img = photo
+        self.canvas.delete("page")
+        self.canvas.create_image(x, y, anchor=tk.NW, image=photo, tags="page")
+        self.canvas.tag_lower("page")
+
+    # ======================================================
+    # 性能HUD
+    # ======================================================
+    def toggle_hud(self, event=None):
+        """FPS と処理ごとの所要時間の表示を切り替える"""
+        self.hud_visible = not self.hud_visible
+        if self.hud_visible:
+            self.draw_hud()
+        else:
+            self.canvas.delete("hud")
+            if self._hud_job is not None:
+                self.root.after_cancel(self._hud_job)
+                self._hud_job = None
+
+    def draw_hud(self):
+        """HUD を右上に描く（表示中は 0.5 秒ごとに更新）"""
+        from render_service import raster_cache
+        self.canvas.delete("hud")
+        w = self.canvas.winfo_width() or 800
+        lines = monitor.hud_lines()
+        shapes = self.shapes_by_page.get(self.page_index, [])
+        lines.append(f"shapes drawn {self.shapes.drawn_count}/{len(shapes)}")
+        # タブ共通の描画キャッシュの使用量
+        lines.append(f"cache {len(raster_cache)} img {raster_cache.nbytes / 2**20:.0f}"
+                     f"/{raster_cache.budget / 2**20:.0f} MB  evicted {raster_cache.evicted}")
+        tid = self.canvas.create_text(
+            w - 10, 10, anchor="ne", text="\n".join(lines),
+            fill="#00ff00", font=("Courier", 10), tags="hud",
+        )
+        x1, y1, x2, y2 = self.canvas.bbox(tid)
+        bg = self.canvas.create_rectangle(x1 - 4, y1 - 4, x2 + 4, y2 + 4, fill="black", outline="", tags="hud")
+        self.canvas.tag_lower(bg, tid)
+
+        if self._hud_job is not None:
+            self.root.after_cancel(self._hud_job)
+        self._hud_job = self.root.after(500, self._refresh_hud)
+
+    def _refresh_hud(self):
+        self._hud_job = None
+        if self.hud_visible:
+            self.draw_hud()
+
+    def dump_perf_dialog(self):
+        """計測結果を JSON に保存（リリース間の比較用）"""
+        path = filedialog.asksaveasfilename(
+            defaultextension=".json", initialfile="perf.json", filetypes=[("JSON", "*.json")]
+        )
+        if path:
+            monitor.dump(path)
+            self.set_status(f"Perf stats saved: {path}")
+
     # ======================================================
     # ファイル操作
     # ======================================================
     def open_pdf_dialog(self):
         path = filedialog.askopenfilename(filetypes=[("PDF", "*.pdf")])
         if path:
+            prev = self._begin_new_tab()
+            # プロジェクトなしで開く（文字索引は保存しない）
+            self.model.project_path = None
             if self.pdf.open_pdf(path):
-                self.set_status(f"Opened: {path}")
+                self.ui.refresh_tabs()
+                self.set_status(f"Opened: {path}  {self.pdf.open_stats_text()}")
                 self.display_page()
+            else:
+                self._cancel_new_tab(prev)
 
     def export_pdf_dialog(self):
         if not self.doc:
             return
         path = filedialog.asksaveasfilename(defaultextension=".pdf")
         if path:
-            self.pdf.export(path)
+            # 同じ出力先への再出力は変更ページだけ追記保存
+            # 大きなPDFの全体出力はページ範囲ごとに並列処理
+            try:
+                self.pdf.export(path, incremental=True, workers=None)
+            except ValueError as e:
+                messagebox.showerror("出力できません", str(e))
+                return
             messagebox.showinfo("Exported", f"Saved: {path}")
 
+    def export_images_dialog(self):
+        """図形付きのページ画像（PNG / TIFF、1ページ1ファイル）を出力"""
+        if not self.doc:
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            filetypes=[("PNG", "*.png"), ("TIFF", "*.tif *.tiff")],
+        )
+        if not path:
+            return
+        dpi = simpledialog.askinteger("画像出力", "解像度 (DPI)", initialvalue=300, minvalue=36, maxvalue=1200)
+        if not dpi:
+            return
+        try:
+            self.pdf.export_images(path, dpi)
+        except ValueError as e:
+            messagebox.showerror("出力できません", str(e))
+
+    def export_quantities_dialog(self):
+        """図形ごとの数量明細（ページ合計・合計つき）を CSV / JSON に出力"""
+        if not self.doc:
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON", "*.json"), ("JSON Lines", "*.jsonl")],
+        )
+        if not path:
+            return
+        try:
+            n = self.model.export_quantities(path)
+        except OSError as e:
+            messagebox.showerror("出力できません", str(e))
+            return
+        self.set_status(f"数量明細 {n} 行: {path}")
+
     def save_project_dialog(self):
         path = filedialog.asksaveasfilename(defaultextension=".json")
         if not path:
             return
-        data = {"pdf_path": self.pdf_path, "shapes_by_page": self.shapes_by_page}
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
+        self.model.save_project(path)
+        self.search.save_index(path)
+        self.ui.refresh_tabs()
         self.set_status(f"Project saved: {path}")
 
     def load_project_dialog(self):
         path = filedialog.askopenfilename(filetypes=[("JSON", "*.json")])
         if not path:
             return
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        self.pdf_path = data["pdf_path"]
-
-        raw = data.get("shapes_by_page", {})
-        self.shapes_by_page = {int(k): v for k, v in raw.items()}
-
-        self.pdf.open_pdf(self.pdf_path)
+        prev = self._begin_new_tab()
+        try:
+            data = self.model.load_project(path, open_pdf=False)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            # 壊れたJSON・項目の足りないJSON
+            messagebox.showerror("読み込めません", f"{path}\n{e}")
+            self._cancel_new_tab(prev)
+            return
+        if not self.pdf.open_pdf(self.pdf_path, data["page_map"]):
+            # PDF が見つからない・開けない（エラーは open_pdf が表示済み）
+            self._cancel_new_tab(prev)
+            return
+        self.ui.refresh_tabs()
+        self.update_slope_combo()
         self.set_status(f"Project loaded: {path}")
         self.display_page()
 
+    # ======================================================
+    # タブ（複数図面）
+    # ======================================================
+    def _store_view(self):
+        """選択中タブに表示位置を覚えておく"""
+        tab = self.workspace.current
+        tab.page_index, tab.scale = self.page_index, self.scale
+        tab.offset_x, tab.offset_y = self.offset_x, self.offset_y
+
+    def _begin_new_tab(self):
+        """開く先のタブを用意する。今のタブが使用中なら新しいタブを作り、元のタブ番号を返す"""
+        if not self.doc:
+            return None
+        prev = self.workspace.active
+        self._store_view()
+        self.model = self.workspace.add().model
+        return prev
+
+    def _cancel_new_tab(self, prev):
+        """開けなかったときに作ったタブを閉じて元に戻す"""
+        if prev is None:
+            # 空のタブをそのまま使っていた：読みかけの内容を捨てて空に戻す
+            tab = self.workspace.current
+            tab.model.close()
+            tab.model = self.model = DocumentModel()
+            self.ui.refresh_tabs()
+            return
+        self.workspace.close(self.workspace.active)
+        self.switch_tab(prev, store=False)
+
+    def switch_tab(self, index, store=True):
+        """タブを切り替える（ファイルは開き直さず、描画済みの画像はキャッシュから）"""
+        if store:
+            self._store_view()
+        tab = self.workspace.select(index)
+        self.model = tab.model
+        self.page_index, self.scale = tab.page_index, tab.scale
+        self.offset_x, self.offset_y = tab.offset_x, tab.offset_y
+
+        self.selected_shape = None
+        self.selection = []
+        self.shapes.clear_handles()
+        self.shapes.triangle_points.clear()
+        self.shapes.polygon_points.clear()
+        self.search.forget_hits()
+        self.snap.clear_marker()
+        self.ui.refresh_tabs()
+        self.update_slope_combo()
+        if self.doc:
+            self.display_page()
+        else:
+            self.canvas.delete("all")
+            self.page_label.config(text="Page 0 / 0")
+
+    def close_tab(self, index=None):
+        """タブを閉じる（最後の1枚なら空のタブになる）"""
+        if index is None:
+            index = self.workspace.active
+        path = self.workspace.tabs[index].model.pdf_path
+        self._store_view()
+        self.workspace.close(index)
+        if path and path not in self.workspace.paths():
+            self.search.drop(path)
+        self.switch_tab(self.workspace.active, store=False)
+
+    def show_workspace_totals_dialog(self):
+        """開いているすべての図面の総合集計"""
+        total, per_doc, _ = self.workspace.total_stats()
+        txt = ""
+        for name, totals in per_doc.items():
+            txt += f"=== {name} ===\n"
+            txt += "".join(f"{k}: {v:.3f}\n" for k, v in totals.items() if v)
+        txt += "\n=== 全図面の総合集計 ===\n"
+        for k, v in total.items():
+            txt += f"{k}: {v:.3f}\n"
+        messagebox.showinfo("全タブ集計", txt)
+
     # ======================================================
     # ページ操作
     # ======================================================
@@ -147,6 +395,7 @@ class PDFAnnotator:
         if self.page_index < len(self.doc) - 1:
             self.page_index += 1
             self.selected_shape = None
+            self.selection = []
             self.shapes.clear_handles()
             self.display_page()
 
@@ -156,28 +405,117 @@ class PDFAnnotator:
         if self.page_index > 0:
             self.page_index -= 1
             self.selected_shape = None
+            self.selection = []
             self.shapes.clear_handles()
             self.display_page()
 
     def delete_selected(self, event=None):
         """選択中図形 or ページ削除"""
-        if self.selected_shape:
+        # 検索欄などで文字を消しているときは何もしない
+        if event is not None and event.widget.winfo_class() in ("Entry", "TEntry", "TCombobox"):
+            return
+        if len(self.selection) > 1:
+            # 複数選択はまとめて削除（Ctrl+Z で1回で戻せる）
+            self.model.remove_shapes([(self.page_index, s) for s in self.selected_shapes()], "削除")
+            self.selection = []
+            self.selected_shape = None
+            self.shapes.clear_handles()
+            self.display_page()
+        elif self.selected_shape:
             lst = self.shapes_by_page.get(self.page_index, [])
             if self.selected_shape in lst:
-                lst.remove(self.selected_shape)
+                self.shapes.remove_shape(self.selected_shape, label="削除")
                 self.selected_shape = None
+                self.selection = []
                 self.shapes.clear_handles()
                 self.display_page()
         else:
             if not self.doc:
                 return
             if len(self.doc) > 1:
-                self.doc.delete_page(self.page_index)
+                self.pdf.delete_page(self.page_index)
                 self.page_index = min(self.page_index, len(self.doc) - 1)
                 self.display_page()
             else:
                 messagebox.showinfo("削除不可", "最後のページは削除できません。")
 
+    # ======================================================
+    # 複数選択・一括操作・取り消し
+    # ======================================================
+    def selected_shapes(self):
+        """選択中の図形（複数選択＋単独選択、表示中ページにあるものだけ・重なり順）"""
+        marked = {id(s) for s in self.selection}
+        if self.selected_shape is not None:
+            marked.add(id(self.selected_shape))
+        if not marked:
+            return []
+        return [s for s in self.shapes_by_page.get(self.page_index, []) if id(s) in marked]
+
+    def select_all_on_page(self, event=None):
+        if event is not None and event.widget.winfo_class() in ("Entry", "TEntry", "TCombobox"):
+            return
+        self.selection = list(self.shapes_by_page.get(self.page_index, []))
+        self.set_status(f"{len(self.selection)} 個の図形を選択")
+        self.display_page()
+        return "break"
+
+    def undo(self, event=None):
+        """直前の操作（追加・削除・移動・一括操作）を取り消す"""
+        if event is not None and event.widget.winfo_class() in ("Entry", "TEntry", "TCombobox"):
+            return
+        label = self.model.undo()
+        if label is None:
+            self.set_status("取り消せる操作はありません")
+            return
+        self.selected_shape = None
+        self.selection = []
+        self.shapes.clear_handles()
+        self.set_status(f"取り消し: {label}")
+        self.display_page()
+
+    def recolor_selection(self, color):
+        """複数選択中の図形の色（＝集計の分類）をまとめて変える"""
+        if not self.selection:
+            return False
+        shapes = self.selected_shapes()
+        bulk_ops.recolor(self.model, self.page_index, shapes, color)
+        self.set_status(f"{len(shapes)} 個の図形の色を変更（Ctrl+Z で取り消し）")
+        self.display_page()
+        return True
+
+    def bulk_edit_dialog(self):
+        """選択中の図形をまとめて移動・拡大縮小・反転、または複製・他ページへコピー"""
+        shapes = self.selected_shapes()
+        if not shapes:
+            messagebox.showinfo("一括操作", "図形を選択してください（Shift+クリックで複数、Ctrl+A でページ全体）。")
+            return
+        r = BulkEditDialog(self.root, len(shapes)).result
+        if not r:
+            return
+        try:
+            pages = bulk_ops.parse_pages(r["pages"], self.model.page_count()) if r["pages"] else []
+        except ValueError as e:
+            messagebox.showerror("エラー", f"コピー先ページ: {e}")
+            return
+        # 拡大・反転は選択範囲の中心を基準にする
+        tf = bulk_ops.make_transform(r["dx"], r["dy"], r["scale"], r["mirror_x"], r["mirror_y"],
+                                     origin=bulk_ops.group_center(shapes))
+        page = self.page_index
+        if pages:
+            items = bulk_ops.replicate(self.model, shapes, page, pages, tf)
+            msg = f"{len(shapes)} 個を {len(pages)} ページにコピー（計 {len(items)} 個）"
+        elif r["copy"]:
+            items = bulk_ops.replicate(self.model, shapes, page, [page], tf, label="複製")
+            self.selection = [s for _, s in items]
+            self.selected_shape = None
+            msg = f"{len(items)} 個を複製"
+        else:
+            bulk_ops.transform_in_place(self.model, page, shapes, tf)
+            msg = f"{len(shapes)} 個を変換"
+        self.shapes.clear_handles()
+        self.set_status(msg + "  （Ctrl+Z で取り消し）")
+        self.display_page()
+
     # ======================================================
     # ズーム機能
     # ======================================================
@@ -220,6 +558,9 @@ class PDFAnnotator:
         """図形選択時、自動的にDrawモードに切替"""
         if not hasattr(self, "shape_buttons"):
             return
+        # 作りかけの多角形は捨てる
+        self.shapes.polygon_points.clear()
+        self.shapes.clear_polygon_preview()
 
         # ---- すべての図形ボタンをリセット ----
         for b in self.shape_buttons.values():
@@ -295,6 +636,43 @@ class PDFAnnotator:
 
         self.display_page()
 
+    def search_text(self, event=None):
+        """検索欄の語を探してヒットへ移動（Enter を押すたびに次のヒット）"""
+        if not self.doc:
+            return
+        self.search.search(self.search_var.get())
+
+    def toggle_snap(self):
+        """PDFの線への吸着 ON/OFF"""
+        on = self.snap.toggle()
+        if hasattr(self, "btn_snap"):
+            self.btn_snap.config(bg="lightblue" if on else "SystemButtonFace")
+        self.set_status("Snap: ON" if on else "Snap: OFF")
+
+    def name_selected_dialog(self):
+        """選択中の図形に名前を付ける（テキスト数式から A1 や sum(window) で参照）"""
+        s = self.selected_shape
+        if not s:
+            messagebox.showinfo("名前", "名前を付ける図形を選択してください。")
+            return
+        name = simpledialog.askstring(
+            "名前", "図形の名前（英字で始まる名前。空欄で解除）:",
+            initialvalue=s.get("name", ""),
+        )
+        if name is None:
+            return
+        name = name.strip()
+        if name and (not name.isidentifier() or name in ("sqrt", "sum")):
+            messagebox.showerror("エラー", f"名前に使えません: {name}")
+            return
+
+        try:
+            self.shapes.set_shape_name(s, name)
+        except ValueError as e:
+            messagebox.showerror("エラー", str(e))
+            return
+        self.display_page()
+
     def update_slope_combo(self):
         items = [f"{v:.3f}" for v in self.slope_presets]
         self.ui.slope_combo["values"] = items
@@ -306,80 +684,13 @@ class PDFAnnotator:
         else:
             self.ui.slope_combo.set("")
 
+    @monitor.timed("calc_page_stats")
     def calc_page_stats(self, page_index):
         """ページ内の図形を集計し、数値と式の情報を返す"""
-        shapes = self.shapes_by_page.get(page_index, [])
-
-        # 色 → 属性名
-        ATTR = {
-            "#ff0000": "wall",
-            "#0000ff": "roof",
-            "#00aa00": "bshita",
-            "#ffa500": "koya",
-            "#800080": "window",
-            "#999999": "door",
-        }
-
-        # 集計値
-        totals = {k: 0.0 for k in ["wall", "roof", "bshita", "koya", "window", "door"]}
-
-        # 式一覧（右下に描く用）
-        formula_lines = []
-
-        for s in shapes:
-            col = s.get("color")
-            val = s.get("value")
-
-            if col not in ATTR or val is None:
-                continue
-
-            atr = ATTR[col]
-
-            # --- 屋根だけは倍率をかける ---
-            if atr == "roof":
-                slope = self.shapes.get_slope_factor(s)
-                result = val * slope
-                totals["roof"] += result
-                formula_lines.append(f"屋根: {val:.3f} × {slope:.3f} = {result:.3f}")
-            else:
-                totals[atr] += val
-                formula_lines.append(f"{atr}: {val:.3f}")
-
-        # --- 壁は窓・ドアを引く ---
-        wall_final = totals["wall"] - (totals["window"] + totals["door"])
-        formula_lines.append(
-            f"壁最終: {totals['wall']:.3f} - ({totals['window']:.3f} + {totals['door']:.3f}) = {wall_final:.3f}"
-        )
-        totals["wall_final"] = wall_final
-
-        return totals, formula_lines
+        return self.model.page_stats(page_index)
 
     def calc_total_stats(self):
-        pages = sorted(self.shapes_by_page.keys())
-
-        grand = {
-            "wall_final": 0.0,
-            "roof": 0.0,
-            "bshita": 0.0,
-            "koya": 0.0,
-            "window": 0.0,
-            "door": 0.0,
-        }
-
-        all_formulas = []
-
-        for p in pages:
-            totals, formulas = self.calc_page_stats(p)
-            if not formulas:
-                continue
-            all_formulas.append(f"=== Page {p+1} ===")
-            all_formulas.extend(formulas)
-
-            for k in grand:
-                if k in totals:
-                    grand[k] += totals[k]
-
-        return grand, all_formulas
+        return self.model.total_stats()
 
     def show_total_stats_dialog(self):
         total, formulas = self.calc_total_stats()
@@ -429,7 +740,7 @@ class PDFAnnotator:
             "summary": True,
         }
 
-        self.shapes_by_page.setdefault(page_index, []).append(shape)
+        self.model.add_shape(page_index, shape)
 
         if page_index == self.page_index:
             self.display_page()
@@ -0,0 +1,849 @@
+# bench.py
+# 性能計測スクリプト（GUI不要）
+#   python bench.py export [--shapes 10000] [--skip-legacy]
+#   python bench.py startup [--runs 5]
+#   python bench.py eval [--n 100000]
+#   python bench.py truncate [--n 200000]
+#   python bench.py render [--steps 8]
+#   python bench.py suite [--sizes 1000,10000,100000] [--repeat 3] [--baseline base.json | --save-baseline base.json]
+import os
+import sys
+import json
+import math
+import argparse
+import random
+import statistics
+import subprocess
+import time
+import fitz
+from pdf_manager import stamp_page, EXPORT_COLORS
+import math_eval
+
+
+# =====================================================
+# 合成データ
+# =====================================================
+def make_shapes(n, width=595, height=842, seed=0):
+    """1ページ分のランダム図形を n 個生成"""
+    rnd = random.Random(seed)
+    kinds = ["rect", "ellipse", "line", "triangle", "text"]
+    shapes = []
+    for i in range(n):
+        t = kinds[i % len(kinds)]
+        x, y = rnd.uniform(0, width - 60), rnd.uniform(20, height - 60)
+        if t in ("rect", "ellipse"):
+            s = {"type": t, "x": x, "y": y, "w": rnd.uniform(5, 60), "h": rnd.uniform(5, 60)}
+        elif t == "line":
+            s = {"type": t, "x1": x, "y1": y, "x2": x + rnd.uniform(-50, 50), "y2": y + rnd.uniform(-50, 50)}
+        elif t == "triangle":
+            s = {"type": t, "points": [(x, y), (x + 40, y), (x + 20, y + 30)]}
+        else:
+            s = {"type": t, "x": x, "y": y, "text": f"{i}"}
+        shapes.append(s)
+    return shapes
+
+
+def make_polygon(n, cx=500, cy=500, r=400, seed=0):
+    """なぞって作った屋根・外壁のような頂点の多い多角形（ゆるい凹凸＋細かい揺らぎ）"""
+    rnd = random.Random(seed)
+    pts = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        rr = r + 30 * math.sin(7 * a) + rnd.uniform(-0.3, 0.3)
+        pts.append((cx + rr * math.cos(a), cy + rr * math.sin(a)))
+    return {"id": f"polygon-{n}", "type": "polygon", "points": pts, "color": "#0000ff"}
+
+
+def _stamp_page_per_shape(p, shapes):
+    """旧実装（図形ごとに page.draw_* を呼ぶ）比較用"""
+    for s in shapes:
+        t = s["type"]
+        color = EXPORT_COLORS.get(t)
+        if t == "rect":
+            p.draw_rect(fitz.Rect(s["x"], s["y"], s["x"] + s["w"], s["y"] + s["h"]), color=color)
+        elif t == "ellipse":
+            p.draw_oval(fitz.Rect(s["x"], s["y"], s["x"] + s["w"], s["y"] + s["h"]), color=color)
+        elif t == "line":
+            p.draw_line((s["x1"], s["y1"]), (s["x2"], s["y2"]), color=color)
+        elif t == "triangle":
+            p.draw_polyline([fitz.Point(x, y) for x, y in s["points"]], color=color, closePath=True)
+        elif t == "text":
+            p.insert_text((s["x"], s["y"]), s["text"], fontsize=12, color=(0, 0, 0))
+
+
+# =====================================================
+# 計測
+# =====================================================
+def bench_export(n_shapes, legacy=True):
+    """1ページに n_shapes 個の図形を書き込んで保存するまでの時間"""
+    shapes = make_shapes(n_shapes)
+    results = {}
+    impls = [("batched", stamp_page)]
+    if legacy:
+        impls.append(("per_shape", _stamp_page_per_shape))
+    for name, fn in impls:
+        doc = fitz.open()
+        page = doc.new_page()
+        t0 = time.perf_counter()
+        fn(page, shapes)
+        data = doc.tobytes()
+        results[name] = (time.perf_counter() - t0, len(data))
+        doc.close()
+    return results
+
+
+# main.py と同じ順序で起動し、各段階の経過時間を JSON で出す（子プロセスで実行）
+_STARTUP_SCRIPT = r"""
+import time, sys, json
+t0 = time.perf_counter()
+res = {}
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError:
+    root = None
+if root is not None:
+    root.geometry("1100x1000")
+    root.update()
+    res["first_window"] = time.perf_counter() - t0
+t = time.perf_counter()
+import app_core
+res["import_app_core"] = time.perf_counter() - t
+if root is not None:
+    app = app_core.PDFAnnotator(root)
+    root.update()
+    res["app_ready"] = time.perf_counter() - t0
+    root.destroy()
+res["heavy_loaded"] = [m for m in ("fitz", "PIL") if m in sys.modules]
+print(json.dumps(res))
+"""
+
+
+def bench_startup(runs=5):
+    """起動時間（app_core の import 時間・最初のウィンドウまでの時間）の中央値"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT],
+            cwd=here, capture_output=True, text=True, check=True,
+        ).stdout
+        res = json.loads(out.strip().splitlines()[-1])
+        res["process_total"] = time.perf_counter() - t0
+        samples.append(res)
+
+    summary = {}
+    for key in ("import_app_core", "first_window", "app_ready", "process_total"):
+        vals = [r[key] for r in samples if key in r]
+        if vals:
+            summary[key] = statistics.median(vals)
+    summary["heavy_loaded"] = samples[-1]["heavy_loaded"]
+    return summary
+
+
+# テキスト図形によく出てくる形の式
+EVAL_EXPRS = [
+    "154.2+8",
+    "(3.64+0.91)*2.73",
+    "sqrt(4.2^2+1.8^2)*12.5",
+    "1.82*0.91*2-0.455",
+    "4.2325",
+]
+
+
+def _eval_uncached(expr):
+    """キャッシュ導入前と同じ：毎回 ast.parse して SafeEvaluator で走査"""
+    import ast
+    tree = ast.parse(expr.strip().replace("^", "**"), mode="eval")
+    return float(math_eval.SafeEvaluator().visit(tree))
+
+
+# UI を固めかねない式（評価コストの上限で即座に失敗するべきもの）
+PATHOLOGICAL_EXPRS = {
+    "tower_pow": "9**9**9",
+    "big_exponent": "2^5000",
+    "deep_parens": "(" * 5000 + "1" + ")" * 5000,
+    "unary_chain": "-" * 100000 + "1",
+    "long_sum": "+".join(["1"] * 200000),
+    "huge_result": "*".join(["99999"] * 50),
+}
+
+
+def bench_eval(n, pathological=True):
+    """式評価のスループット（evals/s）：キャッシュあり・なし・異常な式"""
+    exprs = [EVAL_EXPRS[i % len(EVAL_EXPRS)] for i in range(n)]
+    results = {}
+    math_eval.clear_cache()
+    for name, fn in [("cached", math_eval.eval_expr), ("uncached", _eval_uncached)]:
+        t0 = time.perf_counter()
+        for e in exprs:
+            fn(e)
+        results[name] = n / (time.perf_counter() - t0)
+
+    if pathological:
+        # 初回（解析を含む）と、再描画を想定した2回目以降の平均
+        reps = max(1, n // 100)
+        for name, e in PATHOLOGICAL_EXPRS.items():
+            math_eval.clear_cache()
+            t0 = time.perf_counter()
+            for _ in range(reps):
+                try:
+                    math_eval.eval_expr(e)
+                except math_eval.MathEvalError:
+                    pass
+            results[f"pathological:{name}"] = reps / (time.perf_counter() - t0)
+    return results
+
+
+def _truncate_3_decimal(x):
+    """固定小数点化する前の実装（Decimal の往復）"""
+    from decimal import Decimal, ROUND_DOWN
+    return float(Decimal(str(x)).quantize(Decimal("0.001"), rounding=ROUND_DOWN))
+
+
+def bench_truncate(n):
+    """小数第3位切り捨てと集計のスループット：固定小数点 vs Decimal"""
+    import quantity
+    rnd = random.Random(0)
+    vals = [rnd.uniform(0, 500) for _ in range(n)]
+    results = {}
+    for name, fn in [("milli", math_eval.truncate_3), ("decimal", _truncate_3_decimal)]:
+        t0 = time.perf_counter()
+        for v in vals:
+            fn(v)
+        results[f"truncate_{name}"] = n / (time.perf_counter() - t0)
+
+    colors = list(quantity.ATTR)
+    shapes = [{"color": colors[i % len(colors)], "value": v} for i, v in enumerate(vals)]
+    t0 = time.perf_counter()
+    quantity.calc_page_stats(shapes, 1.118)
+    results["page_stats"] = n / (time.perf_counter() - t0)
+    return results
+
+
+def _heavy_pdf(path, pages=4, lines=4000, seed=0):
+    """描画に時間のかかるPDF（細い線を大量に引いたページ）を作る"""
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        sh = page.new_shape()
+        for _ in range(lines):
+            sh.draw_line((rnd.uniform(0, 595), rnd.uniform(0, 842)),
+                         (rnd.uniform(0, 595), rnd.uniform(0, 842)))
+        sh.finish(width=0.3)
+        sh.commit()
+    doc.save(path)
+    doc.close()
+
+
+class _TickRoot:
+    """Tk の after だけを真似る最小のイベントループ（ディスプレイ不要）"""
+    def __init__(self):
+        self.queue = []
+        self.seq = 0
+
+    def after(self, ms, fn):
+        self.seq += 1
+        self.queue.append((time.perf_counter() + ms / 1000, self.seq, fn))
+        return self.seq
+
+    def after_cancel(self, ident):
+        self.queue = [q for q in self.queue if q[1] != ident]
+
+    def run(self, until):
+        """until() が真になるまで回し、イベント間の最大停止時間（秒）を返す"""
+        last = time.perf_counter()
+        worst = 0.0
+        while not until():
+            self.queue.sort()
+            if self.queue and self.queue[0][0] <= time.perf_counter():
+                _, _, fn = self.queue.pop(0)
+                fn()
+            else:
+                time.sleep(0.001)
+            now = time.perf_counter()
+            worst = max(worst, now - last)
+            last = now
+        return worst
+
+
+def bench_render(steps=8):
+    """ズーム連打を想定：イベントループの最大停止時間と、実際に描画した枚数"""
+    import tempfile
+    from render_service import RenderService, _pixmap_data, render_clip
+
+    class _App:
+        pass
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "heavy.pdf")
+        _heavy_pdf(path)
+        scales = [1.25 ** i for i in range(1, steps + 1)]
+        # 1100x1000 のキャンバスで左上を表示している想定のクリップ
+        clips = {sc: render_clip((0, 0, 595, 842), sc, (0, 0, 1100 / sc, 1000 / sc)) for sc in scales}
+        results = {}
+
+        # 同期：イベントごとにその場で描画（従来）
+        app = _App()
+        app.root = _TickRoot()
+        app.doc = fitz.open(path)
+        todo = list(scales)
+        done = []
+
+        def sync_step():
+            sc = todo.pop(0)
+            _pixmap_data(app.doc.load_page(0), sc, clips[sc])
+            done.append(1)
+            if todo:
+                app.root.after(1, sync_step)
+        app.root.after(0, sync_step)
+        t0 = time.perf_counter()
+        worst = app.root.run(lambda: len(done) == len(scales))
+        results["sync"] = (time.perf_counter() - t0, worst, len(done))
+
+        # 非同期：ワーカーで描画し、置き換えられた依頼は捨てる
+        app.root = _TickRoot()
+        got = []
+        svc = RenderService(app, got.append)
+        svc.warm_up()
+        time.sleep(0.5)  # ワーカー起動はウィンドウ表示直後に済んでいる想定
+        t0 = time.perf_counter()
+        for sc in scales:
+            svc.request(path, 0, 0, sc, clips[sc])
+        worst = app.root.run(lambda: bool(got) and got[-1].request.scale == scales[-1])
+        results["async"] = (time.perf_counter() - t0, worst, len(got))
+        svc.shutdown()
+        app.doc.close()
+    return results
+
+
+# =====================================================
+# ベンチマークスイート（合成PDF・合成プロジェクト、ディスプレイ不要）
+# =====================================================
+SUITE_SIZES = (1000, 10000, 100000)
+SUITE_PAGES = 20
+# 基準値よりこの割合以上遅くなったら回帰とみなす
+REGRESSION_THRESHOLD = 0.20
+# 差がこれ未満（ミリ秒）なら計測の揺れとして回帰にしない
+REGRESSION_MIN_MS = 1.0
+QUANTITY_COLORS = ["#ff0000", "#0000ff", "#00aa00", "#ffa500", "#800080", "#999999"]
+
+
+def make_cad_pdf(path, pages=SUITE_PAGES, lines=3000, seed=0):
+    """CAD図面風のベクタ主体のPDF（通り芯・壁線・寸法・円弧・文字）"""
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    for pno in range(pages):
+        page = doc.new_page(width=1190, height=842)  # A3 横
+        sh = page.new_shape()
+        # 通り芯
+        for x in range(40, 1190, 90):
+            sh.draw_line((x, 20), (x, 822))
+        for y in range(40, 842, 90):
+            sh.draw_line((20, y), (1170, y))
+        sh.finish(color=(0.6, 0.6, 0.6), width=0.2, dashes="[4 2] 0")
+        # 壁・建具
+        for _ in range(lines):
+            x, y = rnd.uniform(40, 1150), rnd.uniform(40, 800)
+            if rnd.random() < 0.5:
+                sh.draw_line((x, y), (x + rnd.uniform(-80, 80), y))
+            else:
+                sh.draw_line((x, y), (x, y + rnd.uniform(-80, 80)))
+        sh.finish(color=(0, 0, 0), width=0.5)
+        for _ in range(lines // 20):
+            x, y = rnd.uniform(60, 1130), rnd.uniform(60, 780)
+            sh.draw_rect(fitz.Rect(x, y, x + rnd.uniform(10, 40), y + rnd.uniform(10, 40)))
+            sh.draw_sector((x, y), (x + 20, y), 90)
+        sh.finish(color=(0, 0, 0.5), width=0.3)
+        sh.commit()
+        for i in range(60):
+            page.insert_text((rnd.uniform(40, 1100), rnd.uniform(40, 800)), f"W{pno}-{i} 910", fontsize=6)
+    doc.save(path)
+    doc.close()
+
+
+def make_scan_pdf(path, pages=4, dpi=200, seed=0):
+    """スキャン図面風の画像だけのPDF（A3・グレースケール・ノイズ入り）"""
+    rnd = random.Random(seed)
+    doc = fitz.open()
+    w, h = int(1190 / 72 * dpi), int(842 / 72 * dpi)
+    for _ in range(pages):
+        pix = fitz.Pixmap(fitz.csGRAY, fitz.IRect(0, 0, w, h), False)
+        pix.clear_with(235)
+        # 線の代わりに暗い帯を描き、紙のノイズを少し混ぜる
+        for _ in range(400):
+            x, y = rnd.randrange(w - 400), rnd.randrange(h - 10)
+            pix.set_rect(fitz.IRect(x, y, x + rnd.randrange(50, 400), y + 3), (30,))
+        for _ in range(4000):
+            pix.set_pixel(rnd.randrange(w), rnd.randrange(h), (rnd.randrange(180, 255),))
+        page = doc.new_page(width=1190, height=842)
+        page.insert_image(page.rect, stream=pix.tobytes("png"))
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def make_project_shapes(n, pages=SUITE_PAGES, seed=0):
+    """数量分類の色・値つきの図形 n 個を pages ページに配る"""
+    rnd = random.Random(seed)
+    shapes = make_shapes(n, width=1190, height=842, seed=seed)
+    by_page = {}
+    for i, s in enumerate(shapes):
+        s["id"] = f"s{i}"
+        s["color"] = QUANTITY_COLORS[i % len(QUANTITY_COLORS)]
+        s["value"] = round(rnd.uniform(0.1, 50), 3)
+        by_page.setdefault(i % pages, []).append(s)
+    return by_page
+
+
+class _StubCanvas:
+    """Tk Canvas の代役（作った図形の数と、文字の大きさの見積もりだけ持つ）"""
+    def __init__(self, width=1100, height=1000):
+        self.width = width
+        self.height = height
+        self.items = {}
+        self.seq = 0
+
+    def _create(self, coords, kw):
+        self.seq += 1
+        self.items[self.seq] = (coords, kw)
+        return self.seq
+
+    def create_line(self, *c, **kw):
+        return self._create(c, kw)
+
+    create_rectangle = create_oval = create_polygon = create_image = create_line
+
+    def create_text(self, x, y, **kw):
+        return self._create((x, y), kw)
+
+    def bbox(self, item):
+        (x, y), kw = self.items[item]
+        size = kw.get("font", ("", 10))[1]
+        lines = str(kw.get("text", "")).split("\n")
+        return (x, y, x + max(len(l) for l in lines) * size * 0.6, y + len(lines) * size * 1.2)
+
+    def delete(self, *items):
+        for it in items:
+            if it == "all":
+                self.items.clear()
+            else:
+                self.items.pop(it, None)
+
+    def coords(self, *a):
+        pass
+
+    def move(self, *a):
+        pass
+
+    def addtag_withtag(self, *a):
+        pass
+
+    def tag_lower(self, *a):
+        pass
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+
+class _StubApp:
+    """ShapeManager が使う属性だけを持つ PDFAnnotator の代役（状態は DocumentModel）"""
+    def __init__(self, shapes_by_page, canvas):
+        from document_model import DocumentModel
+        self.model = DocumentModel()
+        self.model.shapes_by_page = self.shapes_by_page = shapes_by_page
+        self.page_slope_default = self.model.page_slope_default
+        self.page_index = 0
+        self.scale = 1.0
+        self.offset_x = 0
+        self.offset_y = 0
+        self.current_color = "#000000"
+        self.selected_shape = None
+        self.selection = []
+        self.canvas = canvas
+
+    def canvas_to_pdf(self, cx, cy):
+        return (cx - self.offset_x) / self.scale, (cy - self.offset_y) / self.scale
+
+    def pdf_to_canvas(self, px, py):
+        return px * self.scale + self.offset_x, py * self.scale + self.offset_y
+
+    def display_page(self, highlight_shape=None):
+        pass
+
+
+def _make_canvas(use_tk):
+    """--tk なら本物の Canvas（Xvfb などのディスプレイが必要）、なければ代役"""
+    if use_tk:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+        return tk.Canvas(root, width=1100, height=1000)
+    return _StubCanvas()
+
+
+def _median_time(fn, repeat):
+    """fn を repeat 回実行した所要時間の中央値（秒）。1回空回ししてから測り、計測中は GC を止める"""
+    import gc
+    fn()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        finally:
+            gc.enable()
+    return statistics.median(times)
+
+
+def run_suite(sizes=SUITE_SIZES, repeat=3, clicks=50, use_tk=False, data_dir=None, log=print):
+    """すべての計測を行い {名前: ミリ秒} を返す（乱数は固定なので毎回同じデータ）"""
+    import tempfile
+    import quantity
+    import project_io
+    import bulk_ops
+    from shape_manager import ShapeManager
+    from render_service import _pixmap_data
+    from pdf_manager import export_document
+
+    results = {}
+
+    def record(name, sec):
+        results[name] = round(sec * 1000, 3)
+        log(f"  {name:<34} {results[name]:12.3f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = data_dir or tmp
+        os.makedirs(work, exist_ok=True)
+        cad = os.path.join(work, "synthetic_cad.pdf")
+        scan = os.path.join(work, "synthetic_scan.pdf")
+        if not os.path.exists(cad):
+            make_cad_pdf(cad)
+        if not os.path.exists(scan):
+            make_scan_pdf(scan)
+        dense = os.path.join(work, "synthetic_cad_dense.pdf")
+        if not os.path.exists(dense):
+            make_cad_pdf(dense, pages=1, lines=100000)
+
+        # ---- 描画 ----
+        log("render")
+        for name, path in (("cad", cad), ("scan", scan)):
+            with fitz.open(path) as doc:
+                for sc in (1.0, 2.0):
+                    def render():
+                        # 画像のデコード結果を毎回捨てる（ページ送り直後の描画に相当）
+                        fitz.TOOLS.store_shrink(100)
+                        _pixmap_data(doc.load_page(0), sc, None)
+                    record(f"render[{name}@{sc:g}x]", _median_time(render, repeat))
+
+        # ---- 再出力（並列出力になるページ数で、2回目が変更ページだけの追記保存になるか）----
+        log("export_repeat")
+        from pdf_manager import PDFManager
+        from parallel_export import PARALLEL_MIN_PAGES
+        big = os.path.join(work, "synthetic_cad_64p.pdf")
+        if not os.path.exists(big):
+            make_cad_pdf(big, pages=PARALLEL_MIN_PAGES, lines=300)
+        app = _StubApp(make_project_shapes(10000, pages=PARALLEL_MIN_PAGES), _StubCanvas())
+        app.model.doc = app.doc = fitz.open(big)
+        app.pdf_path = big
+        app.page_map = list(range(PARALLEL_MIN_PAGES))
+        pm = PDFManager(app)
+        out = os.path.join(tmp, "export_repeat.pdf")
+        t0 = time.perf_counter()
+        pm.export(out, incremental=True, workers=None)
+        record(f"export_repeat[{PARALLEL_MIN_PAGES}p] first", time.perf_counter() - t0)
+        with open(out, "rb") as f:
+            first = f.read()
+        bulk_ops.apply_transform(app.shapes_by_page[3][:1], bulk_ops.make_transform(dx=5))
+        t0 = time.perf_counter()
+        pm.export(out, incremental=True, workers=None)
+        record(f"export_repeat[{PARALLEL_MIN_PAGES}p] second", time.perf_counter() - t0)
+        with open(out, "rb") as f:
+            second = f.read()
+        app.doc.close()
+        # 追記保存なら前回の内容はそのまま残り、後ろに足される
+        if len(second) <= len(first) or not second.startswith(first):
+            raise RuntimeError("2回目の出力が追記保存になっていません")
+
+        # ---- 画像出力（図形付きの全ページを 150DPI の PNG に、ワーカープロセスの起動を含む）----
+        log("raster")
+        from raster_export import export_rasters
+        raster_shapes = make_project_shapes(1000)
+        record(f"raster_export[{SUITE_PAGES} pages@150dpi]", _median_time(
+            lambda: export_rasters(cad, raster_shapes, os.path.join(tmp, "raster"), "cad", dpi=150), repeat))
+
+        # ---- 吸着（10万本超の線分のページ）----
+        log("snap")
+        from snap_index import SnapIndex, extract_segments
+        with fitz.open(dense) as doc:
+            segs = extract_segments(doc.load_page(0))
+        record(f"snap_build[{len(segs) // 4} segs]", _median_time(lambda: SnapIndex(segs), repeat))
+        index = SnapIndex(segs)
+        rnd = random.Random(0)
+        queries = [(rnd.uniform(0, 1190), rnd.uniform(0, 842)) for _ in range(2000)]
+
+        def snap_all():
+            for x, y in queries:
+                index.query(x, y, 8)
+        record("snap_query per query", _median_time(snap_all, repeat) / len(queries))
+
+        # ---- 多角形（頂点 5000）の当たり判定・縮小表示の描画 ----
+        log("polygon")
+        import polygon_lod
+        poly = make_polygon(5000)
+        papp = _StubApp({0: [poly]}, _make_canvas(use_tk))
+        pmgr = ShapeManager(papp)
+        prnd = random.Random(1)
+        ppoints = [(prnd.uniform(0, 1000), prnd.uniform(0, 1000)) for _ in range(clicks)]
+
+        def poly_hit():
+            for x, y in ppoints:
+                papp.model.hit_test(0, x, y)
+        record("polygon_hit[5000] per click", _median_time(poly_hit, repeat) / clicks)
+
+        def poly_draw(scale):
+            def run():
+                papp.scale = scale
+                papp.canvas.delete("all")
+                pmgr.draw_shape(poly)
+            return run
+        for sc in (1.0, 0.25):
+            record(f"polygon_draw[5000@{sc:g}x]", _median_time(poly_draw(sc), repeat))
+
+        def lod_build():
+            polygon_lod.PolygonGeometry(poly["points"]).outline(1.0)
+        record("polygon_lod_build[5000]", _median_time(lod_build, repeat))
+
+        # ---- 一括コピー（5000 図形を 50 ページへ）と、その取り消し ----
+        log("bulk")
+        from document_model import DocumentModel
+        bulk_src = make_project_shapes(5000)
+        bmodel = DocumentModel()
+        bmodel.shapes_by_page = {0: [s for p in sorted(bulk_src) for s in bulk_src[p]]}
+        bmodel.rebuild_graph()
+        tf = bulk_ops.make_transform(dx=10, dy=10)
+
+        # GC は止めずに測る（一括操作は自分で GC を止めるので、その効果も含める）
+        rep_times, undo_times = [], []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            bulk_ops.replicate(bmodel, bmodel.shapes_by_page[0], 0, range(1, 51), tf)
+            t1 = time.perf_counter()
+            bmodel.undo()
+            rep_times.append(t1 - t0)
+            undo_times.append(time.perf_counter() - t1)
+        record("bulk_replicate[5000x50]", statistics.median(rep_times))
+        record("bulk_undo[5000x50]", statistics.median(undo_times))
+        # 座標変換だけ（一括コピー全体のうち変換が占める分の目安）
+        moved = bulk_ops.copy_shapes(bmodel.shapes_by_page[0] * 50)
+        record("bulk_transform[250000]",
+               _median_time(lambda: bulk_ops.apply_transform(moved, bulk_ops.make_transform(dx=1, dy=1)), repeat))
+
+        # ---- 文字検索 ----
+        log("text")
+        from text_index import build_index
+        record(f"text_index_build[{SUITE_PAGES} pages]", _median_time(lambda: build_index(cad), repeat))
+        tindex = build_index(cad)
+        words = [f"W{p}-{i}" for p in range(SUITE_PAGES) for i in range(0, 60, 7)] + ["w1", "910"]
+
+        def search_all():
+            for w in words:
+                tindex.search(w)
+        record("text_search per query", _median_time(search_all, repeat) / len(words))
+
+        # ---- 式評価 ----
+        log("eval")
+        # キャッシュに収まる数のすべて異なる式（cold はキャッシュを空にしてから、warm はキャッシュ済み）
+        n_expr = math_eval.EXPR_CACHE_SIZE // 2
+        exprs = [f"{EVAL_EXPRS[i % len(EVAL_EXPRS)]}+{i}" for i in range(n_expr)]
+
+        def eval_all():
+            for e in exprs:
+                math_eval.eval_expr(e)
+
+        def eval_cold():
+            math_eval.clear_cache()
+            eval_all()
+        record(f"eval[{n_expr} cold]", _median_time(eval_cold, repeat))
+        record(f"eval[{n_expr} warm]", _median_time(eval_all, repeat))
+
+        for n in sizes:
+            log(f"shapes={n}")
+            by_page = make_project_shapes(n)
+            rnd = random.Random(n)
+
+            # ---- ヒットテスト・描画（1ページ分に全図形を載せた最悪ケース）----
+            app = _StubApp({0: [s for p in sorted(by_page) for s in by_page[p]]}, _make_canvas(use_tk))
+            mgr = ShapeManager(app)
+            points = [(rnd.uniform(0, 1100), rnd.uniform(0, 1000)) for _ in range(clicks)]
+
+            def hit_all():
+                for x, y in points:
+                    mgr.find_shape(x, y)
+            record(f"hit_test[{n}] per click", _median_time(hit_all, repeat) / clicks)
+
+            def hit_all_model():
+                for x, y in points:
+                    app.model.hit_test(0, x, y)
+            record(f"hit_test_model[{n}] per click", _median_time(hit_all_model, repeat) / clicks)
+
+            def draw_all():
+                app.canvas.delete("all")
+                for s in app.shapes_by_page[0]:
+                    mgr.draw_shape(s)
+            record(f"draw[{n}]", _median_time(draw_all, repeat))
+
+            # 拡大（表示範囲外を描かない）・縮小（小さい図形・文字を簡略化）したときの再描画
+            def draw_view(scale):
+                def run():
+                    app.scale = scale
+                    app.canvas.delete("all")
+                    mgr.draw_page_shapes(app.shapes_by_page[0])
+                return run
+            for sc in (4.0, 0.25):
+                record(f"draw_visible[{n}@{sc:g}x]", _median_time(draw_view(sc), repeat))
+            app.scale = 1.0
+
+            # 範囲選択（ページの約 1/4 を矩形・64頂点の投げ縄で囲む）
+            ring = [(275 + 250 * math.cos(k * math.pi / 32), 250 + 230 * math.sin(k * math.pi / 32))
+                    for k in range(64)]
+            record(f"region_select[{n}] rect", _median_time(
+                lambda: mgr.shapes_in_region(25, 20, 525, 480), repeat))
+            record(f"region_select[{n}] lasso", _median_time(
+                lambda: mgr.shapes_in_region(25, 20, 525, 480, lasso=ring), repeat))
+
+            # ---- 集計 ----
+            record(f"stats[{n}]", _median_time(lambda: quantity.calc_total_stats(by_page, {}), repeat))
+            # 図形ごとの明細を CSV に逐次書き出す（書き出し先は捨てる）
+            from quantity_report import iter_shape_rows, write_rows
+            with open(os.devnull, "w", newline="") as devnull:
+                record(f"quantity_rows[{n}] csv", _median_time(
+                    lambda: write_rows(iter_shape_rows(by_page, {}), devnull), repeat))
+
+            # ---- プロジェクト保存・読込 ----
+            proj = os.path.join(tmp, f"project_{n}.json")
+            record(f"project_save[{n}]", _median_time(
+                lambda: project_io.save_project(proj, cad, by_page), repeat))
+            record(f"project_load[{n}]", _median_time(lambda: project_io.load_project(proj), repeat))
+
+            # ---- 出力（逐次）----
+            out = os.path.join(tmp, f"export_{n}.pdf")
+            record(f"export[{n}]", _median_time(
+                lambda: export_document(cad, by_page, out, workers=1), repeat))
+    return results
+
+
+def _environment():
+    import platform
+    return {
+        "python": sys.version.split()[0],
+        "pymupdf": fitz.VersionBind,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """基準値と比べて [(名前, 基準ms, 今回ms, 比率, 判定)] を返す"""
+    rows = []
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, None, now, None, "new"))
+            continue
+        ratio = now / base if base > 0 else float("inf")
+        if ratio > 1 + threshold and now - base >= REGRESSION_MIN_MS:
+            verdict = "REGRESSION"
+        elif ratio < 1 - threshold and base - now >= REGRESSION_MIN_MS:
+            verdict = "faster"
+        else:
+            verdict = "ok"
+        rows.append((name, base, now, ratio, verdict))
+    return rows
+
+
+def cmd_suite(args):
+    sizes = tuple(int(v) for v in args.sizes.split(",")) if args.sizes else SUITE_SIZES
+    results = run_suite(sizes, repeat=args.repeat, clicks=args.clicks, use_tk=args.tk, data_dir=args.data_dir)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+        print(f"baseline saved: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            base = json.load(f)
+        rows = compare_baseline(results, base["results"], args.threshold)
+        print(f"\ncompare with {args.baseline} (threshold {args.threshold:.0%})")
+        for name, b, now, ratio, verdict in rows:
+            b_txt = f"{b:12.3f}" if b is not None else f"{'-':>12}"
+            r_txt = f"{ratio:6.2f}x" if ratio is not None else f"{'-':>7}"
+            print(f"  {name:<34} {b_txt} -> {now:12.3f} ms {r_txt}  {verdict}")
+        regressions = [r for r in rows if r[4] == "REGRESSION"]
+        if regressions:
+            print(f"{len(regressions)} regression(s)")
+            return 1
+    return 0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="PDFAnnotator benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p_exp = sub.add_parser("export", help="1ページ大量図形の出力時間")
+    p_exp.add_argument("--shapes", type=int, default=10000)
+    p_exp.add_argument("--skip-legacy", action="store_true", help="旧実装との比較を省略（10k図形で数分かかる）")
+    p_start = sub.add_parser("startup", help="起動時間（import・最初のウィンドウまで）")
+    p_start.add_argument("--runs", type=int, default=5)
+    p_eval = sub.add_parser("eval", help="式評価のスループット")
+    p_eval.add_argument("--n", type=int, default=100000)
+    p_trunc = sub.add_parser("truncate", help="小数第3位切り捨て・集計のスループット")
+    p_trunc.add_argument("--n", type=int, default=200000)
+    p_render = sub.add_parser("render", help="ズーム連打時のイベントループ停止時間（同期描画 vs ワーカー描画）")
+    p_render.add_argument("--steps", type=int, default=8)
+    p_suite = sub.add_parser("suite", help="合成PDF・合成プロジェクトで全項目を計測し、基準値と比較")
+    p_suite.add_argument("--sizes", help=f"図形数（カンマ区切り、既定 {','.join(map(str, SUITE_SIZES))}）")
+    p_suite.add_argument("--repeat", type=int, default=3, help="各項目の繰り返し回数（中央値を採用）")
+    p_suite.add_argument("--clicks", type=int, default=50, help="ヒットテストのクリック数")
+    p_suite.add_argument("--tk", action="store_true", help="本物の Tk Canvas を使う（Xvfb などが必要）")
+    p_suite.add_argument("--data-dir", help="合成PDFの置き場所（指定すると再利用する）")
+    p_suite.add_argument("--save-baseline", metavar="JSON", help="結果を基準値として保存")
+    p_suite.add_argument("--baseline", metavar="JSON", help="基準値と比較し、回帰があれば終了コード 1")
+    p_suite.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="回帰とみなす遅くなった割合")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "export":
+        for name, (sec, size) in bench_export(args.shapes, legacy=not args.skip_legacy).items():
+            print(f"export[{name}] shapes={args.shapes}: {sec * 1000:.1f} ms, {size / 1024:.0f} KiB")
+    elif args.cmd == "startup":
+        res = bench_startup(args.runs)
+        for key, val in res.items():
+            if key == "heavy_loaded":
+                print(f"startup[{key}]: {', '.join(val) or '-'}")
+            else:
+                print(f"startup[{key}]: {val * 1000:.1f} ms")
+        if "first_window" not in res:
+            print("startup: ディスプレイが無いためウィンドウ表示時間は計測できません")
+    elif args.cmd == "eval":
+        for name, rate in bench_eval(args.n).items():
+            print(f"eval[{name}] n={args.n}: {rate:,.0f} evals/s")
+    elif args.cmd == "truncate":
+        for name, rate in bench_truncate(args.n).items():
+            print(f"truncate[{name}] n={args.n}: {rate:,.0f} values/s")
+    elif args.cmd == "suite":
+        return cmd_suite(args)
+    elif args.cmd == "render":
+        for name, (sec, worst, rendered) in bench_render(args.steps).items():
+            print(f"render[{name}] steps={args.steps}: total {sec * 1000:.0f} ms, "
+                  f"max stall {worst * 1000:.1f} ms, rendered {rendered}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+# bulk_ops.py
+# 図形の一括操作：移動・拡大縮小・反転と、複製・他ページへの一括コピー。GUI不要
+#   変換は軸に沿ったアフィン変換 (sx, sy, tx, ty)：x' = sx*x + tx, y' = sy*y + ty（反転は sx/sy が負）
+#   図形の種類ごとにまとめて座標を変換し、値・参照式の再計算は DocumentModel にまとめて任せる
+#   （1回の操作が取り消し1回分になる）
+#   座標変換は種類ごとの単純なループ。numpy は依存に入れておらず、全座標を1本の並びに
+#   詰め直しても CPython では速くならない（25万図形で約0.1秒。一括コピーの大半は図形の複製と登録）
+import uuid
+from perf_monitor import gc_paused
+
+IDENTITY = (1.0, 1.0, 0.0, 0.0)
+
+# 取り消し用に覚えておく項目（座標と、それに応じて変わる値）
+GEOMETRY_KEYS = ("x", "y", "w", "h", "x1", "y1", "x2", "y2", "points", "value", "text")
+
+
+def make_transform(dx=0.0, dy=0.0, scale=1.0, mirror_x=False, mirror_y=False, origin=(0.0, 0.0)):
+    """origin を中心に拡大・反転してから (dx, dy) ずらす変換"""
+    sx = -scale if mirror_x else scale
+    sy = -scale if mirror_y else scale
+    ox, oy = origin
+    return sx, sy, ox - sx * ox + dx, oy - sy * oy + dy
+
+
+def group_bounds(shapes):
+    """図形の外接矩形をまとめた矩形 (x1, y1, x2, y2)。なければ None"""
+    from document_model import shape_bounds
+    out = None
+    for s in shapes:
+        b = shape_bounds(s)
+        if b is None:
+            continue
+        if out is None:
+            out = list(b)
+        else:
+            out = [min(out[0], b[0]), min(out[1], b[1]), max(out[2], b[2]), max(out[3], b[3])]
+    return tuple(out) if out else None
+
+
+def group_center(shapes):
+    b = group_bounds(shapes)
+    if b is None:
+        return 0.0, 0.0
+    return (b[0] + b[2]) / 2, (b[1] + b[3]) / 2
+
+
+def new_ids(n):
+    """n 個の図形ID。uuid4 を1つ作り末尾12桁を連番にする（uuid4 を n 回呼ぶより速い）"""
+    u = str(uuid.uuid4())
+    head, base = u[:24], int(u[24:], 16)
+    return [f"{head}{(base + i) & 0xFFFFFFFFFFFF:012x}" for i in range(n)]
+
+
+def parse_pages(spec, page_count):
+    """"2-5, 8" のようなページ指定（1始まり）を表示ページ番号（0始まり）の並びにする。
+
+    範囲外・不正な指定は ValueError
+    """
+    pages = []
+    seen = set()
+    for part in spec.replace("、", ",").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            a, b = (p.strip() for p in part.split("-", 1))
+            first, last = int(a), int(b)
+        else:
+            first = last = int(part)
+        if first > last:
+            first, last = last, first
+        if first < 1 or last > page_count:
+            raise ValueError(f"ページ {part} は 1〜{page_count} の範囲外です")
+        for p in range(first - 1, last):
+            if p not in seen:
+                seen.add(p)
+                pages.append(p)
+    return pages
+
+
+# =====================================================
+# 座標の変換（種類ごとにまとめて）
+# =====================================================
+def _transform_rects(shapes, sx, sy, tx, ty):
+    """rect / ellipse / text。幅・高さが負になったら左上を付け替える"""
+    for s in shapes:
+        x = sx * s["x"] + tx
+        y = sy * s["y"] + ty
+        if "w" in s:
+            w = sx * s["w"]
+            h = sy * s["h"]
+            if w < 0:
+                x, w = x + w, -w
+            if h < 0:
+                y, h = y + h, -h
+            s["w"], s["h"] = w, h
+        s["x"], s["y"] = x, y
+
+
+def _transform_lines(shapes, sx, sy, tx, ty):
+    for s in shapes:
+        s["x1"] = sx * s["x1"] + tx
+        s["y1"] = sy * s["y1"] + ty
+        s["x2"] = sx * s["x2"] + tx
+        s["y2"] = sy * s["y2"] + ty
+
+
+def _transform_points(shapes, sx, sy, tx, ty):
+    """triangle / polygon。頂点リストは置き換える（polygon_lod の前計算を作り直させる）"""
+    for s in shapes:
+        s["points"] = [(sx * x + tx, sy * y + ty) for x, y in s["points"]]
+
+
+_TRANSFORMS = {
+    "rect": _transform_rects,
+    "ellipse": _transform_rects,
+    "text": _transform_rects,
+    "line": _transform_lines,
+    "triangle": _transform_points,
+    "polygon": _transform_points,
+}
+
+
+def apply_transform(shapes, tf):
+    """shapes の座標をその場で変換する。手入力の値（manual_value）は拡大率に合わせる"""
+    sx, sy, tx, ty = tf
+    by_type = {}
+    for s in shapes:
+        by_type.setdefault(s["type"], []).append(s)
+    for t, group in by_type.items():
+        fn = _TRANSFORMS.get(t)
+        if fn is not None:
+            fn(group, sx, sy, tx, ty)
+
+    if abs(sx) != 1.0 or abs(sy) != 1.0:
+        area, length = abs(sx * sy), abs(sx)
+        for s in shapes:
+            if s.get("manual_value") and s.get("value") is not None and s["type"] != "text":
+                s["value"] = s["value"] * (length if s["type"] == "line" else area)
+
+
+def copy_shapes(shapes, tf=IDENTITY, keep_names=True):
+    """変換したコピーを作る（新しいIDを振る。keep_names=False なら名前は付けない）。
+    頂点リストは変換しなければ元と共有する（編集では置き換えるので問題ない）"""
+    ids = new_ids(len(shapes))
+    out = []
+    for s, sid in zip(shapes, ids):
+        c = dict(s)
+        c["id"] = sid
+        if not keep_names:
+            c.pop("name", None)
+        out.append(c)
+    if tf != IDENTITY:
+        apply_transform(out, tf)
+    return out
+
+
+def snapshot(shapes, keys=GEOMETRY_KEYS):
+    """取り消し用に座標と値（keys の項目）を控える [(shape, {項目: 値}), ...]"""
+    out = []
+    for s in shapes:
+        snap = {k: s[k] for k in keys if k in s}
+        if "points" in snap:
+            snap["points"] = list(snap["points"])
+        out.append((s, snap))
+    return out
+
+
+# =====================================================
+# モデルへの一括操作（どれも取り消し1回分）
+# =====================================================
+def transform_in_place(model, page, shapes, tf, label="一括変換"):
+    """ページ上の図形を変換する"""
+    before = snapshot(shapes)
+    apply_transform(shapes, tf)
+    model.change_shapes([(page, s, snap) for s, snap in before], label)
+    return shapes
+
+
+def recolor(model, page, shapes, color, label="色変更"):
+    """図形の色（＝集計の分類）をまとめて変える"""
+    before = snapshot(shapes, ("color",))
+    for s in shapes:
+        s["color"] = color
+    model.change_shapes([(page, s, snap) for s, snap in before], label)
+    return shapes
+
+
+def replicate(model, shapes, src_page, pages, tf=IDENTITY, label="一括コピー"):
+    """shapes を変換したコピーを pages のそれぞれに追加する。追加した (page, shape) の一覧を返す。
+
+    名前はコピー先のページで使われていなければ引き継ぐ（階ごとに同じ名前で参照式が使える）。
+    元と同じページへのコピーは名前を付けない
+    """
+    pages = list(pages)
+    items = []
+    with gc_paused():
+        # 値はコピー先のどのページでも同じなので1回だけ計算する（式は追加先のページで計算し直す）
+        base = copy_shapes(shapes, tf)
+        model.compute_values([(src_page, c) for c in base])
+        for i, page in enumerate(pages):
+            # 最後のページには base そのものを使う（名前の付け外しが他のページに及ばないように）
+            copies = base if i == len(pages) - 1 else copy_shapes(base)
+            taken = {n for (p, n) in model.named_shapes if p == page}
+            for c in copies:
+                name = c.get("name")
+                if name and (page == src_page or name in taken):
+                    del c["name"]
+                elif name:
+                    taken.add(name)
+            items.extend((page, c) for c in copies)
+        return model.add_shapes(items, label, computed=True)
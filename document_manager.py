@@ -0,0 +1,141 @@
+# document_manager.py
+# PDFファイルをメモリマップで1回だけ開き、表示・出力・ワーカーで共有する
+import os
+import sys
+import mmap
+import time
+import threading
+
+
+def resident_memory():
+    """現在プロセスの常駐メモリ量（バイト）。取得できなければ None"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    if sys.platform.startswith("linux"):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [
+                ("cb", wintypes.DWORD),
+                ("PageFaultCount", wintypes.DWORD),
+                ("PeakWorkingSetSize", ctypes.c_size_t),
+                ("WorkingSetSize", ctypes.c_size_t),
+                ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                ("PagefileUsage", ctypes.c_size_t),
+                ("PeakPagefileUsage", ctypes.c_size_t),
+            ]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+
+class _Mapping:
+    """1ファイル分のメモリマップ"""
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # 空ファイル・マップ不可なファイルシステムなど
+            self.file.close()
+            raise
+        self.view = memoryview(self.mm)
+        self.size = len(self.mm)
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+        self.file.close()
+
+
+class DocumentManager:
+    """PDFをパスごとに1回だけメモリマップし、その上に Document を作る。
+
+    ファイル全体を読み込まず、必要なページのデータだけOSがページインする。
+    open() は同じマップ上に新しい Document を作るので、表示用とワーカー用
+    （スレッドごと）に別ハンドルを持っても読み込みは1回で済む。
+    """
+
+    def __init__(self):
+        self._maps = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def open(self, path):
+        """path の Document を返す（マップは初回のみ作成）"""
+        import fitz
+        key = self._key(path)
+        t0 = time.perf_counter()
+        with self._lock:
+            m = self._maps.get(key)
+            if m is None:
+                try:
+                    m = _Mapping(path)
+                except (ValueError, OSError):
+                    m = None
+                if m is not None:
+                    self._maps[key] = m
+
+        if m is None:
+            # メモリマップできなければ通常のファイルオープン
+            doc = fitz.open(path)
+            size = os.path.getsize(path)
+        else:
+            doc = fitz.open(stream=m.view, filetype="pdf")
+            size = m.size
+
+        self._stats[key] = {
+            "path": path,
+            "open_ms": (time.perf_counter() - t0) * 1000,
+            "size": size,
+            "mapped": m is not None,
+            "rss": resident_memory(),
+        }
+        return doc
+
+    def stats(self, path):
+        """直近の open() の計測値（open_ms / size / mapped / rss）"""
+        return self._stats.get(self._key(path))
+
+    def close(self, path):
+        """マップを解放する。この上の Document はすべて閉じておくこと"""
+        with self._lock:
+            m = self._maps.pop(self._key(path), None)
+        if m is not None:
+            m.close()
+
+    def close_all_except(self, *paths):
+        """paths 以外のマップを解放（別PDFに切り替えたとき用）"""
+        keep = {self._key(p) for p in paths if p}
+        for key in [k for k in self._maps if k not in keep]:
+            with self._lock:
+                m = self._maps.pop(key, None)
+            if m is not None:
+                m.close()
+
+
+# プロセス内で共有する既定のマネージャ
+documents = DocumentManager()
@@ -0,0 +1,860 @@
+# document_model.py
+# プロジェクトの状態と操作（図形の追加・移動・拡縮・削除・検索・集計・出力）。
+#   tkinter を import しないので、GUIなしの一括処理やベンチマークからそのまま使える。
+#   座標はすべて PDF 座標。キャンバス座標への変換は GUI 側（ShapeManager）で行う。
+import os
+import uuid
+import math
+import unicodedata
+from utils_geometry import point_in_triangle, dist_point_to_segment, polygon_area
+import polygon_lod
+from perf_monitor import gc_paused
+from math_eval import (
+    MathEvalError, DependencyGraph, compile_expr, eval_and_truncate_3,
+    to_milli, from_milli,
+)
+import quantity
+import project_io
+
+# 文字の大きさの見積もり（Canvas が無いときのテキストの当たり判定用、PDF座標）
+TEXT_SIZE = 14
+TEXT_CHAR_WIDTH = 0.6
+TEXT_LINE_HEIGHT = 1.2
+# 取り消しできる操作の数
+HISTORY_LIMIT = 100
+
+
+class _PageEnv:
+    """数式中の図形名・sum(分類) を1ページの範囲で解決する"""
+    def __init__(self, model, page):
+        self.model = model
+        self.page = page
+
+    def ref(self, name):
+        if (self.page, name) in self.model.name_clashes:
+            raise MathEvalError(f"同じ名前の図形が複数あります: {name}")
+        s = self.model.named_shapes.get((self.page, name))
+        if s is None:
+            raise MathEvalError(f"参照先の図形がありません: {name}")
+        if s.get("value") is None:
+            raise MathEvalError(f"参照先に値がありません: {name}")
+        return s["value"]
+
+    def category_sum(self, category):
+        if category not in quantity.CATEGORIES:
+            raise MathEvalError(f"未知の分類です: {category}")
+        # 集計と同じく 0.001 単位の整数で足す
+        total = 0
+        for s in self.model.shapes_by_page.get(self.page, []):
+            if quantity.ATTR.get(s.get("color")) == category and s.get("value") is not None:
+                total += to_milli(s["value"])
+        return from_milli(total)
+
+
+def text_width_em(line):
+    """1行の幅（文字の大きさ単位）。全角文字は1、それ以外は TEXT_CHAR_WIDTH"""
+    if line.isascii():
+        return len(line) * TEXT_CHAR_WIDTH
+    return sum(1.0 if unicodedata.east_asian_width(c) in "WF" else TEXT_CHAR_WIDTH for c in line)
+
+
+def estimate_text_bbox(s, size=TEXT_SIZE):
+    """テキスト図形の大きさを文字数から見積もる (x1, y1, x2, y2)"""
+    lines = str(s.get("text", "")).split("\n")
+    w = max(text_width_em(line) for line in lines) * size
+    h = len(lines) * size * TEXT_LINE_HEIGHT
+    return s["x"], s["y"], s["x"] + w, s["y"] + h
+
+
+def shape_bounds(s, text_size=TEXT_SIZE):
+    """図形の外接矩形 (x1, y1, x2, y2)（PDF座標、x1<=x2・y1<=y2）"""
+    t = s["type"]
+    if t in ("rect", "ellipse"):
+        x, y, w, h = s["x"], s["y"], s["w"], s["h"]
+        return min(x, x + w), min(y, y + h), max(x, x + w), max(y, y + h)
+    if t == "line":
+        x1, y1, x2, y2 = s["x1"], s["y1"], s["x2"], s["y2"]
+        return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+    if t == "triangle":
+        xs = [p[0] for p in s["points"]]
+        ys = [p[1] for p in s["points"]]
+        return min(xs), min(ys), max(xs), max(ys)
+    if t == "polygon":
+        return polygon_lod.geometry(s).bbox
+    if t == "text":
+        return estimate_text_bbox(s, text_size)
+    return None
+
+
+class DocumentModel:
+    """1つのPDFとその図形・屋根倍率・参照式の依存関係を持つ"""
+
+    def __init__(self):
+        self.project_path = None    # 読み込み・保存したプロジェクトJSON（未保存なら None）
+        self.pdf_path = None
+        self.doc = None
+        self.page_map = []          # 表示中ページ → 元PDFのページ番号（ページ削除の反映用）
+        self.shapes_by_page = {}
+        self.page_slope_default = {}
+        self.slope_presets = []
+        # 図形の追加・削除・ページ削除・読み込みのたびに増える（描画側の索引の作り直し判定用）
+        self.revision = 0
+        # 取り消し用の操作履歴（古い順）。ページ番号が変わる操作（読み込み・ページ削除）で消す
+        self.history = []
+
+        # ---- 参照付きテキスト数式の依存関係 ----
+        # ノード: 図形ID / ("name", page, 名前) / ("cat", page, 分類)
+        self.graph = DependencyGraph()
+        self.named_shapes = {}      # (page, name) -> shape
+        # 同じページで名前が重なった図形（読み込んだプロジェクトなど）。参照する式はエラーにする
+        self.name_clashes = {}      # (page, name) -> [shape, ...]（2つ以上）
+        self._registered = {}       # shape id -> (shape, page, 出力キー一覧)
+
+    # =====================================================
+    # PDF・プロジェクト
+    # =====================================================
+    def open_pdf(self, path, page_map=None, keep=()):
+        """PDFを開く（page_map があれば元PDFのそのページだけを残す）。失敗時は例外
+
+        keep: 他で開いたままのPDFのパス（そのメモリマップは解放しない）
+        """
+        from document_manager import documents
+        doc = documents.open(path)
+        if page_map is not None:
+            doc.select(page_map)
+
+        # 前のPDFを閉じてからそのメモリマップを解放する
+        if self.doc is not None:
+            self.doc.close()
+        documents.close_all_except(path, *keep)
+
+        self.doc = doc
+        self.pdf_path = path
+        self.page_map = list(page_map) if page_map is not None else list(range(len(doc)))
+        return doc
+
+    def close(self):
+        if self.doc is not None:
+            self.doc.close()
+            self.doc = None
+
+    def page_count(self):
+        if self.doc is not None:
+            return len(self.doc)
+        return len(self.page_map)
+
+    def load_project(self, path, open_pdf=True):
+        """プロジェクトJSONを読み込み、依存関係を作り直す。プロジェクトの dict を返す"""
+        data = project_io.load_project(path)
+        self.project_path = path
+        self.pdf_path = data["pdf_path"]
+        self.shapes_by_page = data["shapes_by_page"]
+        self.page_slope_default = data["page_slope_default"]
+        self.slope_presets = data["slope_presets"]
+        self.page_map = list(data["page_map"]) if data["page_map"] is not None else []
+        self.history.clear()
+        self.touch()
+        self.rebuild_graph()
+        if open_pdf and self.pdf_path:
+            self.open_pdf(self.pdf_path, data["page_map"])
+        return data
+
+    @classmethod
+    def from_project(cls, path, open_pdf=False):
+        model = cls()
+        model.load_project(path, open_pdf=open_pdf)
+        return model
+
+    def save_project(self, path):
+        self.project_path = path
+        project_io.save_project(
+            path, self.pdf_path, self.shapes_by_page,
+            self.page_slope_default, self.slope_presets, self.page_map,
+        )
+
+    def export(self, save_path, workers=1):
+        """図形付きPDFを出力（pdf_manager.export_document と同じ戻り値）"""
+        from pdf_manager import export_document
+        return export_document(
+            self.pdf_path, self.shapes_by_page, save_path, workers=workers,
+            doc=self.doc, page_map=self.page_map or None,
+        )
+
+    def export_quantities(self, path, fmt=None):
+        """図形ごとの数量明細とページ合計・合計を CSV / JSON / JSONL に逐次書き出し、行数を返す。
+        fmt を省略すると拡張子から決める（CSV は Excel で開ける BOM 付き UTF-8）"""
+        from quantity_report import SINKS, iter_shape_rows, open_report, write_rows
+        if fmt is None:
+            ext = os.path.splitext(path)[1].lower()
+            fmt = ext[1:] if ext in SINKS else "csv"
+        name = os.path.basename(self.project_path or self.pdf_path or "")
+        with open_report(path, fmt) as f:
+            return write_rows(iter_shape_rows(self.shapes_by_page, self.page_slope_default, name), f, fmt=fmt)
+
+    def export_images(self, out_dir, stem=None, dpi=300, fmt="png", workers=None, on_page=None):
+        """図形付きの各ページを画像（PNG / TIFF）に出力（raster_export.export_rasters と同じ戻り値）"""
+        from raster_export import export_rasters
+        if stem is None:
+            stem = os.path.splitext(os.path.basename(self.pdf_path))[0]
+        return export_rasters(
+            self.pdf_path, self.shapes_by_page, out_dir, stem, dpi=dpi, fmt=fmt,
+            page_map=self.page_map or None, workers=workers, on_page=on_page,
+        )
+
+    # =====================================================
+    # 図形の追加・移動・拡縮・削除
+    # =====================================================
+    def touch(self):
+        """図形の並び・大きさが変わったことを描画側に知らせる"""
+        self.revision += 1
+
+    def add_shape(self, page, s, label=None):
+        """図形をページに追加して値を計算する（label を付けると取り消せる）"""
+        s.setdefault("id", str(uuid.uuid4()))
+        s.setdefault("color", "black")
+        self.shapes_by_page.setdefault(page, []).append(s)
+        self.touch()
+        # ページに入れてから計算（sum(分類) に自分も含めるため）
+        self.update_shape_value(s, page)
+        if label:
+            self._push_history(label, added=[(page, s)])
+        return s
+
+    def remove_shape(self, s, page, label=None):
+        """図形をページから削除し、それを参照していた式を再計算"""
+        lst = self.shapes_by_page.get(page, [])
+        if s not in lst:
+            return False
+        index = lst.index(s)
+        del lst[index]
+        self.touch()
+        # 一括追加した名前・式のない図形は依存グラフにないので、分類のキーは色から求める
+        keys = self._unregister(s.get("id")) or self._output_keys(s, page)
+        self.graph.remove(s.get("id"))
+        self.recalc_dependents(keys)
+        if label:
+            self._push_history(label, removed=[(page, index, s)])
+        return True
+
+    # ---------- まとめて（一括コピー・範囲選択の操作。参照式の再計算は1回） ----------
+    def add_shapes(self, items, label=None, computed=False):
+        """(page, shape) の一覧をまとめて追加し、値と参照式を再計算する。
+        computed=True なら図形の値は計算済みとして使う（式だけ追加先のページで計算し直す）"""
+        items = list(items)
+        with gc_paused():
+            self._add_shapes(items, computed)
+        if label and items:
+            self._push_history(label, added=items)
+        return items
+
+    def _add_shapes(self, items, computed):
+        for page, s in items:
+            if "id" not in s:
+                s["id"] = str(uuid.uuid4())
+            s.setdefault("color", "black")
+            self.shapes_by_page.setdefault(page, []).append(s)
+        self.touch()
+        # 全部ページに入れてから計算（sum(分類) に新しい図形も含めるため）
+        self._recalc_shapes(items, compute=not computed)
+
+    def remove_shapes(self, items, label=None):
+        """(page, shape) の一覧をまとめて削除し、参照していた式を再計算。
+        削除した (page, 元の位置, shape) の一覧を返す"""
+        by_page = {}
+        for page, s in items:
+            by_page.setdefault(page, set()).add(id(s))
+        removed = []
+        keys = set()
+        with gc_paused():
+            for page, ids in by_page.items():
+                lst = self.shapes_by_page.get(page)
+                if not lst:
+                    continue
+                keep = []
+                for i, s in enumerate(lst):
+                    if id(s) in ids:
+                        removed.append((page, i, s))
+                    else:
+                        keep.append(s)
+                lst[:] = keep
+            registered = self._registered
+            in_graph = []
+            attr = quantity.ATTR
+            for page, _, s in removed:
+                entry = registered.pop(s.get("id"), None)
+                if entry is None:
+                    # 依存グラフにない図形（一括追加した名前・式のない図形）は色から分類のキーを求める
+                    cat = attr.get(s.get("color"))
+                    if cat:
+                        keys.add(("cat", page, cat))
+                    continue
+                in_graph.append(s["id"])
+                out = entry[2]
+                if out and out[0][0] == "name":
+                    # 名前の登録は _unregister で外す（分類の辺は下の remove_many でまとめて外す）
+                    registered[s["id"]] = entry
+                    self._unregister(s["id"])
+                keys.update(out)
+            self.graph.remove_many(in_graph)
+            self.touch()
+            self.recalc_dependents(list(keys))
+        if label and removed:
+            self._push_history(label, removed=removed)
+        return removed
+
+    def change_shapes(self, items, label=None):
+        """座標を書き換えた図形の値と参照式を再計算する。
+        items は (page, shape, 変更前の控え)（控えは bulk_ops.snapshot の形）"""
+        items = list(items)
+        self.touch()
+        # 色が変わった図形は、変更前の分類を参照していた式も再計算する
+        old = set()
+        for page, _, snap in items:
+            cat = quantity.ATTR.get(snap.get("color"))
+            if cat:
+                old.add(("cat", page, cat))
+        with gc_paused():
+            self._recalc_shapes([(page, s) for page, s, _ in items], extra=old)
+        if label and items:
+            self._push_history(label, changed=items)
+        return items
+
+    def compute_values(self, items):
+        """(page, shape) の値だけを計算する（依存グラフ・参照式はそのまま）"""
+        for page, s in items:
+            self._compute_value(s, page)
+
+    def _recalc_shapes(self, items, compute=True, extra=()):
+        """(page, shape) の値を計算して依存グラフに登録し、影響する式を1回で再計算。
+
+        名前も式もない図形は依存グラフに入れない（sum(分類) は式の評価時にページの図形から集めるので、
+        分類のキーを再計算の起点にするだけでよい）。extra は追加で起点にするキー
+        """
+        nodes = set(extra)
+        registered = self._registered
+        cat_keys = {}               # (page, 色) -> 分類の出力キー（なければ None）
+        for page, s in items:
+            if compute:
+                self._compute_value(s, page)
+            entry = registered.get(s["id"])
+            if entry is not None:
+                # 色・名前が変わったときのため、前の分類・名前を参照していた式も再計算
+                nodes.update(entry[2])
+            if entry is not None or s.get("name") or s.get("formula"):
+                self.register_shape(s, page)
+                nodes.update(registered[s["id"]][2])
+                if s.get("formula"):
+                    nodes.add(s["id"])
+                continue
+            pc = (page, s.get("color"))
+            if pc not in cat_keys:
+                cat = quantity.ATTR.get(pc[1])
+                cat_keys[pc] = ("cat", page, cat) if cat else None
+        nodes.update(k for k in cat_keys.values() if k)
+        # 下流があるのは名前・分類を持つ図形と、式そのもの
+        self.recalc_dependents(list(nodes), include_start=True)
+
+    # =====================================================
+    # 取り消し
+    # =====================================================
+    def _push_history(self, label, added=(), removed=(), changed=()):
+        self.history.append({"label": label, "added": list(added),
+                             "removed": list(removed), "changed": list(changed)})
+        del self.history[:-HISTORY_LIMIT]
+
+    def undo(self):
+        """直前の操作を取り消し、その名前を返す（履歴がなければ None）"""
+        if not self.history:
+            return None
+        entry = self.history.pop()
+        if entry["changed"]:
+            # 戻す前の値を「変更前」として渡す（色を戻したとき、戻す前の分類の式も再計算する）
+            current = []
+            for page, s, snap in entry["changed"]:
+                current.append((page, s, {k: s.get(k) for k in snap}))
+                s.update(snap)
+            self.change_shapes(current)
+        if entry["added"]:
+            self.remove_shapes(entry["added"])
+        if entry["removed"]:
+            with gc_paused():
+                self._restore_removed(entry["removed"])
+        return entry["label"]
+
+    def _restore_removed(self, removed):
+        """remove_shapes で消した図形を元の位置に戻す"""
+        by_page = {}
+        for page, index, s in removed:
+            by_page.setdefault(page, []).append((index, s))
+        for page, entries in by_page.items():
+            entries.sort(key=lambda e: e[0])
+            lst = self.shapes_by_page.setdefault(page, [])
+            rest = iter(lst)
+            out = []
+            for index, s in entries:
+                while len(out) < index:
+                    out.append(next(rest))
+                out.append(s)
+            out.extend(rest)
+            lst[:] = out
+        self.touch()
+        self._recalc_shapes([(page, s) for page, _, s in removed])
+
+    @staticmethod
+    def move_shape(s, dx, dy):
+        """図形を平行移動（面積・長さは変わらないので再計算しない）"""
+        t = s["type"]
+        if t in ("rect", "ellipse", "text"):
+            s["x"] += dx
+            s["y"] += dy
+        elif t == "line":
+            s["x1"] += dx; s["y1"] += dy
+            s["x2"] += dx; s["y2"] += dy
+        elif t in ("triangle", "polygon"):
+            s["points"] = [(x + dx, y + dy) for x, y in s["points"]]
+
+    def resize_shape(self, s, idx, px, py, page):
+        """ハンドル idx を (px, py) に動かして拡縮し、値を再計算"""
+        t = s["type"]
+        if t == "rect":
+            x, y, w, h = s["x"], s["y"], s["w"], s["h"]
+            if idx == 0:  # 左上
+                s["w"] = (x + w) - px
+                s["h"] = (y + h) - py
+                s["x"], s["y"] = px, py
+            elif idx == 1:  # 右上
+                s["w"] = px - x
+                s["h"] = (y + h) - py
+                s["y"] = py
+            elif idx == 2:  # 右下
+                s["w"] = px - x
+                s["h"] = py - y
+            elif idx == 3:  # 左下
+                s["x"] = px
+                s["w"] = (x + w) - px
+                s["h"] = py - y
+
+        elif t == "ellipse":
+            x, y, w, h = s["x"], s["y"], s["w"], s["h"]
+            if idx == 0:
+                s["y"] = py
+                s["h"] = (y + h) - py
+            elif idx == 1:
+                s["w"] = px - x
+            elif idx == 2:
+                s["h"] = py - y
+            elif idx == 3:
+                s["x"] = px
+                s["w"] = (x + w) - px
+
+        elif t == "line":
+            if idx == 0:
+                s["x1"], s["y1"] = px, py
+            elif idx == 1:
+                s["x2"], s["y2"] = px, py
+
+        elif t in ("triangle", "polygon"):
+            # 頂点リストは置き換える（polygon_lod の前計算を作り直させ、一括コピーの複製とも共有しない）
+            pts = list(s["points"])
+            pts[idx] = (px, py)
+            s["points"] = pts
+
+        self.update_shape_value(s, page)
+
+    def delete_page(self, index):
+        """ページを削除し、図形・屋根倍率のページ番号を詰め直す"""
+        if self.doc is not None:
+            self.doc.delete_page(index)
+        if self.page_map:
+            del self.page_map[index]
+
+        def shift(d):
+            return {(p - 1 if p > index else p): v for p, v in d.items() if p != index}
+
+        self.shapes_by_page = shift(self.shapes_by_page)
+        self.page_slope_default = shift(self.page_slope_default)
+        self.history.clear()
+        self.touch()
+        self.rebuild_graph()
+
+    # =====================================================
+    # 検索
+    # =====================================================
+    def shapes_on(self, page):
+        return self.shapes_by_page.get(page, [])
+
+    def find_by_id(self, sid):
+        """図形IDから (shape, page) を返す。なければ (None, None)"""
+        entry = self._registered.get(sid)
+        if entry is not None:
+            return entry[0], entry[1]
+        for page, lst in self.shapes_by_page.items():
+            for s in lst:
+                if s.get("id") == sid:
+                    return s, page
+        return None, None
+
+    def hit_test(self, page, px, py, tol=6.0, text_bbox=estimate_text_bbox):
+        """(px, py) にある一番上の図形と当たった場所 ("edge" / "inside") を返す。
+
+        tol は辺・線からの許容距離（PDF座標）。text_bbox(s) はテキストの矩形を返す関数。
+        """
+        for s in reversed(self.shapes_by_page.get(page, [])):
+            t = s["type"]
+
+            if t == "rect":
+                x1, y1 = s["x"], s["y"]
+                x2, y2 = s["x"] + s["w"], s["y"] + s["h"]
+                if dist_point_to_segment(px, py, x1, y1, x2, y1) < tol or \
+                   dist_point_to_segment(px, py, x2, y1, x2, y2) < tol or \
+                   dist_point_to_segment(px, py, x2, y2, x1, y2) < tol or \
+                   dist_point_to_segment(px, py, x1, y2, x1, y1) < tol:
+                    return s, "edge"
+                if x1 <= px <= x2 and y1 <= py <= y2:
+                    return s, "inside"
+
+            elif t == "ellipse":
+                x1, y1 = s["x"], s["y"]
+                x2, y2 = s["x"] + s["w"], s["y"] + s["h"]
+                cx0, cy0 = (x1 + x2) / 2, (y1 + y2) / 2
+                rx, ry = abs(x2 - x1) / 2, abs(y2 - y1) / 2
+                if rx == 0 or ry == 0:
+                    continue
+                d = ((px - cx0) ** 2) / (rx ** 2) + ((py - cy0) ** 2) / (ry ** 2)
+                if abs(d - 1.0) < 0.05:
+                    return s, "edge"
+                if d < 1.0:
+                    return s, "inside"
+
+            elif t == "line":
+                if dist_point_to_segment(px, py, s["x1"], s["y1"], s["x2"], s["y2"]) < tol:
+                    return s, "edge"
+
+            elif t == "triangle":
+                pts = s["points"]
+                if point_in_triangle((px, py), *pts):
+                    return s, "inside"
+                for i in range(3):
+                    x1, y1 = pts[i]
+                    x2, y2 = pts[(i + 1) % 3]
+                    if dist_point_to_segment(px, py, x1, y1, x2, y2) < tol:
+                        return s, "edge"
+
+            elif t == "polygon":
+                g = polygon_lod.geometry(s)
+                if g.near_edge(px, py, tol):
+                    return s, "edge"
+                if g.contains(px, py):
+                    return s, "inside"
+
+            elif t == "text":
+                x1, y1, x2, y2 = text_bbox(s)
+                if x1 <= px <= x2 and y1 <= py <= y2:
+                    return s, "inside"
+
+        return None, None
+
+    # =====================================================
+    # 集計
+    # =====================================================
+    def page_stats(self, page):
+        """ページ内の図形を集計し、(集計値, 式一覧) を返す"""
+        return quantity.calc_page_stats(self.shapes_on(page), self.page_slope_default.get(page))
+
+    def total_stats(self):
+        return quantity.calc_total_stats(self.shapes_by_page, self.page_slope_default)
+
+    def get_slope_factor(self, s, page):
+        """屋根の倍率を返す。shape 個別設定 > ページデフォルト > 1.0"""
+        return quantity.get_slope_factor(s, self.page_slope_default.get(page))
+
+    # =====================================================
+    # value（面積・長さ・計算結果）と参照式の再計算
+    # =====================================================
+    def update_shape_value(self, s, page):
+        """value を再計算し、その図形を参照している式も順に再計算する"""
+        if not s:
+            return
+        self._compute_value(s, page)
+        self.register_shape(s, page)
+        self.recalc_dependents([s["id"]])
+
+    def _output_keys(self, s, page):
+        """この図形の値を使うノード（名前・分類）"""
+        keys = []
+        name = s.get("name")
+        if name:
+            keys.append(("name", page, name))
+        cat = quantity.ATTR.get(s.get("color"))
+        if cat:
+            keys.append(("cat", page, cat))
+        return keys
+
+    def _input_keys(self, s, page):
+        """この図形の式が参照しているノード"""
+        formula = s.get("formula") if s.get("type") == "text" else None
+        if not formula:
+            return []
+        try:
+            c = compile_expr(formula)
+        except MathEvalError:
+            return []
+        return [("name", page, n) for n in c.names] + [("cat", page, k) for k in c.categories]
+
+    def register_shape(self, s, page):
+        """図形の名前・分類・参照先を依存グラフに反映"""
+        if "id" not in s:
+            s["id"] = str(uuid.uuid4())
+        sid = s["id"]
+        known = sid in self._registered
+        self._unregister(sid)
+
+        keys = self._output_keys(s, page)
+        for k in keys:
+            self.graph.add_input(k, sid)
+            if k[0] == "name":
+                self._claim_name((page, k[2]), s)
+        inputs = self._input_keys(s, page)
+        # 式でない新しい図形には入力の辺を作らない（読み込み・一括追加で図形数だけ空の集合を作らない）
+        if inputs or known:
+            self.graph.set_inputs(sid, inputs)
+        self._registered[sid] = (s, page, keys)
+
+    def _unregister(self, sid):
+        """図形の名前・分類の出力を依存グラフから外し、外したキーを返す"""
+        entry = self._registered.pop(sid, None)
+        if entry is None:
+            return []
+        s, _, keys = entry
+        for k in keys:
+            self.graph.discard_input(k, sid)
+            if k[0] == "name":
+                self._release_name((k[1], k[2]), s)
+        return keys
+
+    def _claim_name(self, key, s):
+        """(page, name) の持ち主に s を加える（別の図形が持っていれば重複として覚える）"""
+        owner = self.named_shapes.get(key)
+        if owner is None or owner is s:
+            self.named_shapes[key] = s
+            return
+        owners = self.name_clashes.setdefault(key, [owner])
+        if not any(o is s for o in owners):
+            owners.append(s)
+
+    def _release_name(self, key, s):
+        """(page, name) の持ち主から s を外す（重複が解ければ残った図形の名前に戻す）"""
+        owners = self.name_clashes.get(key)
+        if owners is None:
+            if self.named_shapes.get(key) is s:
+                del self.named_shapes[key]
+            return
+        owners = [o for o in owners if o is not s]
+        if len(owners) > 1:
+            self.name_clashes[key] = owners
+        else:
+            del self.name_clashes[key]
+        self.named_shapes[key] = owners[0]
+
+    def set_shape_name(self, s, name, page):
+        """図形の名前を設定（空なら解除）し、旧名・新名を参照する式を再計算。
+        同じページの別の図形が使っている名前なら ValueError"""
+        owner = self.named_shapes.get((page, name)) if name else None
+        if owner is not None and owner is not s:
+            raise ValueError(f"名前 {name} はこのページの別の図形で使われています")
+        old_keys = self._output_keys(s, page)
+        if name:
+            s["name"] = name
+        else:
+            s.pop("name", None)
+        self.register_shape(s, page)
+        self.recalc_dependents(old_keys + self._output_keys(s, page))
+
+    def rebuild_graph(self):
+        """全ページの依存グラフを作り直し、参照付きの式をすべて再計算（読み込み・ページ削除後）"""
+        self.graph.clear()
+        self.named_shapes.clear()
+        self.name_clashes.clear()
+        self._registered.clear()
+        for page, lst in self.shapes_by_page.items():
+            for s in lst:
+                self.register_shape(s, page)
+        self.recalc_dependents(list(self._registered), include_start=True)
+
+    def recalc_dependents(self, nodes, include_start=False):
+        """nodes の下流にある式だけをトポロジカル順に再計算（循環は値なし）"""
+        order, cyclic = self.graph.affected(nodes)
+        start = set() if include_start else set(nodes)
+        for n in order:
+            if n in start:
+                continue
+            entry = self._registered.get(n)
+            if entry and entry[0].get("formula"):
+                self._eval_formula(entry[0], entry[1])
+        for n in cyclic:
+            entry = self._registered.get(n)
+            if entry and entry[0].get("formula"):
+                s = entry[0]
+                s["value"] = None
+                s["text"] = f"{s['formula']}=循環参照"
+
+    def _has_refs(self, expr):
+        try:
+            return compile_expr(expr).has_refs
+        except MathEvalError:
+            return False
+
+    def _eval_formula(self, s, page):
+        """参照付きの式を評価（表示は「式=値」）"""
+        formula = s["formula"]
+        try:
+            val = eval_and_truncate_3(formula, _PageEnv(self, page))
+        except MathEvalError:
+            # 参照先の値しだいで 0 除算なども起こりうる
+            s["value"] = None
+            s["text"] = f"{formula}=?"
+            return
+        s["value"] = val
+        s["text"] = f"{formula}={val}"
+
+    def _compute_value(self, s, page):
+        if not s:
+            return
+
+        t = s.get("type")
+
+        # -------------------------------------------
+        # 図形タイプが text 以外で、
+        # ユーザー入力で value を固定している場合は上書きしない
+        # （手入力した寸法・面積を尊重する）
+        # -------------------------------------------
+        if t != "text" and s.get("manual_value"):
+            return
+
+        # ===========================
+        #  TEXT（数式評価もここで統一）
+        # ===========================
+        if t == "text":
+            raw = s.get("text", "")
+            if raw is None:
+                s["value"] = None
+                return
+
+            raw = raw.strip()
+            if raw == "":
+                s["value"] = None
+                return
+
+            # 図形名・sum(分類) を参照する式は formula として保持し、参照先の変更で再計算する
+            if s.get("formula"):
+                self._eval_formula(s, page)
+                return
+            # 参照式として扱うのは「=」で明示したものだけ（"A1*2=" / "=A1*2"）。
+            # "LDK" や "WC" のような名前に見えるメモはそのまま残す
+            marked = raw.startswith("=") or raw.endswith("=")
+            expr = raw.strip("=").strip()
+            if marked and expr and self._has_refs(expr):
+                s["formula"] = expr
+                self._eval_formula(s, page)
+                return
+
+            # "= のついた式は表示形式（例: '5+3=' → '5+3=8'）
+            if raw.endswith("="):
+                expr = raw[:-1]
+                try:
+                    val = eval_and_truncate_3(expr)
+                    # 表示を常に正しい計算式に更新
+                    s["text"] = f"{expr}={val}"
+                    s["value"] = val
+                except MathEvalError:
+                    # 表示はそのまま、value だけ None
+                    s["value"] = None
+                return
+
+            # "= なしの純粋な式"
+            try:
+                val = eval_and_truncate_3(raw)
+                # 表示を計算結果にそろえる
+                s["text"] = str(val)
+                s["value"] = val
+            except MathEvalError:
+                # 数式でない → 単なるメモ扱い
+                s["value"] = None
+
+            return
+
+        # ===========================
+        #  RECT（面積）
+        # ===========================
+        if t == "rect":
+            w = abs(s.get("w", 0))
+            h = abs(s.get("h", 0))
+            area = w * h
+            s["value"] = round(area, 5)
+            return
+
+        # ===========================
+        #  ELLIPSE（円/楕円の面積）
+        # ===========================
+        if t == "ellipse":
+            w = abs(s.get("w", 0))
+            h = abs(s.get("h", 0))
+            r1 = w / 2
+            r2 = h / 2
+            area = math.pi * r1 * r2
+            s["value"] = round(area, 5)
+            return
+
+        # ===========================
+        #  LINE（長さ）
+        # ===========================
+        if t == "line":
+            x1, y1 = s.get("x1"), s.get("y1")
+            x2, y2 = s.get("x2"), s.get("y2")
+
+            if None in (x1, y1, x2, y2):
+                s["value"] = None
+                return
+
+            dx = x2 - x1
+            dy = y2 - y1
+            length = math.sqrt(dx * dx + dy * dy)
+            s["value"] = round(length, 5)
+            return
+
+        # ===========================
+        #  TRIANGLE（三角形の3点）
+        # ===========================
+        if t == "triangle":
+            pts = s.get("points")
+            if not pts or len(pts) != 3:
+                s["value"] = None
+                return
+
+            try:
+                (x1, y1), (x2, y2), (x3, y3) = pts
+                area = abs(
+                    (x1 * (y2 - y3)
+                     + x2 * (y3 - y1)
+                     + x3 * (y1 - y2)) / 2.0
+                )
+                s["value"] = round(area, 5)
+            except Exception:
+                s["value"] = None
+            return
+
+        # ===========================
+        #  POLYGON（多角形、靴ひも公式）
+        # ===========================
+        if t == "polygon":
+            pts = s.get("points")
+            if not pts or len(pts) < 3:
+                s["value"] = None
+                return
+            s["value"] = round(polygon_area(pts), 5)
+            return
+
+        # ===========================
+        #  フォールバック（メモなど）
+        # ===========================
+        s["value"] = None
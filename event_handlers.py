@@ -1,7 +1,9 @@
 import uuid
+import math
 import tkinter as tk
-from tkinter import simpledialog
+from tkinter import simpledialog, messagebox
 from math_eval import MathEvalError, eval_and_truncate_3, eval_expr, truncate_3
+import bulk_ops
 
 # =====================================================
 # 数値入力フォーム（複数項目対応・Enter/Esc対応）
@@ -38,10 +40,69 @@ class NumericInputDialog(simpledialog.Dialog):
                 v = eval_expr(e.get())
                 v = truncate_3(v)
                 self.result[k] = v
-            except ValueError:
+            except (ValueError, MathEvalError):
                 self.result[k] = None
 
 
+class BulkEditDialog(simpledialog.Dialog):
+    """選択図形の一括操作（移動量・倍率・反転・コピー先ページ）"""
+    def __init__(self, parent, count):
+        self.count = count
+        self.result = None
+        super().__init__(parent, "一括操作")
+
+    def body(self, master):
+        tk.Label(master, text=f"選択中の図形: {self.count} 個", anchor="w").grid(
+            row=0, column=0, columnspan=2, padx=5, pady=4, sticky="w")
+        self.entries = {}
+        for i, (key, label, default) in enumerate([
+            ("dx", "移動 X", "0"),
+            ("dy", "移動 Y", "0"),
+            ("scale", "倍率", "1"),
+            ("pages", "コピー先ページ（例 2-10,12）", ""),
+        ], start=1):
+            tk.Label(master, text=label + ":", anchor="w").grid(row=i, column=0, padx=5, pady=4, sticky="w")
+            e = tk.Entry(master)
+            e.insert(0, default)
+            e.grid(row=i, column=1, padx=5, pady=4)
+            self.entries[key] = e
+        self.flags = {}
+        for i, (key, label) in enumerate([
+            ("mirror_x", "左右反転"),
+            ("mirror_y", "上下反転"),
+            ("copy", "元を残して複製（コピー先ページが空のとき）"),
+        ], start=5):
+            v = tk.BooleanVar(value=False)
+            tk.Checkbutton(master, text=label, variable=v).grid(row=i, column=0, columnspan=2, padx=5, sticky="w")
+            self.flags[key] = v
+
+        master.bind("<Return>", lambda event: self.ok())
+        master.bind("<Escape>", lambda event: self.cancel())
+        return self.entries["dx"]
+
+    def validate(self):
+        try:
+            vals = {k: eval_expr(self.entries[k].get() or "0") for k in ("dx", "dy", "scale")}
+        except (ValueError, MathEvalError):
+            vals = None
+        if vals is None or vals["scale"] <= 0:
+            messagebox.showerror("入力エラー", "移動量・倍率は数値で入力してください（倍率は正の数）。", parent=self)
+            return False
+        self._vals = vals
+        return True
+
+    def apply(self):
+        self.result = dict(self._vals)
+        self.result["pages"] = self.entries["pages"].get().strip()
+        self.result.update({k: v.get() for k, v in self.flags.items()})
+
+
+# 多角形の始点をこの距離（画面上のピクセル）以内でクリックしたら閉じる
+POLYGON_CLOSE_PX = 8
+# 投げ縄の頂点の間隔（画面上のピクセル）。これより小さい動きは頂点にしない
+LASSO_STEP_PX = 4
+
+
 # =====================================================
 # イベントハンドラ本体
 # =====================================================
@@ -57,6 +118,8 @@ class EventHandlers:
         self.drag_mode = None
         self.dragging_pdf = False
         self.drag_start = None
+        self.drag_before = None     # ドラッグ前の図形の控え（取り消し用）
+        self.region = None          # 範囲選択中の矩形・投げ縄
 
     # =====================================================
     # マウス押下（描画・移動など）
@@ -74,6 +137,8 @@ class EventHandlers:
             t = app.shape_type
             if not t:
                 return
+            # PDF の線の端点・交点・線上に吸着
+            cx, cy, _ = app.snap.snap(cx, cy)
     
             # ハンドルで頂点や端点をリサイズ
             if self.drag_mode == "resize" and isinstance(self.drag_target, tuple):
@@ -158,6 +223,17 @@ class EventHandlers:
                         app.canvas.delete(self.triangle_first_line_id)
                         self.triangle_first_line_id = None
 
+            # ---- Polygon（クリックで頂点を追加、始点クリック or ダブルクリックで確定）----
+            elif t == "polygon":
+                pts = app.shapes.polygon_points
+                if len(pts) >= 3:
+                    sx, sy = app.pdf_to_canvas(*pts[0])
+                    if math.hypot(cx - sx, cy - sy) <= POLYGON_CLOSE_PX:
+                        self._finish_polygon()
+                        return
+                pts.append(app.canvas_to_pdf(cx, cy))
+                app.shapes.show_polygon_preview(cx, cy)
+
             elif t == "text":
                 # PDF 座標
                 px, py = app.canvas_to_pdf(cx, cy)
@@ -210,9 +286,48 @@ class EventHandlers:
         # Moveモード：図形・PDF移動など
         # ========================================
         elif app.mode == "move":
+            # 選択中図形のハンドル（頂点・端点・四隅）をつかんだらリサイズ
+            if app.selected_shape and app.shapes.detect_handle(cx, cy):
+                self.dragging = True
+                self.drag_target = app.shapes.active_handle
+                self.drag_mode = "resize"
+                self.drag_before = bulk_ops.snapshot([app.selected_shape])
+                return
+
             shape, area = app.shapes.find_shape(cx, cy)
+            # 背景を Shift+ドラッグで矩形選択、Ctrl+ドラッグで投げ縄選択
+            if not shape and e.state & 0x0005:
+                self._begin_region(cx, cy, lasso=bool(e.state & 0x0004))
+                return
+
+            # 複数選択中の図形をつかんだらまとめて移動
+            if shape and not e.state & 0x0001 and len(app.selection) > 1 \
+                    and any(s is shape for s in app.selection):
+                self.dragging = True
+                self.drag_mode = "group"
+                self.last_cx, self.last_cy = cx, cy
+                app.shapes.begin_group_drag(app.selected_shapes())
+                app.display_page()
+                return
+
+            # Shift+クリックで複数選択に出し入れ
+            if shape and e.state & 0x0001:
+                if app.selected_shape is not None and app.selected_shape not in app.selection:
+                    app.selection.append(app.selected_shape)
+                app.selected_shape = None
+                app.shapes.clear_handles()
+                if any(s is shape for s in app.selection):
+                    app.selection = [s for s in app.selection if s is not shape]
+                else:
+                    app.selection.append(shape)
+                app.set_status(f"{len(app.selection)} 個の図形を選択")
+                app.display_page()
+                return
+
+            app.selection = []
             if shape:
                 app.selected_shape = shape
+                self.drag_before = bulk_ops.snapshot([shape])
                 self.dragging = True
                 self.drag_target = shape
                 self.drag_mode = "move" if area == "inside" else "resize"
@@ -224,6 +339,28 @@ class EventHandlers:
                 self.drag_start = (cx, cy)
                 app.display_page()
 
+    def _finish_polygon(self):
+        """作成中の多角形を確定（面積は頂点から自動計算）"""
+        app = self.app
+        tol = 0.5 / app.scale
+        pts = []
+        for x, y in app.shapes.polygon_points:
+            # ダブルクリックで同じ位置に入った頂点は1つに
+            if pts and abs(x - pts[-1][0]) < tol and abs(y - pts[-1][1]) < tol:
+                continue
+            pts.append((x, y))
+        app.shapes.polygon_points.clear()
+        app.shapes.clear_polygon_preview()
+        if len(pts) < 3:
+            return
+        s = {
+            "id": str(uuid.uuid4()),
+            "type": "polygon",
+            "points": pts,
+            "color": app.current_color,
+        }
+        app.shapes.append_shape(s)
+
     # =====================================================
     # 入力UI＋数式生成
     # =====================================================
@@ -278,6 +415,16 @@ class EventHandlers:
 
         # --- Moveモード ---
         if app.mode == "move":
+            if self.region is not None:
+                self._extend_region(cx, cy)
+                return
+
+            # グループ移動はキャンバス上でずらすだけ（図形の座標は離したときに1回で変える）
+            if self.dragging and self.drag_mode == "group":
+                app.shapes.move_group(cx - self.last_cx, cy - self.last_cy)
+                self.last_cx, self.last_cy = cx, cy
+                return
+
             # ハンドルで頂点や端点をリサイズ
             if self.drag_mode == "resize" and isinstance(self.drag_target, tuple):
                 shape, idx = self.drag_target
@@ -290,16 +437,7 @@ class EventHandlers:
                 dx = (cx - self.last_cx) / app.scale
                 dy = (cy - self.last_cy) / app.scale
                 self.last_cx, self.last_cy = cx, cy
-                t = s["type"]
-
-                if t in ("rect", "ellipse", "text"):
-                    s["x"] += dx
-                    s["y"] += dy
-                elif t == "line":
-                    s["x1"] += dx; s["y1"] += dy
-                    s["x2"] += dx; s["y2"] += dy
-                elif t == "triangle":
-                    s["points"] = [(x + dx, y + dy) for x, y in s["points"]]
+                app.model.move_shape(s, dx, dy)
 
                 app.display_page(highlight_shape=s)
 
@@ -314,6 +452,7 @@ class EventHandlers:
 
         # --- Drawモード（線プレビュー）---
         elif app.mode == "draw" and app.shape_type == "line" and self.temp_line_id:
+            cx, cy, _ = app.snap.snap(cx, cy)
             app.canvas.coords(self.temp_line_id, self.start_x, self.start_y, cx, cy)
 
     # =====================================================
@@ -341,17 +480,79 @@ class EventHandlers:
             app.shapes.append_shape(s)
             self._show_formula_input(s)
 
+        if self.region is not None:
+            self._finish_region()
+        elif self.dragging and self.drag_mode == "group":
+            dx, dy = app.shapes.end_group_drag()
+            if dx or dy:
+                bulk_ops.transform_in_place(app.model, app.page_index, app.selected_shapes(),
+                                            bulk_ops.make_transform(dx, dy), label="移動")
+            self.drag_mode = None
+            app.display_page()
+
+        # 図形を動かしたら取り消せるように履歴へ（索引の作り直しもここで1回）
+        if self.drag_before:
+            s, snap = self.drag_before[0]
+            if any(s.get(k) != v for k, v in snap.items()):
+                app.model.change_shapes([(app.page_index, s, snap)],
+                                        "移動" if self.drag_mode == "move" else "変形")
+            self.drag_before = None
+
         self.dragging = False
         self.drag_target = None
         self.dragging_pdf = False
         self.drag_start = None
 
+    # =====================================================
+    # 範囲選択（矩形・投げ縄）
+    # =====================================================
+    def _begin_region(self, cx, cy, lasso):
+        self.region = {"lasso": lasso, "points": [(cx, cy)], "end": (cx, cy), "item": None}
+        if not lasso:
+            self.region["item"] = self.app.canvas.create_rectangle(
+                cx, cy, cx, cy, outline="#0078d7", dash=(4, 3), tags="region")
+
+    def _extend_region(self, cx, cy):
+        r = self.region
+        cv = self.app.canvas
+        r["end"] = (cx, cy)
+        if not r["lasso"]:
+            x0, y0 = r["points"][0]
+            cv.coords(r["item"], x0, y0, cx, cy)
+            return
+        lx, ly = r["points"][-1]
+        if abs(cx - lx) + abs(cy - ly) < LASSO_STEP_PX:
+            return
+        # 投げ縄は新しい区間だけを描き足す（点が増えても1回の動きの手間は変わらない）
+        cv.create_line(lx, ly, cx, cy, fill="#0078d7", width=2, tags="region")
+        r["points"].append((cx, cy))
+
+    def _finish_region(self):
+        """囲んだ図形を複数選択にする（矩形は全体が収まる図形、投げ縄は中心が内側の図形）"""
+        app = self.app
+        r, self.region = self.region, None
+        app.canvas.delete("region")
+        pts = r["points"] if r["lasso"] else [r["points"][0], r["end"]]
+        pts = [app.canvas_to_pdf(x, y) for x, y in pts]
+        xs = [p[0] for p in pts]
+        ys = [p[1] for p in pts]
+        app.selection = app.shapes.shapes_in_region(
+            min(xs), min(ys), max(xs), max(ys), lasso=pts if r["lasso"] else None)
+        app.selected_shape = None
+        app.shapes.clear_handles()
+        app.set_status(f"{len(app.selection)} 個の図形を選択")
+        app.display_page()
+
     # =====================================================
     # マウス移動中（プレビュー）
     # =====================================================
     def on_motion(self, e):
         app = self.app
         cx, cy = e.x, e.y
+        if app.mode == "draw" and app.doc:
+            cx, cy, _ = app.snap.snap(cx, cy)
+        if app.mode == "draw" and app.shape_type == "polygon" and app.shapes.polygon_points:
+            app.shapes.show_polygon_preview(cx, cy)
         if app.mode == "draw" and app.shape_type == "rect" and self.pending_rect_start:
             x1, y1 = self.pending_rect_start
             if self.rect_preview_id:
@@ -377,15 +578,20 @@ class EventHandlers:
         from math_eval import eval_and_truncate_3, MathEvalError
 
         cx, cy = e.x, e.y
+        if self.app.mode == "draw" and self.app.shape_type == "polygon":
+            self._finish_polygon()
+            return
         s, _ = self.app.shapes.find_shape(cx, cy)
 
         if not s or s["type"] != "text":
             return  # テキスト以外 or ヒットなし
 
-        # --- 編集ダイアログ ---
-        new = simpledialog.askstring("編集", "新しいテキスト:", initialvalue=s["text"])
+        # --- 編集ダイアログ（参照付きの式は「式=」の形で編集）---
+        initial = f"{s['formula']}=" if s.get("formula") else s["text"]
+        new = simpledialog.askstring("編集", "新しいテキスト:", initialvalue=initial)
         if new is None:
             return  # キャンセル
+        s.pop("formula", None)
 
         raw = new.strip()
         value = None
@@ -413,6 +619,8 @@ class EventHandlers:
         # --- 保存 ---
         s["text"] = new_text
         s["value"] = value
+        # 文字数が変われば大きさも変わる（表示範囲の索引を作り直させる）
+        self.app.model.touch()
 
         # 念のため shape_manager の統一関数も呼んで良い
         self.app.shapes.update_shape_value(s)
@@ -1,8 +1,13 @@
 # main.py
 import tkinter as tk
-from app_core import PDFAnnotator
 
 if __name__ == "__main__":
     root = tk.Tk()
+    root.title("PDF Annotator")
+    root.geometry("1100x1000")
+    # アプリ本体の import・構築より先にウィンドウを表示する
+    root.update()
+
+    from app_core import PDFAnnotator
     app = PDFAnnotator(root)
     root.mainloop()
@@ -1,6 +1,8 @@
 # math_eval.py
 import ast
 import math
+import operator
+import functools
 from decimal import Decimal, ROUND_DOWN, InvalidOperation
 
 
@@ -8,6 +10,84 @@ class MathEvalError(Exception):
     """数式評価に失敗したときの独自例外"""
     pass
 
+
+class EvalBudgetError(MathEvalError):
+    """式が長すぎる・複雑すぎる・結果が大きすぎるときの例外（評価前に弾く）"""
+    pass
+
+
+# ==============================
+#  評価コストの上限
+#  貼り付けた式1つで UI が固まらないよう、解析・評価の前に確認する
+# ==============================
+MAX_EXPR_LENGTH = 1000    # 式の文字数
+MAX_NODES = 500           # AST のノード数
+MAX_DEPTH = 50            # 括弧・演算のネストの深さ
+MAX_EXPONENT = 100        # 累乗の指数の絶対値
+MAX_RESULT = 1e15         # 累乗の結果と最終結果の絶対値
+                          # （四則演算の途中結果は確認しない。溢れた inf / nan は最終結果で弾く）
+_MAX_RESULT_LOG10 = math.log10(MAX_RESULT)
+
+# ==============================
+#  固定小数点（0.001 単位の整数 = ミリ単位）
+#  4.2325 -> 4232
+# ==============================
+MILLI = 1000
+
+
+def to_milli(x: float) -> int:
+    """
+    小数第3位で切り捨てた値を 0.001 単位の整数で返す（Decimal を使わない高速版）。
+    表示どおりの10進表現（repr）を切り捨てるので Decimal(str(x)) と同じ結果になる。
+    例: 4.2325 -> 4232, 4.35 -> 4350, -1.2345 -> -1234（0 方向に切り捨て）
+    inf / nan は ValueError。
+    """
+    # 速い経路：x*1000 が整数から十分離れていれば、そのまま切り捨てて repr と一致する
+    # （repr の10進値と x の差・乗算の丸め誤差は合わせて数 ulp 以内）
+    try:
+        t = x * 1000.0
+        i = int(t)
+    except (OverflowError, ValueError, TypeError):
+        t = None
+    if t is not None:
+        f = t - i if t >= 0 else i - t
+        eps = 4 * math.ulp(t)
+        if eps < f < 1.0 - eps:
+            return i
+
+    r = repr(float(x))
+    if "e" in r or "n" in r:
+        # 指数表記（極端に大きい・小さい値）と inf/nan は Decimal に任せる
+        try:
+            d = Decimal(r).quantize(Decimal("0.001"), rounding=ROUND_DOWN)
+        except InvalidOperation as e:
+            raise ValueError(f"有限の数値ではありません: {x}") from e
+        return int(d * MILLI)
+
+    neg = r[0] == "-"
+    ip, _, fp = (r[1:] if neg else r).partition(".")
+    m = int(ip) * MILLI + int((fp + "000")[:3])
+    return -m if neg else m
+
+
+def from_milli(m: int) -> float:
+    """0.001 単位の整数を float に戻す（4232 -> 4.232）"""
+    return m / MILLI
+
+
+def mul_milli(a: int, b: int) -> int:
+    """ミリ単位どうしの積（小数第3位で 0 方向に切り捨て）"""
+    p = a * b
+    return p // MILLI if p >= 0 else -((-p) // MILLI)
+
+
+def format_milli(m: int) -> str:
+    """ミリ単位の整数を小数第3位までの文字列に（丸め誤差なし）"""
+    sign = "-" if m < 0 else ""
+    q, r = divmod(abs(m), MILLI)
+    return f"{sign}{q}.{r:03d}"
+
+
 # ==============================
 #  小数第3位で「切り捨て」関数
 #  4.2325 -> 4.232
@@ -18,11 +98,9 @@ def truncate_3(x: float) -> float:
     例: 4.2325 -> 4.232
     """
     try:
-        d = Decimal(str(x))
-        # 0.001 単位で ROUND_DOWN（絶対値方向ではなく常に小さくする）
-        d = d.quantize(Decimal("0.001"), rounding=ROUND_DOWN)
-        return float(d)
-    except (InvalidOperation, ValueError):
+        # 0.001 単位で切り捨て（0 方向）
+        return from_milli(to_milli(x))
+    except (ValueError, TypeError, OverflowError):
         # 何かおかしければそのまま返す
         return x
 
@@ -129,43 +207,388 @@ class SafeEvaluator(ast.NodeVisitor):
         return float(node.n)
 
 
-def eval_expr(expr: str) -> float:
+# ==============================
+#  コンパイル済み数式（クロージャ）
+# ==============================
+def _bounded_pow(a, b):
+    """指数と結果の大きさを計算前に確認してから累乗する"""
+    if abs(b) > MAX_EXPONENT:
+        raise EvalBudgetError(f"累乗の指数が大きすぎます（上限 {MAX_EXPONENT}）")
+    if abs(a) > 1 and b > 0 and b * math.log10(abs(a)) > _MAX_RESULT_LOG10:
+        raise EvalBudgetError("累乗の結果が大きすぎます")
+    if a < 0 and b != int(b):
+        raise MathEvalError("負の数の非整数乗は計算できません")
+    return a ** b
+
+
+_BINOP_FUNCS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Pow: _bounded_pow,
+}
+
+
+class CompiledExpr:
     """
-    数式文字列を安全に評価して float を返す。
-    - 使用例:
-        eval_expr("1+2*3")          -> 7.0
-        eval_expr("sqrt(3*3+4*4)")  -> 5.0
-        eval_expr("2^3")            -> 8.0  （内部で 2**3 に変換）
-    - 失敗した場合は MathEvalError を投げる。
+    コンパイル済みの数式。env を渡して呼ぶと float を返す。
+    - names:      参照している図形名（例: A1）
+    - categories: sum(...) で集計している分類（例: window）
+    env は ref(name) と category_sum(category) を持つオブジェクト。
+    参照を含まない式は env なしで評価できる。
+    """
+    __slots__ = ("fn", "names", "categories")
+
+    def __init__(self, fn, names, categories):
+        self.fn = fn
+        self.names = frozenset(names)
+        self.categories = frozenset(categories)
+
+    def __call__(self, env=None):
+        try:
+            value = self.fn(env)
+        except ZeroDivisionError as e:
+            raise MathEvalError("0 で割ることはできません") from e
+        except OverflowError as e:
+            raise EvalBudgetError("計算結果が大きすぎます") from e
+        except ValueError as e:
+            # sqrt(-1) など
+            raise MathEvalError("計算できない値です") from e
+        # nan もここで弾く
+        if not -MAX_RESULT <= value <= MAX_RESULT:
+            raise EvalBudgetError("計算結果が大きすぎます")
+        return value
+
+    @property
+    def has_refs(self) -> bool:
+        return bool(self.names or self.categories)
+
+
+def _ref_value(env, name):
+    if env is None:
+        raise MathEvalError("変数は利用できません")
+    return float(env.ref(name))
+
+
+def _category_sum(env, category):
+    if env is None:
+        raise MathEvalError("変数は利用できません")
+    return float(env.category_sum(category))
+
+
+class SafeCompiler(SafeEvaluator):
     """
+    SafeEvaluator と同じ規則で検証しつつ、AST を env を受け取るクロージャに変換する。
+    一度コンパイルすれば、評価時には構文解析も AST の走査も行わない。
+    SafeEvaluator と違い、図形名の参照（A1）と分類の合計（sum(window)）を許可する。
+    """
+
+    def __init__(self):
+        self.names = set()
+        self.categories = set()
+
+    def compile(self, tree) -> CompiledExpr:
+        fn = self.visit(tree)
+        return CompiledExpr(fn, self.names, self.categories)
+
+    def visit_BinOp(self, node: ast.BinOp):
+        if not isinstance(node.op, self.ALLOWED_BINOPS):
+            raise MathEvalError("許可されていない演算子です")
+        op = _BINOP_FUNCS.get(type(node.op))
+        if op is None:
+            raise MathEvalError("未対応の演算子です")
+        # 定数の指数は評価を待たずにここで弾く
+        if isinstance(node.op, ast.Pow) and isinstance(node.right, ast.Constant) \
+                and isinstance(node.right.value, (int, float)) and abs(node.right.value) > MAX_EXPONENT:
+            raise EvalBudgetError(f"累乗の指数が大きすぎます（上限 {MAX_EXPONENT}）")
+
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        return lambda env: op(left(env), right(env))
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        if not isinstance(node.op, self.ALLOWED_UNARYOPS):
+            raise MathEvalError("未対応の単項演算子です")
+
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.USub):
+            return lambda env: -operand(env)
+        return operand
+
+    def visit_Call(self, node: ast.Call):
+        if not isinstance(node.func, ast.Name):
+            raise MathEvalError("未対応の関数呼び出しです")
+
+        func_name = node.func.id
+
+        # sum(分類名) … 同じページのその分類の値の合計
+        if func_name == "sum":
+            if len(node.args) != 1 or not isinstance(node.args[0], ast.Name) or node.keywords:
+                raise MathEvalError("sum() には分類名を1つ指定してください")
+            category = node.args[0].id
+            self.categories.add(category)
+            return lambda env: _category_sum(env, category)
+
+        if func_name not in self.ALLOWED_FUNCS:
+            raise MathEvalError(f"使用できない関数です: {func_name}")
+
+        func = self.ALLOWED_FUNCS[func_name]
+
+        if len(node.args) != 1:
+            raise MathEvalError("関数は1引数のみ対応です")
+
+        arg = self.visit(node.args[0])
+        return lambda env: func(arg(env))
+
+    def visit_Name(self, node: ast.Name):
+        # 図形名の参照（値は評価時に env から取る）
+        name = node.id
+        self.names.add(name)
+        return lambda env: _ref_value(env, name)
+
+    def visit_Constant(self, node: ast.Constant):
+        value = super().visit_Constant(node)
+        return lambda env: value
+
+    def visit_Num(self, node: ast.Num):  # type: ignore[override]
+        value = float(node.n)
+        return lambda env: value
+
+
+def _normalize(expr: str) -> str:
+    """前後の空白除去と ^ → ** の変換（キャッシュのキーにもなる）"""
     if expr is None:
         raise MathEvalError("空の式です")
 
-    # 前後の空白を除去
     src = expr.strip()
-
     if not src:
         raise MathEvalError("空の式です")
 
-    # ^ を ** に変換（累乗用）
-    src = src.replace("^", "**")
-
+    return src.replace("^", "**")
+
+
+# 同じ式は何度も評価される（リサイズのたびの再計算・読み込み時の一括再計算など）
+EXPR_CACHE_SIZE = 4096
+
+
+def _check_source_budget(src: str):
+    """構文解析の前に、文字数と括弧のネストを確認"""
+    if len(src) > MAX_EXPR_LENGTH:
+        raise EvalBudgetError(f"式が長すぎます（上限 {MAX_EXPR_LENGTH} 文字）")
+    depth = 0
+    for ch in src:
+        if ch == "(":
+            depth += 1
+            if depth > MAX_DEPTH:
+                raise EvalBudgetError(f"括弧のネストが深すぎます（上限 {MAX_DEPTH}）")
+        elif ch == ")":
+            depth -= 1
+
+
+def _check_tree_budget(tree):
+    """コンパイルの前に、AST のノード数と深さを確認（再帰しない）"""
+    count = 0
+    stack = [(tree, 1)]
+    while stack:
+        node, depth = stack.pop()
+        count += 1
+        if count > MAX_NODES:
+            raise EvalBudgetError(f"式が複雑すぎます（上限 {MAX_NODES} 要素）")
+        if depth > MAX_DEPTH:
+            raise EvalBudgetError(f"式のネストが深すぎます（上限 {MAX_DEPTH}）")
+        for child in ast.iter_child_nodes(node):
+            stack.append((child, depth + 1))
+
+
+@functools.lru_cache(maxsize=EXPR_CACHE_SIZE)
+def _compile_normalized(src: str):
+    # 失敗も例外オブジェクトとして覚えておく（再描画のたびに解析し直さない）
     try:
-        tree = ast.parse(src, mode="eval")
-    except SyntaxError as e:
-        raise MathEvalError("式の構文が正しくありません") from e
+        try:
+            tree = ast.parse(src, mode="eval")
+        except SyntaxError as e:
+            raise MathEvalError("式の構文が正しくありません") from e
+        except (RecursionError, MemoryError) as e:
+            raise EvalBudgetError("式が複雑すぎます") from e
+        _check_tree_budget(tree)
+        return SafeCompiler().compile(tree)
+    except MathEvalError as e:
+        return e
+
+
+def compile_expr(expr: str) -> CompiledExpr:
+    """
+    数式文字列を検証して CompiledExpr にコンパイルする（LRU キャッシュ付き）。
+    不正な式は MathEvalError、長すぎる・複雑すぎる式は EvalBudgetError。
+    """
+    src = _normalize(expr)
+    # 長すぎる・入れ子が深すぎる式はキャッシュに入れない（巨大な文字列をキャッシュが抱え込まないように）
+    _check_source_budget(src)
+    res = _compile_normalized(src)
+    if isinstance(res, MathEvalError):
+        raise type(res)(*res.args)
+    return res
+
+
+def clear_cache():
+    """コンパイル済み数式のキャッシュを消す"""
+    _compile_normalized.cache_clear()
 
-    evaluator = SafeEvaluator()
-    value = evaluator.visit(tree)
-    return float(value)
 
+def cache_info():
+    """キャッシュのヒット数などを返す（functools の CacheInfo）"""
+    return _compile_normalized.cache_info()
 
-def eval_and_truncate_3(expr: str) -> float:
+
+def eval_expr(expr: str, env=None) -> float:
+    """
+    数式文字列を安全に評価して float を返す。
+    - 使用例:
+        eval_expr("1+2*3")          -> 7.0
+        eval_expr("sqrt(3*3+4*4)")  -> 5.0
+        eval_expr("2^3")            -> 8.0  （内部で 2**3 に変換）
+    - 図形名・sum(分類) を含む式は env（参照の解決先）が必要。
+    - 失敗した場合は MathEvalError を投げる。
+    - 構文解析・検証済みの式はキャッシュされ、2回目以降は評価だけを行う。
+    """
+    return float(compile_expr(expr)(env))
+
+
+def eval_and_truncate_3(expr: str, env=None) -> float:
     """
     式を評価し、小数第3位で切り捨てた値を返すユーティリティ。
     例:
         "4.2325" -> 4.232
         "154.2+8" -> 162.2
     """
-    val = eval_expr(expr)
+    val = eval_expr(expr, env)
     return truncate_3(val)
+
+
+def eval_to_milli(expr: str, env=None) -> int:
+    """式を評価し、小数第3位で切り捨てた値を 0.001 単位の整数で返す"""
+    try:
+        return to_milli(eval_expr(expr, env))
+    except ValueError as e:
+        raise MathEvalError("計算結果が有限の数値ではありません") from e
+
+
+# ==============================
+#  依存グラフ（参照している式だけを再計算する）
+# ==============================
+class CircularReferenceError(MathEvalError):
+    """式の参照が循環しているときの例外"""
+    def __init__(self, nodes):
+        self.nodes = set(nodes)
+        super().__init__("循環参照があります")
+
+
+class DependencyGraph:
+    """
+    ノード間の依存関係（upstream → downstream）を持つ有向グラフ。
+    ノードは任意の hashable（図形ID・("name", page, 名前) など）。
+    変更のあったノードから辿れる下流ノードだけをトポロジカル順に返す。
+    """
+
+    def __init__(self):
+        self._inputs = {}    # node -> 上流ノードの集合
+        self._outputs = {}   # node -> 下流ノードの集合
+
+    def clear(self):
+        self._inputs.clear()
+        self._outputs.clear()
+
+    def set_inputs(self, node, inputs):
+        """node の上流ノードを丸ごと置き換える"""
+        for u in self._inputs.get(node, ()):
+            self._outputs[u].discard(node)
+        inputs = set(inputs)
+        self._inputs[node] = inputs
+        for u in inputs:
+            self._outputs.setdefault(u, set()).add(node)
+
+    def add_input(self, node, upstream):
+        self._inputs.setdefault(node, set()).add(upstream)
+        self._outputs.setdefault(upstream, set()).add(node)
+
+    def add_inputs(self, node, upstreams):
+        """node に上流ノードをまとめて追加（一括追加した図形 → 分類 など）"""
+        inputs = self._inputs.setdefault(node, set())
+        inputs.update(upstreams)
+        outputs = self._outputs
+        for u in upstreams:
+            out = outputs.get(u)
+            if out is None:
+                outputs[u] = {node}
+            else:
+                out.add(node)
+
+    def discard_input(self, node, upstream):
+        self._inputs.get(node, set()).discard(upstream)
+        self._outputs.get(upstream, set()).discard(node)
+
+    def remove(self, node):
+        """node と、その入出力の辺をすべて削除"""
+        for u in self._inputs.pop(node, ()):
+            self._outputs[u].discard(node)
+        for d in self._outputs.pop(node, ()):
+            self._inputs[d].discard(node)
+
+    def remove_many(self, nodes):
+        """remove をまとめて行う（一括削除。残るノードの入力集合は1回ずつ作り直す）"""
+        nodes = set(nodes)
+        inputs, outputs = self._inputs, self._outputs
+        downstream = set()
+        for n in nodes:
+            ins = inputs.pop(n, None)
+            if ins:
+                for u in ins:
+                    if u not in nodes:
+                        outputs[u].discard(n)
+            outs = outputs.pop(n, None)
+            if outs:
+                downstream.update(outs)
+        for d in downstream - nodes:
+            inputs[d] = inputs[d] - nodes
+
+    def affected(self, nodes):
+        """
+        nodes と、そこから辿れるすべての下流ノードをトポロジカル順に返す。
+        戻り値は (順序リスト, 循環に含まれる（または循環の下流の）ノード集合)。
+        """
+        # 1) 到達可能なノードを集める
+        reach = set()
+        stack = list(nodes)
+        while stack:
+            n = stack.pop()
+            if n in reach:
+                continue
+            reach.add(n)
+            stack.extend(self._outputs.get(n, ()))
+
+        # 2) 到達範囲内だけで Kahn 法
+        indeg = {n: 0 for n in reach}
+        for n in reach:
+            for d in self._outputs.get(n, ()):
+                indeg[d] += 1
+
+        ready = [n for n in reach if indeg[n] == 0]
+        order = []
+        while ready:
+            n = ready.pop()
+            order.append(n)
+            for d in self._outputs.get(n, ()):
+                indeg[d] -= 1
+                if indeg[d] == 0:
+                    ready.append(d)
+
+        cyclic = reach.difference(order)
+        return order, cyclic
+
+    def check_acyclic(self, nodes):
+        """nodes から下流に循環があれば CircularReferenceError"""
+        order, cyclic = self.affected(nodes)
+        if cyclic:
+            raise CircularReferenceError(cyclic)
+        return order
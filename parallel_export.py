@@ -0,0 +1,113 @@
+# parallel_export.py
+# ページ範囲ごとにワーカープロセスで図形を書き込み、insert_pdf で結合する
+import os
+import math
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+from pdf_manager import stamp_page
+from document_manager import documents
+
+# これ未満のページ数なら並列化しない（プロセス起動の方が高くつく）
+PARALLEL_MIN_PAGES = 64
+
+
+def default_workers(page_count):
+    """ページ数から既定のワーカー数を決める"""
+    if page_count < PARALLEL_MIN_PAGES:
+        return 1
+    return max(1, min(os.cpu_count() or 1, 8))
+
+
+def split_ranges(page_count, workers):
+    """[0, page_count) を (start, stop) の連続範囲に分割"""
+    if page_count <= 0:
+        return []
+    # ワーカー数の2倍に分けてページごとの重さの偏りをならす
+    n_chunks = min(page_count, max(1, workers * 2))
+    size = math.ceil(page_count / n_chunks)
+    return [(a, min(a + size, page_count)) for a in range(0, page_count, size)]
+
+
+def _stamp_range(pdf_path, start, stop, shapes_by_page, source_pages):
+    """ワーカー側：元PDFを開き、範囲内のページだけ残して図形を書き込む。
+
+    戻り値は (PDFのバイト列, 各ページの元の /Contents が書き込み後の /Contents の何番目か)。
+    xref 番号は結合で変わるので、並びの位置で返す（インクリメンタル保存用）
+    """
+    doc = documents.open(pdf_path)
+    doc.select(source_pages)
+    positions = []
+    for i in range(stop - start):
+        page = doc[i]
+        base = page.get_contents()
+        stamp_page(page, shapes_by_page.get(start + i, []))
+        after = page.get_contents()
+        positions.append([after.index(x) for x in base])
+    data = doc.tobytes(garbage=1)
+    doc.close()
+    return data, positions
+
+
+def export_parallel(pdf_path, shapes_by_page, save_path, workers=None, page_map=None, doc=None):
+    """元PDF pdf_path に図形を書き込んだPDFを並列に作って save_path に保存。
+
+    page_map は出力ページ → 元PDFのページ番号の一覧（ページ削除後の状態）。
+    None なら元PDFの全ページ。
+    doc を渡すと文書情報・目次はその文書（ページ削除後）から取る。渡さなければ
+    document_manager のメモリマップから開く（どちらも元PDFを読み直さない）。
+    戻り値は各ページの書き込み前の /Contents xref 一覧（export_document と同じ、保存後の番号）。
+    """
+    own = doc is None
+    src = documents.open(pdf_path) if own else doc
+    try:
+        return _export_parallel(src, own, pdf_path, shapes_by_page, save_path, workers, page_map)
+    finally:
+        if own:
+            src.close()
+
+
+def _export_parallel(src, own, pdf_path, shapes_by_page, save_path, workers, page_map):
+    if page_map is None:
+        page_map = list(range(len(src)))
+    page_count = len(page_map)
+    if workers is None:
+        workers = default_workers(page_count)
+    ranges = split_ranges(page_count, workers)
+
+    out = fitz.open()
+    positions = []
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [
+            pool.submit(
+                _stamp_range, pdf_path, a, b,
+                {p: shapes_by_page[p] for p in range(a, b) if p in shapes_by_page},
+                page_map[a:b],
+            )
+            for a, b in ranges
+        ]
+        # 結合はページ順を保つため投入順に行う
+        for fut in futures:
+            data, pos = fut.result()
+            part = fitz.open("pdf", data)
+            out.insert_pdf(part)
+            part.close()
+            positions.extend(pos)
+
+    # 文書レベルの情報は元PDFから引き継ぐ（目次は残したページ分だけ）
+    out.set_metadata(src.metadata)
+    if own and page_map != list(range(len(src))):
+        src.select(page_map)
+    toc = src.get_toc(simple=False)
+    if toc:
+        out.set_toc(toc)
+
+    out.save(save_path, garbage=1)
+    out.close()
+
+    # 保存で xref 番号が変わることがあるので、保存したファイルから読み直す
+    base_contents = {}
+    with fitz.open(save_path) as done:
+        for i, pos in enumerate(positions):
+            contents = done[i].get_contents()
+            base_contents[i] = [contents[j] for j in pos]
+    return base_contents
@@ -1,31 +1,252 @@
 # pdf_manager.py
-import fitz
-from PIL import Image, ImageTk
+import os
+import json
+import hashlib
+from document_manager import documents
+from perf_monitor import monitor
+
+# fitz / PIL は重いので使う関数の中で import する（起動を速くするため）
+
+# 図形タイプ → 出力時の線色
+EXPORT_COLORS = {
+    "rect": (1, 0, 0),
+    "ellipse": (0, 0, 1),
+    "line": (0, 1, 0),
+    "triangle": (1, 0.5, 0),
+    "polygon": (0.6, 0, 0.6),
+}
+EXPORT_WIDTH = 1
+TEXT_COLOR = (0, 0, 0)
+TEXT_SIZE = 12
+
+
+def stamp_page(page, shapes):
+    """1ページ分の図形をまとめてPDFページに書き込む。
+
+    線色・線幅ごとにパスをまとめて finish し、最後に1回だけ commit する
+    （図形ごとに /Contents を追加しないので、図形数が多くても速い）。
+    """
+    groups = {}
+    texts = []
+    for s in shapes:
+        t = s["type"]
+        if t == "text":
+            texts.append(s)
+        elif t in EXPORT_COLORS:
+            groups.setdefault((EXPORT_COLORS[t], EXPORT_WIDTH), []).append(s)
+
+    if not groups and not texts:
+        return
+
+    import fitz
+    sh = page.new_shape()
+    for (color, width), items in groups.items():
+        for s in items:
+            t = s["type"]
+            if t == "rect":
+                sh.draw_rect(fitz.Rect(s["x"], s["y"], s["x"] + s["w"], s["y"] + s["h"]))
+            elif t == "ellipse":
+                sh.draw_oval(fitz.Rect(s["x"], s["y"], s["x"] + s["w"], s["y"] + s["h"]))
+            elif t == "line":
+                sh.draw_line((s["x1"], s["y1"]), (s["x2"], s["y2"]))
+            elif t in ("triangle", "polygon"):
+                pts = [fitz.Point(x, y) for x, y in s["points"]]
+                # グループ内で閉じるため始点を末尾に追加
+                sh.draw_polyline(pts + pts[:1])
+        sh.finish(color=color, width=width)
+
+    for s in texts:
+        sh.insert_text((s["x"], s["y"]), s["text"], fontsize=TEXT_SIZE, color=TEXT_COLOR)
+
+    sh.commit()
+
+
+def export_document(pdf_path, shapes_by_page, save_path, workers=1, doc=None, page_map=None):
+    """元PDFに図形を書き込んで save_path に保存する（GUI不要）。
+
+    doc を渡すと元ファイルを読み直さず、開いている文書（ページ削除後）から出力する。
+    page_map は出力ページ → 元PDFのページ番号（並列出力・doc なしのときに使用）。
+    戻り値は各ページの書き込み前の /Contents xref 一覧（インクリメンタル保存用）。
+    """
+    import fitz
+    if workers is None or workers > 1:
+        from parallel_export import default_workers, export_parallel
+        if workers is None:
+            if doc is not None:
+                workers = default_workers(len(doc))
+            elif page_map is not None:
+                workers = default_workers(len(page_map))
+            else:
+                with documents.open(pdf_path) as src:
+                    workers = default_workers(len(src))
+        if workers > 1:
+            return export_parallel(pdf_path, shapes_by_page, save_path, workers=workers,
+                                   page_map=page_map, doc=doc)
+
+    if doc is not None:
+        out = fitz.open()
+        out.insert_pdf(doc)
+        out.set_metadata(doc.metadata)
+        toc = doc.get_toc(simple=False)
+        if toc:
+            out.set_toc(toc)
+    else:
+        out = documents.open(pdf_path)
+        if page_map is not None:
+            out.select(page_map)
+
+    base_contents = {}
+    try:
+        for i in range(len(out)):
+            p = out[i]
+            base_contents[i] = p.get_contents()
+            stamp_page(p, shapes_by_page.get(i, []))
+        out.save(save_path)
+    finally:
+        # 保存に失敗しても閉じる（呼び出し側がメモリマップを解放できるように）
+        out.close()
+    return base_contents
+
 
 class PDFManager:
     def __init__(self, app):
         self.app = app
+        # 前回出力の記録（インクリメンタル保存用）
+        self._last_export = None
+        # 非同期描画（render_service）と直近の描画結果
+        self._render = None
+        # 実行中の画像出力（raster_export）
+        self._raster_job = None
+        self._raster_poll = None
+        self._reset_render()
 
     # ---------- PDFを開く ----------
-    def open_pdf(self, path):
+    def open_pdf(self, path, page_map=None):
+        """PDFを開く。page_map があれば元PDFのそのページだけを残す"""
+        from render_service import raster_cache
         try:
-            self.app.doc = fitz.open(path)
+            # 他のタブが使っている文書のメモリマップは残す
+            self.app.model.open_pdf(path, page_map, keep=self.app.workspace.paths(exclude=self.app.model))
         except Exception as e:
             from tkinter import messagebox
             messagebox.showerror("Error", str(e))
             return False
-        self.app.pdf_path = path
+
         self.app.page_index = 0
         self.app.scale = 1.0
         self.app.offset_x = 0
         self.app.offset_y = 0
+        self._last_export = None
+        self._reset_render()
+        # 開き直したファイルは中身が変わっているかもしれない
+        raster_cache.drop(path)
+        # 文字検索の索引を裏で作る（保存済みがあれば読む）
+        self.app.search.start_index()
         self.app.display_page()
         return True
 
+    def open_stats_text(self):
+        """直近に開いたPDFのオープン時間・メモリ使用量の表示用文字列"""
+        st = documents.stats(self.app.pdf_path) if self.app.pdf_path else None
+        if not st:
+            return ""
+        txt = f"({st['size'] / 2**20:.1f} MB, open {st['open_ms']:.0f} ms"
+        if st["rss"] is not None:
+            txt += f", RSS {st['rss'] / 2**20:.0f} MB"
+        return txt + ")"
+
     # ---------- ページを描画 ----------
+    def page_image(self):
+        """表示中ページの画像 (PhotoImage, canvas x, canvas y) を返す。
+
+        手元の画像が表示範囲を覆っていなければワーカーに描画を依頼する。
+        同じページ・倍率の古い画像があればそれを返し、なければ None
+        （届いたら show_page_image で差し替わる）。
+        """
+        app = self.app
+        if not app.doc:
+            return None
+        from render_service import RenderService, render_clip, raster_cache
+        if self._render is None:
+            self._render = RenderService(app, self._on_render_ready)
+
+        # 描画済みの画像はタブ共通のキャッシュにある（タブを戻したときはそのまま使える）
+        src = app.page_map[app.page_index]
+        view = self._view_rect()
+        res = raster_cache.get(app.pdf_path, src, app.scale)
+        if res is None or not res.covers(app.pdf_path, src, app.scale, view):
+            clip = render_clip(self.page_rect(app.page_index), app.scale, view)
+            self._render.request(app.pdf_path, app.page_index, src, app.scale, clip)
+        if res is None:
+            return None
+        return self._placed(res)
+
+    def _placed(self, res):
+        app = self.app
+        if self._photo_result is not res:
+            from PIL import ImageTk
+            self._photo = ImageTk.PhotoImage(res.image)
+            self._photo_result = res
+        x0, y0 = (res.request.clip or (0, 0, 0, 0))[:2]
+        return self._photo, app.offset_x + x0 * app.scale, app.offset_y + y0 * app.scale
+
+    def _on_render_ready(self, res):
+        """ワーカーの描画結果を受け取る（Tk スレッド）"""
+        from render_service import raster_cache
+        app = self.app
+        req = res.request
+        # ワーカーでの描画時間を記録（捨てた依頼の分は含まない）
+        monitor.record("render_page", res.elapsed_ms)
+        # 表示中でなくても（タブやページを切り替えた後でも）キャッシュには入れておく
+        raster_cache.put(res)
+        if not app.doc or req.path != app.pdf_path or req.scale != app.scale \
+                or app.page_map[app.page_index] != req.source_page:
+            return
+        app.show_page_image(*self._placed(res))
+
+    def page_rect(self, index):
+        """ページの大きさ (x0, y0, x1, y1)（PDF座標）"""
+        # ページ削除で番号がずれないよう元PDFのページ番号で覚える（タブ共通なのでパスも）
+        key = (self.app.pdf_path, self.app.page_map[index])
+        r = self._page_rects.get(key)
+        if r is None:
+            r = tuple(self.app.doc.load_page(index).rect)
+            self._page_rects[key] = r
+        return r
+
+    def _view_rect(self):
+        """キャンバスに見えている範囲（PDF座標）"""
+        app = self.app
+        w = app.canvas.winfo_width() or 1
+        h = app.canvas.winfo_height() or 1
+        x0, y0 = app.canvas_to_pdf(0, 0)
+        x1, y1 = app.canvas_to_pdf(w, h)
+        return x0, y0, x1, y1
+
+    def _reset_render(self):
+        self._photo = None
+        self._photo_result = None
+        self._page_rects = {}
+
+    def warm_up(self):
+        """描画ワーカーを先に起動しておく"""
+        from render_service import RenderService
+        if self._render is None:
+            self._render = RenderService(self.app, self._on_render_ready)
+        self._render.warm_up()
+
+    def shutdown(self):
+        if self._render is not None:
+            self._render.shutdown()
+        self.cancel_images()
+
+    @monitor.timed("render_page")
     def render_page(self):
+        """表示中ページを同期的に描画して PIL.Image を返す"""
         if not self.app.doc:
             return None
+        import fitz
+        from PIL import Image
         page = self.app.doc.load_page(self.app.page_index)
         mat = fitz.Matrix(self.app.scale, self.app.scale)
         pix = page.get_pixmap(matrix=mat)
@@ -42,24 +263,152 @@ class PDFManager:
             self.app.page_index -= 1
             self.app.display_page()
 
+    # ---------- ページ削除 ----------
+    def delete_page(self, index):
+        """ページを削除し、図形・屋根倍率のページ番号を詰め直す"""
+        self.app.model.delete_page(index)
+        self.app.search.forget_hits()
+
     # ---------- PDF出力 ----------
-    def export(self, save_path):
+    @monitor.timed("export")
+    def export(self, save_path, incremental=False, workers=1):
+        """図形付きPDFを出力する。
+
+        incremental=True のとき、前回と同じ出力先なら変更ページだけを
+        追記保存する（条件を満たさなければ通常の全体出力）。
+        workers>1（None ならページ数から自動）のとき全体出力を複数プロセスで行う。
+        """
         if not self.app.doc:
             return
-        out = fitz.open(self.app.pdf_path)
-        for i in range(len(out)):
+        # 元PDFはメモリマップで開いているので上書きさせない
+        if os.path.normcase(os.path.abspath(save_path)) == os.path.normcase(os.path.abspath(self.app.pdf_path)):
+            raise ValueError("元のPDFには上書きできません。別のファイル名を指定してください。")
+        sigs = {i: self._page_signature(i) for i in range(len(self.app.doc))}
+
+        if incremental and self._can_export_incremental(save_path, sigs):
+            self._export_incremental(save_path, sigs)
+            return
+
+        if workers is None:
+            from parallel_export import default_workers
+            workers = default_workers(len(self.app.doc))
+        base_contents = export_document(
+            self.app.pdf_path, self.app.shapes_by_page, save_path,
+            workers=workers, doc=self.app.doc, page_map=self.app.page_map,
+        )
+        self._remember_export(save_path, sigs, base_contents)
+
+    # ---------- 画像出力 ----------
+    def export_images(self, save_path, dpi):
+        """図形付きの各ページを画像に出力する（裏で実行し、進み具合をステータスバーに出す）。
+
+        save_path の拡張子（.png / .tif / .tiff）で形式を、名前で出力ファイル名
+        （<名前>_p0001.png …）を決める。実行中の出力があれば ValueError
+        """
+        from raster_export import RasterExport
+        app = self.app
+        if not app.doc:
+            return None
+        if self._raster_job is not None:
+            raise ValueError("画像を出力中です。終わってから出力してください。")
+        stem, ext = os.path.splitext(os.path.basename(save_path))
+        # 出力中に図形を編集しても途中から内容が変わらないよう、その時点の図形を写しておく
+        # （頂点リストは編集で置き換えるので共有してよい）
+        shapes = {p: [dict(s) for s in items] for p, items in app.shapes_by_page.items() if items}
+        job = RasterExport(
+            app.pdf_path, shapes, os.path.dirname(os.path.abspath(save_path)), stem,
+            dpi=dpi, fmt=ext or "png", page_map=app.page_map,
+        )
+        job.start()
+        self._raster_job = job
+        app.set_status(job.progress_text())
+        self._schedule_raster_poll()
+        return job
+
+    def _schedule_raster_poll(self):
+        from raster_export import POLL_MS
+        self._raster_poll = self.app.root.after(POLL_MS, self._poll_images)
+
+    def _poll_images(self):
+        self._raster_poll = None
+        job = self._raster_job
+        if job is None:
+            return
+        if job.poll():
+            self.app.set_status(job.progress_text())
+        if not job.done:
+            self._schedule_raster_poll()
+            return
+        self._raster_job = None
+        if job.errors:
+            from tkinter import messagebox
+            page, msg = job.errors[0]
+            messagebox.showerror("画像出力", f"{len(job.errors)} ページの出力に失敗しました（p.{page + 1}: {msg}）")
+        self.app.set_status(f"{job.progress_text()} → {job.out_dir}")
+
+    def cancel_images(self):
+        """実行中の画像出力を取りやめる（処理中のページは書き終わる）"""
+        if self._raster_poll is not None:
+            self.app.root.after_cancel(self._raster_poll)
+            self._raster_poll = None
+        if self._raster_job is not None:
+            self._raster_job.cancel()
+            self._raster_job.shutdown()
+            self._raster_job = None
+
+    # ---------- インクリメンタル出力 ----------
+    def _page_signature(self, page_index):
+        """ページ上の図形内容のハッシュ（前回出力との差分判定用）"""
+        shapes = self.app.shapes_by_page.get(page_index, [])
+        raw = json.dumps(shapes, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _can_export_incremental(self, save_path, sigs):
+        """前回出力へ追記できる状態か判定"""
+        last = self._last_export
+        if not last or not os.path.exists(save_path):
+            return False
+        if os.path.abspath(save_path) != last["path"]:
+            return False
+        if last["source"] != self.app.pdf_path or last["page_map"] != self.app.page_map:
+            return False
+        # 出力ファイルが外部で書き換えられていたら追記しない
+        st = os.stat(save_path)
+        return (st.st_mtime_ns, st.st_size) == last["stat"]
+
+    def _export_incremental(self, save_path, sigs):
+        """変更ページだけ図形を描き直して追記保存"""
+        import fitz
+        last = self._last_export
+        changed = [i for i, sig in sigs.items() if last["sigs"].get(i) != sig]
+        if not changed:
+            return
+
+        out = fitz.open(save_path)
+        if not out.can_save_incrementally():
+            out.close()
+            self._last_export = None
+            self.export(save_path)
+            return
+
+        for i in changed:
             p = out[i]
-            for s in self.app.shapes_by_page.get(i, []):
-                t = s["type"]
-                if t == "rect":
-                    p.draw_rect(fitz.Rect(s["x"],s["y"],s["x"]+s["w"],s["y"]+s["h"]),color=(1,0,0))
-                elif t == "ellipse":
-                    p.draw_ellipse(fitz.Rect(s["x"],s["y"],s["x"]+s["w"],s["y"]+s["h"]),color=(0,0,1))
-                elif t == "line":
-                    p.draw_line((s["x1"],s["y1"]),(s["x2"],s["y2"]),color=(0,1,0))
-                elif t == "triangle":
-                    pts=[fitz.Point(x,y) for x,y in s["points"]]
-                    p.draw_polygon(pts,color=(1,0.5,0))
-                elif t == "text":
-                    p.insert_text((s["x"],s["y"]),s["text"],fontsize=12,color=(0,0,0))
-        out.save(save_path)
+            # 元PDFの描画内容だけに戻してから図形を描き直す
+            refs = " ".join(f"{x} 0 R" for x in last["base_contents"][i])
+            out.xref_set_key(p.xref, "Contents", f"[{refs}]")
+            p = out.reload_page(p)
+            stamp_page(p, self.app.shapes_by_page.get(i, []))
+        out.save(save_path, incremental=True, encryption=fitz.PDF_ENCRYPT_KEEP)
+        out.close()
+        self._remember_export(save_path, sigs, last["base_contents"])
+
+    def _remember_export(self, save_path, sigs, base_contents):
+        st = os.stat(save_path)
+        self._last_export = {
+            "path": os.path.abspath(save_path),
+            "source": self.app.pdf_path,
+            "page_map": list(self.app.page_map),
+            "stat": (st.st_mtime_ns, st.st_size),
+            "sigs": sigs,
+            "base_contents": base_contents,
+        }
@@ -0,0 +1,157 @@
+# pdfannotator.py
+# GUIなしのコマンドライン入口（tkinter を import しない）
+#   python -m pdfannotator export project.json out.pdf
+#   python -m pdfannotator export a.json b.json c.json --out-dir out/ --jobs 4
+#   python -m pdfannotator report archive/ -o totals.csv
+#   python -m pdfannotator report project.json --shapes -o quantities.csv
+#   python -m pdfannotator images project.json --out-dir img/ --dpi 300 --format tiff
+import os
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from document_model import DocumentModel
+from quantity_report import SINKS, find_projects, iter_projects_shape_rows, open_report, write_report, write_rows
+
+
+# =====================================================
+# export
+# =====================================================
+def export_project(project_path, out_path):
+    """1プロジェクトを図形付きPDFとして出力（ワーカープロセスで実行）。
+    ワーカーは多数のプロジェクトを続けて処理するので、元PDFのメモリマップは毎回解放する"""
+    from document_manager import documents
+    model = DocumentModel.from_project(project_path)
+    try:
+        model.export(out_path)
+    finally:
+        model.close()
+        if model.pdf_path:
+            documents.close(model.pdf_path)
+    return out_path
+
+
+def _export_jobs(args):
+    """(プロジェクト, 出力先) の組を作る"""
+    items = list(args.items)
+    if len(items) == 2 and items[1].lower().endswith(".pdf"):
+        return [(items[0], items[1])]
+
+    jobs = []
+    for p in items:
+        stem = os.path.splitext(os.path.basename(p))[0]
+        out_dir = args.out_dir or os.path.dirname(os.path.abspath(p))
+        jobs.append((p, os.path.join(out_dir, stem + ".pdf")))
+    return jobs
+
+
+def cmd_export(args):
+    jobs = _export_jobs(args)
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(export_project, src, dst): src for src, dst in jobs}
+        for fut in as_completed(futures):
+            src = futures[fut]
+            try:
+                print(f"OK   {src} -> {fut.result()}")
+            except Exception as e:
+                failed += 1
+                print(f"FAIL {src}: {e}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+# =====================================================
+# images
+# =====================================================
+def cmd_images(args):
+    model = DocumentModel.from_project(args.project)
+    out_dir = args.out_dir or os.path.dirname(os.path.abspath(args.project))
+    stem = os.path.splitext(os.path.basename(args.project))[0]
+
+    def on_page(page, path):
+        print(f"OK   p.{page + 1} -> {path}")
+
+    try:
+        model.export_images(out_dir, stem, dpi=args.dpi, fmt=args.format, workers=args.jobs, on_page=on_page)
+    except (ValueError, RuntimeError) as e:
+        print(f"FAIL {args.project}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+# =====================================================
+# report
+# =====================================================
+def cmd_report(args):
+    projects = list(find_projects(args.items))
+    fmt = args.format
+    if fmt is None:
+        ext = os.path.splitext(args.output or "")[1].lower()
+        fmt = ext[1:] if ext in SINKS else "csv"
+
+    failed = []
+
+    def on_error(path, msg):
+        failed.append(path)
+        print(f"FAIL {path}: {msg}", file=sys.stderr)
+
+    if args.shapes:
+        # 図形ごとの明細はプロジェクトを1つずつ読んで逐次書き出す（メモリ一定）
+        rows = iter_projects_shape_rows(projects, on_error=on_error)
+        if args.output:
+            with open_report(args.output, fmt) as f:
+                write_rows(rows, f, fmt=fmt)
+        else:
+            write_rows(rows, sys.stdout, fmt=fmt)
+    elif args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as f:
+            write_report(projects, f, fmt=fmt, jobs=args.jobs, on_error=on_error)
+    else:
+        write_report(projects, sys.stdout, fmt=fmt, jobs=args.jobs, on_error=on_error)
+    return 1 if failed else 0
+
+
+# =====================================================
+# エントリポイント
+# =====================================================
+def build_parser():
+    ap = argparse.ArgumentParser(prog="pdfannotator", description="PDFAnnotator headless tools")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p_exp = sub.add_parser("export", help="プロジェクトJSONから図形付きPDFを出力")
+    p_exp.add_argument(
+        "items", nargs="+",
+        help="project.json [out.pdf] または複数の project.json",
+    )
+    p_exp.add_argument("--out-dir", help="出力フォルダ（省略時はプロジェクトと同じ場所）")
+    p_exp.add_argument("--jobs", type=int, default=None, help="同時に処理するプロジェクト数（既定: CPU数）")
+    p_exp.set_defaults(func=cmd_export)
+
+    p_img = sub.add_parser("images", help="プロジェクトJSONから図形付きのページ画像（PNG/TIFF）を出力")
+    p_img.add_argument("project", help="project.json")
+    p_img.add_argument("--out-dir", help="出力フォルダ（省略時はプロジェクトと同じ場所）")
+    p_img.add_argument("--dpi", type=int, default=300, help="解像度（既定: 300）")
+    p_img.add_argument("--format", choices=["png", "tiff"], default="png", help="画像形式（既定: png）")
+    p_img.add_argument("--jobs", type=int, default=None, help="並列プロセス数（既定: CPU数、最大8）")
+    p_img.set_defaults(func=cmd_images)
+
+    p_rep = sub.add_parser("report", help="複数プロジェクトのページ別・総合数量を CSV/JSON に出力")
+    p_rep.add_argument("items", nargs="+", help="project.json またはフォルダ（配下の *.json を集計）")
+    p_rep.add_argument("-o", "--output", help="出力ファイル（.csv / .json / .jsonl、省略時は標準出力）")
+    p_rep.add_argument("--format", choices=["csv", "json", "jsonl"], help="出力形式（省略時は拡張子から判定）")
+    p_rep.add_argument("--jobs", type=int, default=None, help="並列プロセス数（既定: CPU数）")
+    p_rep.add_argument("--shapes", action="store_true",
+                       help="図形ごとの明細（ページ・ID・分類・値・倍率・結果）とページ合計・合計を出力")
+    p_rep.set_defaults(func=cmd_report)
+    return ap
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
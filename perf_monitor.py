@@ -0,0 +1,178 @@
+# perf_monitor.py
+# 処理ごとの回数・所要時間ヒストグラムを記録し、HUD 表示や JSON 出力に使う
+import gc
+import sys
+import json
+import time
+import functools
+import contextlib
+from collections import deque
+
+# ヒストグラムの区切り（ミリ秒）。最後は上限なし
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 33, 66, 133, 266, 533, 1000, 2000, 5000)
+# FPS を数える期間（秒）
+FPS_WINDOW = 1.0
+# HUD に出す処理（この順に表示）
+HUD_STAGES = ("display_page", "render_page", "draw_shape", "find_shape", "calc_page_stats", "export")
+
+
+@contextlib.contextmanager
+def gc_paused():
+    """大量の dict を一度に作る処理の間だけ循環GCを止める（作るたびに全オブジェクトを走査させない）"""
+    was = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was:
+            gc.enable()
+
+
+class StageStats:
+    """1つの処理の回数・合計・最小/最大・直近値とヒストグラム"""
+    __slots__ = ("count", "total_ms", "min_ms", "max_ms", "last_ms", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = None
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.last_ms = ms
+        if self.min_ms is None or ms < self.min_ms:
+            self.min_ms = ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        i = 0
+        while i < len(BUCKETS_MS) and ms > BUCKETS_MS[i]:
+            i += 1
+        self.buckets[i] += 1
+
+    def percentile(self, q):
+        """ヒストグラムから q（0〜1）分位点を見積もる（区切りの上端を返す）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target and n:
+                return BUCKETS_MS[i] if i < len(BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "min_ms": round(self.min_ms, 3) if self.min_ms is not None else None,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.percentile(0.5),
+            "p95_ms": self.percentile(0.95),
+            "p99_ms": self.percentile(0.99),
+            "histogram": {
+                (f"<={b}" if i < len(BUCKETS_MS) else f">{BUCKETS_MS[-1]}"): n
+                for i, (b, n) in enumerate(zip(BUCKETS_MS + (None,), self.buckets)) if n
+            },
+        }
+
+
+class PerfMonitor:
+    """処理ごとの計測値を集める。enabled が False の間は何もしない"""
+
+    def __init__(self):
+        self.enabled = True
+        self.stages = {}
+        self._frames = deque()
+        self.started = time.time()
+
+    def reset(self):
+        self.stages.clear()
+        self._frames.clear()
+        self.started = time.time()
+
+    def record(self, stage, ms):
+        if not self.enabled:
+            return
+        st = self.stages.get(stage)
+        if st is None:
+            st = self.stages[stage] = StageStats()
+        st.add(ms)
+
+    def frame(self):
+        """1フレーム描画したことを記録（FPS 計算用）"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._frames.append(now)
+        while self._frames and now - self._frames[0] > FPS_WINDOW:
+            self._frames.popleft()
+
+    def fps(self):
+        """直近 FPS_WINDOW 秒に描画したフレーム数から求めた FPS"""
+        now = time.perf_counter()
+        while self._frames and now - self._frames[0] > FPS_WINDOW:
+            self._frames.popleft()
+        return len(self._frames) / FPS_WINDOW
+
+    def timed(self, stage):
+        """関数の所要時間を stage として記録するデコレータ"""
+        def deco(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                t0 = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(stage, (time.perf_counter() - t0) * 1000)
+            return wrapper
+        return deco
+
+    # ---------- 表示・出力 ----------
+    def hud_lines(self):
+        """HUD 用の文字列（FPS と処理ごとの直近・平均・p95）"""
+        lines = [f"FPS {self.fps():5.1f}"]
+        for name in HUD_STAGES:
+            st = self.stages.get(name)
+            if not st:
+                continue
+            lines.append(
+                f"{name:<16} {st.last_ms:7.2f} ms  avg {st.total_ms / st.count:7.2f}"
+                f"  p95 {st.percentile(0.95):g}  n={st.count}"
+            )
+        return lines
+
+    def snapshot(self):
+        """JSON にできる形の計測結果（リリース間の比較用に環境情報も付ける）"""
+        import platform
+        env = {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        }
+        try:
+            import fitz
+            env["pymupdf"] = fitz.VersionBind
+        except ImportError:
+            pass
+        return {
+            "started": self.started,
+            "dumped": time.time(),
+            "environment": env,
+            "buckets_ms": list(BUCKETS_MS),
+            "stages": {k: v.to_dict() for k, v in sorted(self.stages.items())},
+        }
+
+    def dump(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+
+# アプリ全体で共有する計測器
+monitor = PerfMonitor()
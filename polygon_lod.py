@@ -0,0 +1,127 @@
+# polygon_lod.py
+# 多角形（polygon）の前計算：縮小表示用の簡略化した輪郭（LOD）と、当たり判定用の帯状の辺索引
+#   頂点が数千ある多角形でも、描画・選択のたびに全頂点をなめないようにする。GUI不要
+#   図形の "points" は編集のたびに新しいリストに置き換える（同じリストなら前計算を使い回す）
+import math
+from utils_geometry import dist_point_to_segment, point_in_polygon, simplify_polygon
+
+# これより頂点の少ない多角形は簡略化・索引なしでそのまま扱う
+LOD_MIN_VERTICES = 200
+# 簡略化で許す画面上のずれ（ピクセル）
+LOD_SCREEN_PX = 0.75
+# 前計算する簡略化の許容誤差（PDF座標、小さい順）
+LOD_LEVELS = (0.25, 1.0, 4.0, 16.0, 64.0)
+# 辺索引の1帯あたりの辺の数の目安
+BAND_EDGES = 8
+# 覚えておく多角形の数
+CACHE_SIZE = 4096
+
+
+class PolygonGeometry:
+    """1つの頂点リストに対する前計算（外接矩形・LOD・辺索引）"""
+
+    def __init__(self, points):
+        self.points = points
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+        self._levels = {}       # 許容誤差 -> 残す頂点の番号
+        self._bands = None
+
+    def outline(self, scale):
+        """倍率 scale で描くときの頂点番号（そのまま描くなら None）"""
+        if len(self.points) < LOD_MIN_VERTICES:
+            return None
+        tol = LOD_SCREEN_PX / scale
+        level = None
+        for lv in LOD_LEVELS:
+            if lv <= tol:
+                level = lv
+        if level is None:
+            return None
+        idx = self._levels.get(level)
+        if idx is None:
+            # 1段細かい結果があれば、それをさらに簡略化する（頂点が少ないので速い）
+            finer = [lv for lv in LOD_LEVELS if lv < level and lv in self._levels]
+            base = self._levels[finer[-1]] if finer else None
+            idx = self._levels[level] = simplify_polygon(self.points, level, base)
+        return idx
+
+    # ---------- 当たり判定 ----------
+    def _build_bands(self):
+        """y 方向の帯ごとに、その帯にかかる辺の番号を集める"""
+        pts = self.points
+        n = len(pts)
+        y0, y1 = self.bbox[1], self.bbox[3]
+        nb = max(1, n // BAND_EDGES)
+        h = (y1 - y0) / nb or 1.0
+        bands = [[] for _ in range(nb)]
+        for i in range(n):
+            a = pts[i][1]
+            b = pts[(i + 1) % n][1]
+            if a > b:
+                a, b = b, a
+            for k in range(min(nb - 1, int((a - y0) / h)), min(nb - 1, int((b - y0) / h)) + 1):
+                bands[k].append(i)
+        self._bands = (y0, h, bands)
+
+    def _edges_between(self, ya, yb):
+        """y が ya〜yb の範囲にかかりうる辺の番号"""
+        if self._bands is None:
+            self._build_bands()
+        y0, h, bands = self._bands
+        k0 = max(0, int(math.floor((ya - y0) / h)))
+        k1 = min(len(bands) - 1, int(math.floor((yb - y0) / h)))
+        if k0 == k1:
+            return bands[k0]
+        found = set()
+        for k in range(k0, k1 + 1):
+            found.update(bands[k])
+        return found
+
+    def contains(self, px, py):
+        x0, y0, x1, y1 = self.bbox
+        if not (x0 <= px <= x1 and y0 <= py <= y1):
+            return False
+        pts = self.points
+        if len(pts) < LOD_MIN_VERTICES:
+            return point_in_polygon(px, py, pts)
+        # 水平線 y=py と交わる辺は py を含む帯にしかない
+        n = len(pts)
+        inside = False
+        for i in self._edges_between(py, py):
+            xa, ya = pts[i]
+            xb, yb = pts[(i + 1) % n]
+            if (ya > py) != (yb > py):
+                if px < xa + (py - ya) * (xb - xa) / (yb - ya):
+                    inside = not inside
+        return inside
+
+    def near_edge(self, px, py, tol):
+        """辺から tol 以内か"""
+        x0, y0, x1, y1 = self.bbox
+        if not (x0 - tol <= px <= x1 + tol and y0 - tol <= py <= y1 + tol):
+            return False
+        pts = self.points
+        n = len(pts)
+        edges = range(n) if n < LOD_MIN_VERTICES else self._edges_between(py - tol, py + tol)
+        for i in edges:
+            xa, ya = pts[i]
+            xb, yb = pts[(i + 1) % n]
+            if dist_point_to_segment(px, py, xa, ya, xb, yb) < tol:
+                return True
+        return False
+
+
+_cache = {}
+
+
+def geometry(s):
+    """図形 s（type="polygon"）の前計算。頂点リストが置き換わっていれば作り直す"""
+    key = s.get("id") or id(s)
+    g = _cache.get(key)
+    if g is None or g.points is not s["points"]:
+        if len(_cache) >= CACHE_SIZE:
+            _cache.clear()
+        g = _cache[key] = PolygonGeometry(s["points"])
+    return g
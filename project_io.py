@@ -0,0 +1,59 @@
+# project_io.py
+# プロジェクトJSONの読み書き（GUI不要）
+import os
+import json
+
+
+def load_project(path):
+    """プロジェクトJSONを読み込み、ページ番号を int に直した dict を返す"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    pdf_path = data["pdf_path"]
+    # 相対パスで見つからなければプロジェクトファイルの場所から探す
+    if pdf_path and not os.path.isabs(pdf_path) and not os.path.exists(pdf_path):
+        alt = os.path.join(os.path.dirname(os.path.abspath(path)), pdf_path)
+        if os.path.exists(alt):
+            pdf_path = alt
+
+    raw = data.get("shapes_by_page", {})
+    slopes = data.get("page_slope_default", {})
+    return {
+        "pdf_path": pdf_path,
+        "shapes_by_page": {int(k): v for k, v in raw.items()},
+        "page_slope_default": {int(k): v for k, v in slopes.items()},
+        "slope_presets": list(data.get("slope_presets", [])),
+        # ページ削除後の 表示ページ → 元PDFページ番号（無ければ全ページ）
+        "page_map": data.get("page_map"),
+    }
+
+
+# プロジェクトJSONかどうかを見分けるときに読む先頭のバイト数（save_project は pdf_path を最初に書く）
+SNIFF_BYTES = 4096
+
+
+def is_project_file(path):
+    """JSON がプロジェクトらしいか（先頭に pdf_path / shapes_by_page の項目があるか）。
+    計測結果・ベンチマークの基準値など、ほかの JSON をフォルダ集計から外すのに使う"""
+    try:
+        with open(path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+    except OSError:
+        return False
+    if not head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"{"):
+        return False
+    return b'"pdf_path"' in head or b'"shapes_by_page"' in head
+
+
+def save_project(path, pdf_path, shapes_by_page, page_slope_default=None, slope_presets=None,
+                 page_map=None):
+    """プロジェクトJSONを書き出す"""
+    data = {
+        "pdf_path": pdf_path,
+        "shapes_by_page": shapes_by_page,
+        "page_slope_default": page_slope_default or {},
+        "slope_presets": slope_presets or [],
+        "page_map": page_map,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
@@ -0,0 +1,159 @@
+# quantity.py
+# 数量集計（壁・屋根・B下・下屋・窓・ドア）。GUI不要の純粋関数
+#   app_core の calc_page_stats / calc_total_stats と一括集計 CLI で共用する
+#   集計は 0.001 単位の整数（math_eval の固定小数点）で行い、合計を正確に保つ
+from math_eval import to_milli, from_milli, mul_milli, format_milli
+
+# 色 → 属性名
+ATTR = {
+    "#ff0000": "wall",
+    "#0000ff": "roof",
+    "#00aa00": "bshita",
+    "#ffa500": "koya",
+    "#800080": "window",
+    "#999999": "door",
+}
+
+CATEGORIES = ["wall", "roof", "bshita", "koya", "window", "door"]
+
+# 総合集計の項目（壁は窓・ドアを引いた最終値で集計）
+GRAND_KEYS = ["wall_final", "roof", "bshita", "koya", "window", "door"]
+
+
+def get_slope_factor(s, page_default=None):
+    """屋根の倍率を返す。shape 個別設定 > ページデフォルト > 1.0"""
+    if not s:
+        return 1.0
+    slope = s.get("slope")
+    if slope is not None:
+        return slope
+    if page_default is not None:
+        return page_default
+    return 1.0
+
+
+def iter_shape_quantities_milli(shapes, page_slope=None, totals=None):
+    """
+    集計対象の図形ごとに (図形, 分類, 値, 倍率, 結果) を 0.001 単位の整数で返すジェネレータ。
+    倍率は屋根だけ（それ以外は None、結果は値のまま）。色が分類にない図形・値のない図形は飛ばす。
+    totals（分類 → 合計）を渡すと結果を足し込む（ページ集計と図形ごとの明細で同じ計算を使う）。
+    """
+    for s in shapes:
+        col = s.get("color")
+        val = s.get("value")
+
+        if col not in ATTR or val is None:
+            continue
+
+        atr = ATTR[col]
+        mv = to_milli(val)
+
+        # --- 屋根だけは倍率をかける ---
+        if atr == "roof":
+            ms = to_milli(get_slope_factor(s, page_slope))
+            result = mul_milli(mv, ms)
+        else:
+            ms = None
+            result = mv
+        if totals is not None:
+            totals[atr] += result
+        yield s, atr, mv, ms, result
+
+
+def wall_final_milli(totals):
+    """壁は窓・ドアを引いた値が最終値"""
+    return totals["wall"] - (totals["window"] + totals["door"])
+
+
+def calc_page_stats_milli(shapes, page_slope=None):
+    """
+    ページ内の図形を 0.001 単位の整数で集計し、(集計値[ミリ単位], 式一覧) を返す。
+    各図形の値・屋根の倍率結果は小数第3位で切り捨ててから足すので、
+    式一覧に表示した数値の合計と集計値が常に一致する（float の誤差が溜まらない）。
+    """
+    totals = {k: 0 for k in CATEGORIES}
+
+    # 式一覧（右下に描く用）
+    formula_lines = []
+
+    for _, atr, mv, ms, result in iter_shape_quantities_milli(shapes, page_slope, totals):
+        if ms is not None:
+            formula_lines.append(
+                f"屋根: {format_milli(mv)} × {format_milli(ms)} = {format_milli(result)}"
+            )
+        else:
+            formula_lines.append(f"{atr}: {format_milli(mv)}")
+
+    # --- 壁は窓・ドアを引く ---
+    wall_final = wall_final_milli(totals)
+    formula_lines.append(
+        f"壁最終: {format_milli(totals['wall'])} - ({format_milli(totals['window'])} + "
+        f"{format_milli(totals['door'])}) = {format_milli(wall_final)}"
+    )
+    totals["wall_final"] = wall_final
+
+    return totals, formula_lines
+
+
+def calc_page_stats(shapes, page_slope=None):
+    """ページ内の図形を集計し、(集計値, 式一覧) を返す"""
+    totals, formula_lines = calc_page_stats_milli(shapes, page_slope)
+    return {k: from_milli(v) for k, v in totals.items()}, formula_lines
+
+
+def iter_page_stats_milli(shapes_by_page, page_slope_default=None):
+    """ページ順に (page_index, 集計値[ミリ単位], 式一覧) を返すジェネレータ"""
+    page_slope_default = page_slope_default or {}
+    for p in sorted(shapes_by_page.keys()):
+        totals, formulas = calc_page_stats_milli(shapes_by_page[p], page_slope_default.get(p))
+        yield p, totals, formulas
+
+
+def iter_page_stats(shapes_by_page, page_slope_default=None):
+    """ページ順に (page_index, 集計値, 式一覧) を返すジェネレータ"""
+    for p, totals, formulas in iter_page_stats_milli(shapes_by_page, page_slope_default):
+        yield p, {k: from_milli(v) for k, v in totals.items()}, formulas
+
+
+def calc_total_stats_milli(shapes_by_page, page_slope_default=None):
+    """全ページを集計し、(総合集計[ミリ単位], 全ページの式一覧) を返す"""
+    grand = {k: 0 for k in GRAND_KEYS}
+    all_formulas = []
+
+    for p, totals, formulas in iter_page_stats_milli(shapes_by_page, page_slope_default):
+        if not formulas:
+            continue
+        all_formulas.append(f"=== Page {p+1} ===")
+        all_formulas.extend(formulas)
+
+        for k in grand:
+            if k in totals:
+                grand[k] += totals[k]
+
+    return grand, all_formulas
+
+
+def calc_total_stats(shapes_by_page, page_slope_default=None):
+    """全ページを集計し、(総合集計, 全ページの式一覧) を返す"""
+    grand, all_formulas = calc_total_stats_milli(shapes_by_page, page_slope_default)
+    return {k: from_milli(v) for k, v in grand.items()}, all_formulas
+
+
+def calc_documents_total_stats(documents):
+    """複数の図面（平面図・立面図など）をまとめて集計する。
+
+    documents: [(名前, shapes_by_page, page_slope_default), ...]
+    戻り値: (全図面の総合集計, {名前: 図面ごとの総合集計}, 全図面の式一覧)
+    """
+    grand = {k: 0 for k in GRAND_KEYS}
+    per_doc = {}
+    all_formulas = []
+    for name, shapes_by_page, page_slope_default in documents:
+        totals, formulas = calc_total_stats_milli(shapes_by_page, page_slope_default)
+        per_doc[name] = {k: from_milli(v) for k, v in totals.items()}
+        if formulas:
+            all_formulas.append(f"##### {name} #####")
+            all_formulas.extend(formulas)
+        for k in grand:
+            grand[k] += totals[k]
+    return {k: from_milli(v) for k, v in grand.items()}, per_doc, all_formulas
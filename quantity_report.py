@@ -0,0 +1,201 @@
+# quantity_report.py
+# 多数のプロジェクトJSONを並列に読み込み、ページ別・総合の数量を CSV/JSON に書き出す
+#   図形ごとの明細（図形1行＋ページ合計・総合計）はジェネレータで1行ずつ書き出す
+import os
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from project_io import is_project_file, load_project
+from math_eval import from_milli, format_milli
+import quantity
+
+# 出力列（ページ行・合計行で共通）
+FIELDS = ["project", "page"] + quantity.CATEGORIES + ["wall_final"]
+# 0.001 単位の整数で持っている列
+MILLI_FIELDS = frozenset(FIELDS[2:])
+
+# 図形ごとの明細の列。kind は shape（図形）/ page_total（ページ合計）/ total（合計）。
+# 合計行は分類ごとに1行（category に分類名、result に合計）
+SHAPE_FIELDS = ["project", "page", "kind", "id", "category", "value", "slope", "result"]
+SHAPE_MILLI_FIELDS = frozenset(("value", "slope", "result"))
+# 合計行を出す分類（壁最終を含む）
+TOTAL_KEYS = quantity.CATEGORIES + ["wall_final"]
+
+
+def project_rows(project_path):
+    """1プロジェクトのページ別行と合計行を返す（ワーカープロセスで実行）"""
+    try:
+        data = load_project(project_path)
+    except Exception as e:
+        return project_path, None, str(e)
+
+    # 値は 0.001 単位の整数のまま持ち、書き出すときに小数に戻す
+    rows = []
+    total = {k: 0 for k in FIELDS[2:]}
+    for p, totals, _ in quantity.iter_page_stats_milli(data["shapes_by_page"], data["page_slope_default"]):
+        row = {"project": project_path, "page": p + 1}
+        for k in total:
+            row[k] = totals[k]
+            total[k] += totals[k]
+        rows.append(row)
+    rows.append({"project": project_path, "page": "TOTAL", **total})
+    return project_path, rows, None
+
+
+def find_projects(paths):
+    """ファイルはそのまま、フォルダは配下の *.json のうちプロジェクトらしいものを再帰的に列挙
+    （計測結果・ベンチマークの基準値などの JSON は黙って飛ばす）"""
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                for name in sorted(files):
+                    if name.lower().endswith(".json"):
+                        path = os.path.join(root, name)
+                        if is_project_file(path):
+                            yield path
+        else:
+            yield p
+
+
+# =====================================================
+# 図形ごとの明細（ジェネレータ）
+# =====================================================
+def iter_shape_rows(shapes_by_page, page_slope_default=None, project="", grand=None):
+    """図形1行ずつ、ページごとに合計行、最後にプロジェクトの合計行を返すジェネレータ。
+
+    値は 0.001 単位の整数。集計は quantity.calc_page_stats_milli と同じ計算
+    （iter_shape_quantities_milli）なので、合計行は画面の集計と一致する。
+    grand（分類 → 合計）を渡すとプロジェクトの合計を足し込む（複数プロジェクトの総合計用）。
+    """
+    page_slope_default = page_slope_default or {}
+    total = {k: 0 for k in TOTAL_KEYS}
+    for p in sorted(shapes_by_page.keys()):
+        page = p + 1
+        totals = {k: 0 for k in quantity.CATEGORIES}
+        for s, atr, mv, ms, result in quantity.iter_shape_quantities_milli(
+                shapes_by_page[p], page_slope_default.get(p), totals):
+            yield {"project": project, "page": page, "kind": "shape", "id": s.get("id", ""),
+                   "category": atr, "value": mv, "slope": ms, "result": result}
+        totals["wall_final"] = quantity.wall_final_milli(totals)
+        for k in TOTAL_KEYS:
+            total[k] += totals[k]
+            yield {"project": project, "page": page, "kind": "page_total", "id": "",
+                   "category": k, "value": None, "slope": None, "result": totals[k]}
+    for k in TOTAL_KEYS:
+        if grand is not None:
+            grand[k] = grand.get(k, 0) + total[k]
+        yield {"project": project, "page": "TOTAL", "kind": "total", "id": "",
+               "category": k, "value": None, "slope": None, "result": total[k]}
+
+
+def iter_projects_shape_rows(project_paths, on_error=None):
+    """プロジェクトを1つずつ読み込んで明細を返し、最後に全体の合計行を返すジェネレータ
+    （メモリに持つのは読み込み中の1プロジェクトだけ）"""
+    grand = {}
+    for path in project_paths:
+        try:
+            data = load_project(path)
+        except Exception as e:
+            if on_error:
+                on_error(path, str(e))
+            continue
+        yield from iter_shape_rows(data["shapes_by_page"], data["page_slope_default"], path, grand)
+    for k in TOTAL_KEYS:
+        yield {"project": "ALL", "page": "TOTAL", "kind": "total", "id": "",
+               "category": k, "value": None, "slope": None, "result": grand.get(k, 0)}
+
+
+def write_rows(rows, out, fmt="csv", fields=SHAPE_FIELDS, milli_fields=SHAPE_MILLI_FIELDS):
+    """行のイテラブルを out（ファイルオブジェクト）に1行ずつ書き出し、行数を返す"""
+    sink = SINKS["." + fmt](out, fields, milli_fields)
+    n = 0
+    for row in rows:
+        sink.write(row)
+        n += 1
+    sink.close()
+    return n
+
+
+def open_report(path, fmt):
+    """出力ファイルを開く。CSV は Excel でそのまま開けるよう BOM 付き UTF-8"""
+    return open(path, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="")
+
+
+# =====================================================
+# 出力（逐次書き出し）
+# =====================================================
+def _json_row(row, milli_fields=MILLI_FIELDS):
+    return {k: (from_milli(v) if k in milli_fields and v is not None else v) for k, v in row.items()}
+
+
+class _CsvSink:
+    def __init__(self, f, fields=FIELDS, milli_fields=MILLI_FIELDS):
+        self.w = csv.DictWriter(f, fieldnames=fields)
+        self.w.writeheader()
+        self.milli = milli_fields
+
+    def write(self, row):
+        self.w.writerow({k: (format_milli(v) if k in self.milli and v is not None else v)
+                         for k, v in row.items()})
+
+    def close(self):
+        pass
+
+
+class _JsonSink:
+    """JSON 配列を1行ずつ書き出す（全体をメモリに持たない）"""
+    def __init__(self, f, fields=FIELDS, milli_fields=MILLI_FIELDS):
+        self.f = f
+        self.first = True
+        self.milli = milli_fields
+        f.write("[\n")
+
+    def write(self, row):
+        if not self.first:
+            self.f.write(",\n")
+        self.first = False
+        self.f.write(json.dumps(_json_row(row, self.milli), ensure_ascii=False))
+
+    def close(self):
+        self.f.write("\n]\n")
+
+
+class _JsonLinesSink:
+    def __init__(self, f, fields=FIELDS, milli_fields=MILLI_FIELDS):
+        self.f = f
+        self.milli = milli_fields
+
+    def write(self, row):
+        self.f.write(json.dumps(_json_row(row, self.milli), ensure_ascii=False) + "\n")
+
+    def close(self):
+        pass
+
+
+SINKS = {".csv": _CsvSink, ".json": _JsonSink, ".jsonl": _JsonLinesSink}
+
+
+def write_report(project_paths, out, fmt="csv", jobs=None, on_error=None):
+    """プロジェクト群を集計して out（ファイルオブジェクト）に書き出す。
+
+    戻り値は全プロジェクトの総合集計 dict（0.001 単位の整数）。読み込めなかったプロジェクトは
+    on_error(path, message) に渡してスキップする。
+    """
+    sink = SINKS["." + fmt](out)
+    grand = {k: 0 for k in FIELDS[2:]}
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # map は投入順に結果を返すので出力順がプロジェクト順で安定する
+        for path, rows, err in pool.map(project_rows, project_paths, chunksize=16):
+            if err is not None:
+                if on_error:
+                    on_error(path, err)
+                continue
+            for row in rows:
+                sink.write(row)
+            for k in grand:
+                grand[k] += rows[-1][k]
+
+    sink.write({"project": "ALL", "page": "TOTAL", **grand})
+    sink.close()
+    return grand
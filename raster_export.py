@@ -0,0 +1,232 @@
+# raster_export.py
+# 図形を書き込んだページを指定DPIの画像（PNG / TIFF）に1ページ1ファイルで出力する。GUI不要
+#   描画と保存はワーカープロセスで行い、本体には保存したパスだけが返る（画素はプロセス間で運ばない）
+#   同時に処理するページは推定画素メモリの合計が上限に収まる分だけ投入する
+#   （300DPI・1000ページでもメモリ使用量はページ数によらず一定）
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pdf_manager import stamp_page
+
+# 拡張子 → 出力形式
+RASTER_FORMATS = {"png": "PNG", "tif": "TIFF", "tiff": "TIFF"}
+DEFAULT_DPI = 300
+# 同時に処理中のページの推定画素メモリの上限（全ワーカー合計、バイト）
+RASTER_MEMORY_BYTES = 1024 * 2**20
+# ワーカー数の上限
+RASTER_MAX_WORKERS = 8
+# ワーカー1つあたりに先行して投入しておくページ数
+INFLIGHT_PER_WORKER = 2
+# 結果の確認間隔（ミリ秒、GUI用）
+POLL_MS = 100
+
+# ワーカー側で開いた元PDF（パス, mtime, Document）。1ワーカー1文書
+_worker_src = None
+
+
+def _source_doc(path):
+    """ワーカー側：元PDFを開いて使い回す（ファイルが更新されていれば開き直す）"""
+    global _worker_src
+    from document_manager import documents
+    mtime = os.stat(path).st_mtime_ns
+    if _worker_src and _worker_src[0] == path and _worker_src[1] == mtime:
+        return _worker_src[2]
+    if _worker_src:
+        _worker_src[2].close()
+        documents.close(_worker_src[0])
+    doc = documents.open(path)
+    _worker_src = (path, mtime, doc)
+    return doc
+
+
+def page_bytes(rect, dpi, fmt="PNG"):
+    """ページ rect (x0, y0, x1, y1) を dpi で描いたときの推定メモリ（RGB）。
+    TIFF は PIL に渡すときに画素を複製するので2倍で見積もる"""
+    zoom = dpi / 72
+    w = int((rect[2] - rect[0]) * zoom) + 1
+    h = int((rect[3] - rect[1]) * zoom) + 1
+    return w * h * 3 * (2 if fmt == "TIFF" else 1)
+
+
+def page_file_name(stem, page_index, page_count, ext):
+    """出力ファイル名（ページ番号は1始まり・桁をそろえる）"""
+    digits = max(3, len(str(page_count)))
+    return f"{stem}_p{page_index + 1:0{digits}d}.{ext}"
+
+
+def rasterize_page(pdf_path, source_page, shapes, out_path, dpi, fmt):
+    """ワーカー側：1ページに図形を書き込んで画像にし、out_path に保存する。
+    戻り値は (out_path, 幅, 高さ, 所要ms)"""
+    import fitz
+    t0 = time.perf_counter()
+    src = _source_doc(pdf_path)
+    tmp = None
+    if shapes:
+        # 使い回す元PDFを書き換えないよう、1ページだけの文書に写してから書き込む
+        tmp = fitz.open()
+        tmp.insert_pdf(src, from_page=source_page, to_page=source_page)
+        page = tmp[0]
+        stamp_page(page, shapes)
+    else:
+        page = src.load_page(source_page)
+
+    pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72), alpha=False)
+    pix.set_dpi(dpi, dpi)
+    width, height = pix.width, pix.height
+    # 書きかけのファイルが完成品に見えないよう、別名で書いてから置き換える
+    part = out_path + ".part"
+    if fmt == "TIFF":
+        pix.pil_save(part, format="TIFF", dpi=(dpi, dpi), compression="tiff_lzw")
+    else:
+        pix.save(part, output="png")
+    os.replace(part, out_path)
+
+    pix = None
+    if tmp is not None:
+        tmp.close()
+    # 画像のデコード結果などを持ち越さない（ワーカーのメモリを一定に保つ）
+    fitz.TOOLS.store_shrink(100)
+    return out_path, width, height, (time.perf_counter() - t0) * 1000
+
+
+class RasterExport:
+    """図形付きページの画像出力（1回分）。
+
+    start() で投入を始め、poll() で終わったページを受け取りながら次のページを投入する
+    （GUI は after で poll、コマンドラインは run()）。
+    出力先は out_dir/<stem>_p0001.png のようにページごとのファイル。
+    """
+
+    def __init__(self, pdf_path, shapes_by_page, out_dir, stem, dpi=DEFAULT_DPI, fmt="png",
+                 page_map=None, pages=None, workers=None, memory_bytes=RASTER_MEMORY_BYTES):
+        import fitz
+        fmt = fmt.lower().lstrip(".")
+        if fmt not in RASTER_FORMATS:
+            raise ValueError(f"画像形式 {fmt} には対応していません（png / tiff）")
+        if dpi <= 0:
+            raise ValueError("DPI は正の数で指定してください")
+        self.pdf_path = pdf_path
+        self.shapes_by_page = shapes_by_page
+        self.out_dir = out_dir
+        self.stem = stem
+        self.dpi = dpi
+        self.ext = fmt
+        self.fmt = RASTER_FORMATS[fmt]
+        self.memory_bytes = memory_bytes
+
+        with fitz.open(pdf_path) as src:
+            if page_map is None:
+                page_map = list(range(len(src)))
+            self.page_map = list(page_map)
+            if pages is None:
+                pages = range(len(self.page_map))
+            # (表示ページ番号, 元PDFのページ番号, 推定メモリ)
+            self._todo = [
+                (i, self.page_map[i], page_bytes(tuple(src.load_page(self.page_map[i]).rect), dpi, self.fmt))
+                for i in pages
+            ]
+        self._todo.reverse()        # 末尾から pop する
+        self.total = len(self._todo)
+        if workers is None:
+            workers = max(1, min(os.cpu_count() or 1, RASTER_MAX_WORKERS))
+        self.workers = max(1, min(workers, self.total or 1))
+
+        self._pool = None
+        self._running = {}          # Future -> (表示ページ番号, 推定メモリ)
+        self._in_use = 0
+        self.peak_bytes = 0
+        self.written = []           # [(表示ページ番号, パス), ...]（終わった順）
+        self.errors = []            # [(表示ページ番号, メッセージ), ...]
+        self.cancelled = False
+
+    @property
+    def done(self):
+        return not self._todo and not self._running
+
+    def out_path(self, page_index):
+        return os.path.join(self.out_dir, page_file_name(self.stem, page_index, len(self.page_map), self.ext))
+
+    def start(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self._pool is None and self.total:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._submit()
+
+    def _submit(self):
+        """メモリ上限・先行数の範囲で次のページを投入する（処理中がなければ大きくても1ページは投入）"""
+        limit = self.workers * INFLIGHT_PER_WORKER
+        while self._todo and len(self._running) < limit:
+            page, source, need = self._todo[-1]
+            if self._running and self._in_use + need > self.memory_bytes:
+                break
+            self._todo.pop()
+            fut = self._pool.submit(
+                rasterize_page, self.pdf_path, source, self.shapes_by_page.get(page, []),
+                self.out_path(page), self.dpi, self.fmt,
+            )
+            self._running[fut] = (page, need)
+            self._in_use += need
+            self.peak_bytes = max(self.peak_bytes, self._in_use)
+
+    def poll(self, timeout=0):
+        """終わったページを受け取って次を投入する。timeout=None なら1ページ終わるまで待つ。
+        今回終わった [(表示ページ番号, パス), ...] を返す"""
+        if not self._running:
+            return []
+        finished, _ = wait(list(self._running), timeout=timeout, return_when=FIRST_COMPLETED)
+        out = []
+        for fut in finished:
+            page, need = self._running.pop(fut)
+            self._in_use -= need
+            try:
+                path = fut.result()[0]
+            except Exception as e:
+                self.errors.append((page, str(e)))
+                continue
+            self.written.append((page, path))
+            out.append((page, path))
+        if not self.cancelled:
+            self._submit()
+        if self.done:
+            self.shutdown()
+        return out
+
+    def run(self, on_page=None):
+        """すべてのページを出力するまで待つ（on_page(表示ページ番号, パス) をページごとに呼ぶ）"""
+        self.start()
+        try:
+            while not self.done:
+                for page, path in self.poll(timeout=None):
+                    if on_page is not None:
+                        on_page(page, path)
+        finally:
+            self.shutdown()
+        return self.written
+
+    def cancel(self):
+        """未投入のページを取りやめる（処理中のページは書き終わる）"""
+        self.cancelled = True
+        self._todo.clear()
+        for fut in list(self._running):
+            if fut.cancel():
+                self._in_use -= self._running.pop(fut)[1]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=not self._running, cancel_futures=True)
+            self._pool = None
+
+    def progress_text(self):
+        return f"画像出力 {len(self.written)} / {self.total} ページ（{self.dpi} DPI, {self.fmt}）"
+
+
+def export_rasters(pdf_path, shapes_by_page, out_dir, stem, dpi=DEFAULT_DPI, fmt="png",
+                   page_map=None, workers=None, on_page=None):
+    """図形付きの全ページを画像に出力して [(表示ページ番号, パス), ...] を返す（GUI不要）"""
+    job = RasterExport(pdf_path, shapes_by_page, out_dir, stem, dpi=dpi, fmt=fmt,
+                       page_map=page_map, workers=workers)
+    job.run(on_page)
+    if job.errors:
+        page, msg = job.errors[0]
+        raise RuntimeError(f"{len(job.errors)} ページの出力に失敗しました（p.{page + 1}: {msg}）")
+    return job.written
@@ -0,0 +1,312 @@
+# render_service.py
+# ページのラスタライズをワーカープロセスで行い、結果を Tk の after で受け取る
+#
+# PyMuPDF は描画中も GIL を離さないため、スレッドでは Tk のイベント処理が止まる。
+# 描画は別プロセスで行い、古くなった依頼は結果を待たずに捨てる。
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+# 結果の確認間隔（ミリ秒）
+POLL_MS = 15
+# これを超える画素数になる倍率では、表示範囲（＋余白）だけを描画する
+FULL_PAGE_MAX_PIXELS = 12_000_000
+# 部分描画時に表示範囲の外側へ足す余白（表示範囲に対する割合）
+CLIP_MARGIN = 0.5
+# 描画済み画像のキャッシュの上限（全タブ共通、バイト）
+RASTER_CACHE_BYTES = 512 * 2**20
+# ワーカーが開いたままにしておく文書の数
+WORKER_MAX_DOCS = 8
+
+# ワーカー側で開いた文書（パス → (mtime, Document)、古い順）
+_worker_docs = OrderedDict()
+
+
+def _worker_doc(path):
+    """ワーカー側：文書を開いて使い回す（ファイルが更新されていれば開き直す）。
+    マップも閉じるので本体プロセスでは呼ばないこと"""
+    from document_manager import documents
+    mtime = os.stat(path).st_mtime_ns
+    cached = _worker_docs.get(path)
+    if cached and cached[0] == mtime:
+        _worker_docs.move_to_end(path)
+        return cached[1]
+    if cached:
+        del _worker_docs[path]
+        cached[1].close()
+        documents.close(path)
+    doc = documents.open(path)
+    _worker_docs[path] = (mtime, doc)
+    # タブをたくさん開いても、ワーカーが持つ文書は一定数まで
+    while len(_worker_docs) > WORKER_MAX_DOCS:
+        old, (_, old_doc) = _worker_docs.popitem(last=False)
+        old_doc.close()
+        documents.close(old)
+    return doc
+
+
+def _pixmap_data(page, scale, clip):
+    import fitz
+    t0 = time.perf_counter()
+    pix = page.get_pixmap(
+        matrix=fitz.Matrix(scale, scale),
+        clip=fitz.Rect(clip) if clip else None,
+        alpha=False,
+    )
+    return pix.width, pix.height, bytes(pix.samples), (time.perf_counter() - t0) * 1000
+
+
+def rasterize(path, source_page, scale, clip=None):
+    """ワーカー側：ページを描画して (width, height, RGBバイト列, 所要ms) を返す"""
+    return _pixmap_data(_worker_doc(path).load_page(source_page), scale, clip)
+
+
+def _noop():
+    return os.getpid()
+
+
+class RenderRequest:
+    """描画依頼：元PDFのページ・倍率・クリップ範囲（PDF座標、None でページ全体）"""
+    __slots__ = ("path", "page_index", "source_page", "scale", "clip", "serial")
+
+    def __init__(self, path, page_index, source_page, scale, clip, serial):
+        self.path = path
+        self.page_index = page_index
+        self.source_page = source_page
+        self.scale = scale
+        self.clip = clip
+        self.serial = serial
+
+
+class RenderResult:
+    """描画結果。image は PIL.Image（request.clip の範囲、None ならページ全体）"""
+    __slots__ = ("request", "image", "elapsed_ms")
+
+    def __init__(self, request, image, elapsed_ms):
+        self.request = request
+        self.image = image
+        self.elapsed_ms = elapsed_ms
+
+    def covers(self, path, source_page, scale, view):
+        """同じページ・倍率で、表示範囲 view (PDF座標) を含んでいるか"""
+        r = self.request
+        if (r.path, r.source_page, r.scale) != (path, source_page, scale):
+            return False
+        if r.clip is None:
+            return True
+        x0, y0, x1, y1 = r.clip
+        vx0, vy0, vx1, vy1 = view
+        return x0 <= vx0 and y0 <= vy0 and x1 >= vx1 and y1 >= vy1
+
+
+def _contains(req, path, source_page, scale, clip):
+    """依頼 req の描画範囲が (path, source_page, scale, clip) を含むか"""
+    if (req.path, req.source_page, req.scale) != (path, source_page, scale):
+        return False
+    if req.clip is None:
+        return True
+    if clip is None:
+        return False
+    x0, y0, x1, y1 = req.clip
+    return x0 <= clip[0] and y0 <= clip[1] and x1 >= clip[2] and y1 >= clip[3]
+
+
+class RasterCache:
+    """描画結果の LRU キャッシュ。開いているすべてのPDF（タブ）で1つの上限を共有し、
+    上限を超えたらどの文書かに関係なく古いものから捨てる。
+
+    キーは (パス, 元ページ番号, 倍率)。同じキーには最新の結果（表示範囲）だけを持つ。
+    """
+    def __init__(self, budget=RASTER_CACHE_BYTES):
+        self.budget = budget
+        self.nbytes = 0
+        self.evicted = 0
+        self._items = OrderedDict()     # key -> (RenderResult, バイト数)
+
+    @staticmethod
+    def _size(res):
+        w, h = res.image.size
+        return w * h * len(res.image.getbands())
+
+    def get(self, path, source_page, scale):
+        key = (path, source_page, scale)
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, res):
+        r = res.request
+        key = (r.path, r.source_page, r.scale)
+        old = self._items.pop(key, None)
+        if old is not None:
+            self.nbytes -= old[1]
+        size = self._size(res)
+        self._items[key] = (res, size)
+        self.nbytes += size
+        # 入れたばかりのもの（表示中）は残す
+        while self.nbytes > self.budget and len(self._items) > 1:
+            _, (_, n) = self._items.popitem(last=False)
+            self.nbytes -= n
+            self.evicted += 1
+
+    def drop(self, path=None):
+        """path の画像（None ならすべて）を捨てる"""
+        for key in [k for k in self._items if path is None or k[0] == path]:
+            self.nbytes -= self._items.pop(key)[1]
+
+    def usage(self):
+        """{パス: バイト数}"""
+        out = {}
+        for (path, _, _), (_, n) in self._items.items():
+            out[path] = out.get(path, 0) + n
+        return out
+
+    def __len__(self):
+        return len(self._items)
+
+
+# プロセス内で共有する描画キャッシュ（タブ間で共有）
+raster_cache = RasterCache()
+
+
+class RenderService:
+    """ページ描画をワーカープロセスで非同期に行う。
+
+    実行中の依頼は常に1件だけ。その間に来た依頼は最新の1件だけを残し、
+    それ以前のものは捨てる（実行中・未着手の依頼に含まれる依頼は出し直さない）。
+    結果は after による確認で Tk スレッドに渡す（描き終わった結果は古くても渡す）。
+    """
+    def __init__(self, app, on_ready):
+        self.app = app
+        self.on_ready = on_ready      # on_ready(RenderResult) は Tk スレッドで呼ばれる
+        self._executor = None
+        self._running = None          # (RenderRequest, Future)
+        self._pending = None          # 次に送る RenderRequest
+        self._serial = 0
+        self._poll_id = None
+        self.dropped = 0              # 描画せずに捨てた依頼の数
+
+    # ---------- ワーカー ----------
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1)
+        return self._executor
+
+    def warm_up(self):
+        """ワーカープロセスを先に起動しておく（初回描画の待ちを減らす）"""
+        try:
+            self._pool().submit(_noop)
+        except Exception:
+            self._executor = None
+
+    def shutdown(self):
+        if self._poll_id is not None:
+            self.app.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ---------- 依頼 ----------
+    def request(self, path, page_index, source_page, scale, clip=None):
+        """描画を依頼する。以前の未着手の依頼はこれで置き換わる。
+        実行中・未着手の依頼の範囲に含まれる依頼は出し直さない（ドラッグ中の再描画で
+        同じ依頼が続いても、実行中の描画を捨て続けないように）"""
+        for queued in (self._pending, self._running[0] if self._running else None):
+            if queued is not None and _contains(queued, path, source_page, scale, clip):
+                if queued is not self._pending and self._pending is not None:
+                    # 実行中のもので足りるので、それより後の依頼は要らない
+                    self._pending = None
+                    self.dropped += 1
+                return queued
+        self._serial += 1
+        req = RenderRequest(path, page_index, source_page, scale, clip, self._serial)
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = req
+        if self._running is None:
+            self._submit_pending()
+        self._schedule_poll()
+        return req
+
+    def is_current(self, req):
+        """まだ新しい依頼に置き換えられていないか"""
+        return req.serial == self._serial
+
+    def _submit_pending(self):
+        req, self._pending = self._pending, None
+        if req is None:
+            return
+        try:
+            fut = self._pool().submit(rasterize, req.path, req.source_page, req.scale, req.clip)
+        except Exception:
+            # ワーカーが使えない環境では同期描画にフォールバック
+            self._executor = None
+            self._deliver(req, self._rasterize_here(req))
+            return
+        self._running = (req, fut)
+
+    # ---------- 結果の受け取り（Tk スレッド） ----------
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.app.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        if self._running is not None:
+            req, fut = self._running
+            if not fut.done():
+                self._schedule_poll()
+                return
+            self._running = None
+            # 新しい依頼が来ていても結果は渡す（受け取り側でキャッシュに入れ、
+            # 表示中のページ・倍率と合えば差し替える。描き終わったものは捨てない）
+            try:
+                data = fut.result()
+            except Exception:
+                # ワーカーが落ちた等：プールを作り直して同期描画
+                self._executor = None
+                data = self._rasterize_here(req) if self.is_current(req) else None
+            if data is not None:
+                self._deliver(req, data)
+
+        if self._pending is not None:
+            self._submit_pending()
+        if self._running is not None or self._pending is not None:
+            self._schedule_poll()
+
+    def _rasterize_here(self, req):
+        """本体プロセスで開いている文書から描画する（フォールバック用）"""
+        if req.path == self.app.pdf_path and self.app.doc:
+            return _pixmap_data(self.app.doc.load_page(req.page_index), req.scale, req.clip)
+        # 依頼のあとでタブが切り替わった
+        import fitz
+        with fitz.open(req.path) as doc:
+            return _pixmap_data(doc.load_page(req.source_page), req.scale, req.clip)
+
+    def _deliver(self, req, data):
+        from PIL import Image
+        w, h, samples, elapsed = data
+        img = Image.frombytes("RGB", (w, h), samples)
+        self.on_ready(RenderResult(req, img, elapsed))
+
+
+def render_clip(page_rect, scale, view):
+    """描画範囲を決める。ページ全体が大きすぎるときだけ表示範囲＋余白に絞る（PDF座標）"""
+    px0, py0, px1, py1 = page_rect
+    if (px1 - px0) * (py1 - py0) * scale * scale <= FULL_PAGE_MAX_PIXELS:
+        return None
+    vx0, vy0, vx1, vy1 = view
+    mx = (vx1 - vx0) * CLIP_MARGIN
+    my = (vy1 - vy0) * CLIP_MARGIN
+    # 同じ位置で再依頼したときにキーが一致するよう 1pt 単位に丸める
+    x0 = max(px0, int(vx0 - mx))
+    y0 = max(py0, int(vy0 - my))
+    x1 = min(px1, int(vx1 + mx) + 1)
+    y1 = min(py1, int(vy1 + my) + 1)
+    if x1 <= x0 or y1 <= y0:
+        return (px0, py0, px0 + 1, py0 + 1)
+    return (x0, y0, x1, y1)
@@ -0,0 +1,236 @@
+# search_manager.py
+# 図面の文字検索：索引をワーカーで裏で作り、ヒットしたページへ移動して強調表示する
+#   索引はPDFごとに持つ（タブを切り替えても作り直さない）
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from text_index import TextIndex, extract_words, index_path_for, pdf_signature
+
+# 1回のワーカー処理で読むページ数
+INDEX_CHUNK_PAGES = 16
+# 索引作成のワーカー数の上限
+INDEX_MAX_WORKERS = 4
+# 結果の確認間隔（ミリ秒）
+POLL_MS = 100
+# 失敗したページ範囲を投入し直す回数
+INDEX_RETRIES = 1
+
+
+class SearchManager:
+    def __init__(self, app):
+        self.app = app
+        self._indexes = {}          # pdf_path -> TextIndex
+        self._executor = None
+        self._futures = []          # [(pdf_path, ページ範囲, 残りの再試行回数, Future), ...]
+        self._failed = {}           # pdf_path -> (索引を作れなかったページの集合, 最後のエラー)
+        self._poll_id = None
+        self.hits = []
+        self.hit_pos = -1
+        self.last_query = None
+        self.current_hit = None     # (表示ページ番号, 矩形[PDF座標])
+
+    @property
+    def index(self):
+        """表示中のPDFの索引（なければ None）"""
+        return self._indexes.get(self.app.pdf_path)
+
+    # ---------- 索引の作成（バックグラウンド） ----------
+    def start_index(self):
+        """開いているPDFの索引を用意する（保存済みがあれば読み、足りないページだけ作る）"""
+        self.forget_hits()
+        app = self.app
+        path = app.pdf_path
+        if not path:
+            return
+        self._cancel(path)
+        self._failed.pop(path, None)
+
+        sig = pdf_signature(path)
+        index = self._indexes.get(path)
+        if index is None or index.pdf_signature != sig:
+            project = app.model.project_path
+            index = TextIndex.load(index_path_for(project), sig) if project else None
+            if index is None:
+                index = TextIndex(sig)
+            self._indexes[path] = index
+
+        todo = [p for p in app.page_map if p not in index.pages]
+        if not todo:
+            return
+        try:
+            if self._executor is None:
+                workers = max(1, min(INDEX_MAX_WORKERS, (os.cpu_count() or 2) - 1))
+                self._executor = ProcessPoolExecutor(max_workers=workers)
+            for i in range(0, len(todo), INDEX_CHUNK_PAGES):
+                self._submit(path, todo[i:i + INDEX_CHUNK_PAGES], INDEX_RETRIES)
+        except Exception as e:
+            # ワーカーが使えない環境では索引なし（検索は索引済みのページだけ）
+            self._executor = None
+            self._mark_failed(path, todo, e)
+            return
+        self._schedule_poll()
+
+    def _submit(self, path, chunk, retries):
+        self._futures.append((path, chunk, retries, self._executor.submit(extract_words, path, chunk)))
+
+    def _mark_failed(self, path, chunk, error):
+        """索引を作れなかったページを覚えておく（索引には入れず、次に開いたときに作り直す）"""
+        pages, _ = self._failed.get(path, (set(), None))
+        pages.update(chunk)
+        self._failed[path] = (pages, str(error))
+        print(f"FAIL text index {path} pages {min(chunk) + 1}-{max(chunk) + 1}: {error}", file=sys.stderr)
+
+    def _cancel(self, path=None):
+        """path（None ならすべて）の索引作成を取りやめる"""
+        keep = []
+        for item in self._futures:
+            if path is None or item[0] == path:
+                item[3].cancel()
+            else:
+                keep.append(item)
+        self._futures = keep
+
+    def drop(self, path):
+        """タブを閉じたPDFの索引を捨てる"""
+        self._cancel(path)
+        self._indexes.pop(path, None)
+        self._failed.pop(path, None)
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.app.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        remaining = []
+        finished = set()
+        done = []
+        for item in self._futures:
+            (done if item[3].done() else remaining).append(item)
+        self._futures = remaining
+        for path, chunk, retries, fut in done:
+            finished.add(path)
+            index = self._indexes.get(path)
+            try:
+                pages = fut.result()
+            except Exception as e:
+                # 失敗したページ範囲は投入し直し、それでも駄目なら索引なしのページとして覚える
+                # （済んだことにすると、検索がそのページを黙って見落とす）
+                if retries > 0 and self._executor is not None:
+                    try:
+                        self._submit(path, chunk, retries - 1)
+                        continue
+                    except Exception:
+                        # ワーカーが落ちてプールが使えない：次の start_index で作り直す
+                        self._executor.shutdown(wait=False, cancel_futures=True)
+                        self._executor = None
+                self._mark_failed(path, chunk, e)
+                continue
+            if index is not None:
+                for pno, words in pages:
+                    index.add_page(pno, words)
+        if self._futures:
+            self._schedule_poll()
+        current = self.app.pdf_path
+        if current not in finished:
+            return
+        if not self._building(current):
+            # 表示中のPDFの分ができあがったらプロジェクトの隣に保存
+            self.save_index()
+        self.app.set_status(self.progress_text())
+
+    def _building(self, path):
+        return any(item[0] == path for item in self._futures)
+
+    def progress_text(self):
+        index = self.index
+        if index is None:
+            return ""
+        if self._building(self.app.pdf_path):
+            return f"文字索引を作成中… {len(index)} / {len(self.app.page_map)} ページ"
+        failed = self._failed.get(self.app.pdf_path)
+        if failed:
+            return f"文字索引: {len(index)} ページ（{len(failed[0])} ページは索引を作れませんでした: {failed[1]}）"
+        return f"文字索引: {len(index)} ページ"
+
+    def save_index(self, project_path=None):
+        """索引をプロジェクトJSONの隣（<名前>.textindex）に保存"""
+        project_path = project_path or self.app.model.project_path
+        index = self.index
+        if index is None or not project_path or not len(index):
+            return
+        try:
+            index.save(index_path_for(project_path))
+        except OSError:
+            pass
+
+    def shutdown(self):
+        self._cancel()
+        if self._poll_id is not None:
+            self.app.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ---------- 検索 ----------
+    def forget_hits(self):
+        """ページ削除などで表示ページ番号が変わったら検索し直させる"""
+        self.hits, self.hit_pos, self.last_query, self.current_hit = [], -1, None, None
+
+    def search(self, query):
+        """検索して最初のヒットへ移動。同じ語でもう一度呼ぶと次のヒットへ"""
+        query = query.strip()
+        if not query or self.index is None:
+            return None
+        app = self.app
+        if query != self.last_query:
+            # 削除したページのヒットは除き、表示ページの順に並べる
+            pos = {src: i for i, src in enumerate(app.page_map)}
+            hits = [(pos[h.source_page], h) for h in self.index.search(query) if h.source_page in pos]
+            hits.sort(key=lambda ph: (ph[0], ph[1].rect[1], ph[1].rect[0]))
+            self.hits = hits
+            self.hit_pos = 0
+            self.last_query = query
+        elif self.hits:
+            self.hit_pos = (self.hit_pos + 1) % len(self.hits)
+
+        if not self.hits:
+            self.current_hit = None
+            app.set_status(f"検索: 「{query}」は見つかりません  {self.progress_text()}")
+            app.display_page()
+            return None
+
+        page, hit = self.hits[self.hit_pos]
+        self.jump_to(page, hit.rect)
+        app.set_status(f"検索: 「{query}」 {self.hit_pos + 1} / {len(self.hits)}  (p.{page + 1} {hit.text})"
+                       f"  {self.progress_text()}")
+        return hit
+
+    def jump_to(self, page_index, rect):
+        """ページへ移動し、rect（PDF座標）がキャンバス中央に来るようにして強調表示"""
+        app = self.app
+        if page_index != app.page_index:
+            app.page_index = page_index
+            app.selected_shape = None
+            app.selection = []
+            app.shapes.clear_handles()
+        x0, y0, x1, y1 = rect
+        cw = app.canvas.winfo_width() or 1
+        ch = app.canvas.winfo_height() or 1
+        app.offset_x = cw / 2 - (x0 + x1) / 2 * app.scale
+        app.offset_y = ch / 2 - (y0 + y1) / 2 * app.scale
+        self.current_hit = (page_index, rect)
+        app.display_page()
+
+    def draw_highlight(self):
+        """現在のヒットが表示中ページにあれば枠で囲む"""
+        app = self.app
+        if not self.current_hit or self.current_hit[0] != app.page_index:
+            return
+        x0, y0, x1, y1 = self.current_hit[1]
+        cx0, cy0 = app.pdf_to_canvas(x0, y0)
+        cx1, cy1 = app.pdf_to_canvas(x1, y1)
+        pad = 3
+        app.canvas.create_rectangle(cx0 - pad, cy0 - pad, cx1 + pad, cy1 + pad,
+                                    outline="#ffaa00", width=3, tags="search")
@@ -1,33 +1,278 @@
 # shape_manager.py
+# 図形の描画・ハンドル・当たり判定（キャンバス座標）。状態と計算は DocumentModel に任せる
 import uuid
-import math
-from utils_geometry import point_in_triangle, dist_point_to_segment
-from math_eval import MathEvalError, eval_and_truncate_3
+import polygon_lod
+from document_model import shape_bounds, TEXT_SIZE, TEXT_LINE_HEIGHT, text_width_em
+from perf_monitor import monitor
+
+# 多角形の頂点ハンドルを描く上限（画面内の頂点がこれより多ければ拡大するまで出さない）
+MAX_VERTEX_HANDLES = 300
+
+# ---- 縮小表示の簡略化（画面上のピクセル）----
+# 表示範囲の外側でも描く余白（線幅・名前ラベルのはみ出し分）
+CULL_MARGIN_PX = 16
+# 文字の大きさがこれ未満なら文字を描かず、行ごとの帯で表す
+LOD_TEXT_PX = 6
+# 図形の大きさがこれ未満なら点で表す
+LOD_SHAPE_PX = 3
+# 図形の大きさがこれ未満なら名前ラベルを出さない
+LOD_LABEL_PX = 24
+# 表示範囲の索引の升目の大きさ（PDF座標）
+CULL_CELL = 128
+# これより多くの升目にかかる大きな図形は升目に入れず、毎回調べる
+CULL_MAX_CELLS = 64
+
+
+class _CullGrid:
+    """図形の外接矩形の格子索引。表示範囲にかかる図形だけを、ページ全体をなめずに拾う"""
+
+    def __init__(self, shapes, text_size, key):
+        self.key = key
+        self.shapes = shapes
+        self.bounds = [shape_bounds(s, text_size) for s in shapes]
+        self.pos = {id(s): i for i, s in enumerate(shapes)}
+        self.cells = {}
+        self.large = []                 # 升目に入れない図形（大きいもの・外接矩形のないもの）
+        c = CULL_CELL
+        cells = self.cells
+        ext = None
+        for i, b in enumerate(self.bounds):
+            if b is None:
+                self.large.append(i)
+                continue
+            if ext is None:
+                ext = list(b)
+            else:
+                if b[0] < ext[0]: ext[0] = b[0]
+                if b[1] < ext[1]: ext[1] = b[1]
+                if b[2] > ext[2]: ext[2] = b[2]
+                if b[3] > ext[3]: ext[3] = b[3]
+            cx0, cy0, cx1, cy1 = int(b[0] // c), int(b[1] // c), int(b[2] // c), int(b[3] // c)
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > CULL_MAX_CELLS:
+                self.large.append(i)
+                continue
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cell = cells.get((cx, cy))
+                    if cell is None:
+                        cells[(cx, cy)] = [i]
+                    else:
+                        cell.append(i)
+        self.extent = ext
+
+    def query(self, vx0, vy0, vx1, vy1):
+        """外接矩形が表示範囲にかかる図形の番号（重なり順）"""
+        bounds = self.bounds
+        ext = self.extent
+        if ext is None:
+            return list(self.large)
+        if vx0 <= ext[0] and vy0 <= ext[1] and vx1 >= ext[2] and vy1 >= ext[3]:
+            # ページ全体が見えている
+            return list(range(len(bounds)))
+        c = CULL_CELL
+        cx0, cy0, cx1, cy1 = int(vx0 // c), int(vy0 // c), int(vx1 // c), int(vy1 // c)
+        found = set(self.large)
+        cells = self.cells
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(cells):
+            for (cx, cy), cell in cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found.update(cell)
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cell = cells.get((cx, cy))
+                    if cell:
+                        found.update(cell)
+        out = []
+        for i in sorted(found):
+            b = bounds[i]
+            if b is None or not (b[2] < vx0 or b[0] > vx1 or b[3] < vy0 or b[1] > vy1):
+                out.append(i)
+        return out
+
 
 class ShapeManager:
     def __init__(self, app):
         self.app = app
         self.triangle_points = []
         self.tri_preview_ids = []
+        self.polygon_points = []    # 作成中の多角形の頂点（PDF座標）
+        self.poly_preview_ids = []
         self.handles_ids = []
         self.handle_targets = []
         self.active_handle = None
         self.shapes = [] 
+        self.drawn_count = 0        # 直近の draw_page_shapes で描いた図形の数
+        self._grid = None           # 表示中ページの _CullGrid
+        self.group_shapes = None    # グループ移動中の図形（複数選択のドラッグ）
+        self.group_ids = None
+        self.group_offset = [0, 0]  # グループをキャンバス上でずらした量（ピクセル）
+
+    @property
+    def model(self):
+        return self.app.model
 
     # =====================================================
     # 図形追加
     # =====================================================
     def append_shape(self, s):
-        """図形をページに追加して再描画"""
-        self.update_shape_value(s)
-        s.setdefault("color", "black")
-        self.app.shapes_by_page.setdefault(self.app.page_index, []).append(s)
+        """図形をページに追加して再描画（Ctrl+Z で取り消せる）"""
+        self.model.add_shape(self.app.page_index, s, label="追加")
         self.app.display_page(highlight_shape=s)
 
+    def remove_shape(self, s, page=None, label=None):
+        """図形をページから削除し、それを参照していた式を再計算"""
+        if page is None:
+            page = self.app.page_index
+        self.model.remove_shape(s, page, label)
+
     # =====================================================
     # 図形描画
     # =====================================================
-    def draw_shape(self, s, highlight=False):
+    def view_bounds(self):
+        """キャンバスに見えている範囲＋余白（PDF座標）"""
+        app = self.app
+        w = app.canvas.winfo_width() or 1
+        h = app.canvas.winfo_height() or 1
+        m = CULL_MARGIN_PX
+        x0, y0 = app.canvas_to_pdf(-m, -m)
+        x1, y1 = app.canvas_to_pdf(w + m, h + m)
+        return x0, y0, x1, y1
+
+    def _text_size_pdf(self):
+        """描画するときの文字の大きさ（PDF座標）。draw_shape の max(10, 14*scale) に合わせる"""
+        return max(TEXT_SIZE, 10 / self.app.scale)
+
+    def _cull_grid(self, shapes, text_size):
+        """ページの図形の格子索引。図形の増減・選択の切り替え・文字の大きさの変化で作り直す
+        （ドラッグで動くのは選択中の図形だけで、それは索引によらず常に描く）"""
+        key = (self.model.revision, id(shapes), len(shapes), text_size, id(self.app.selected_shape))
+        grid = self._grid
+        if grid is None or grid.key != key or grid.shapes is not shapes:
+            grid = self._grid = _CullGrid(shapes, text_size, key)
+        return grid
+
+    def draw_page_shapes(self, shapes, highlight_shape=None):
+        """表示範囲にかかる図形だけを描く（選択中・強調中の図形は常に描く）。
+        小さく見える図形は点、読めない大きさのテキストは帯で表す"""
+        app = self.app
+        cv = app.canvas
+        scale = app.scale
+        selected = app.selected_shape
+        grid = self._cull_grid(shapes, self._text_size_pdf())
+        order = grid.query(*self.view_bounds())
+        for s in (highlight_shape, selected):
+            i = grid.pos.get(id(s)) if s is not None else None
+            if i is not None and i not in order:
+                order.append(i)
+                order.sort()
+
+        bounds = grid.bounds
+        tiny = LOD_SHAPE_PX / scale
+        bars = TEXT_SIZE * scale < LOD_TEXT_PX
+        ox, oy = app.offset_x, app.offset_y
+        group = self.group_ids
+        for i in order:
+            s = shapes[i]
+            b = bounds[i]
+            if group and id(s) in group:
+                continue
+            if s is highlight_shape or s is selected:
+                self.draw_shape(s, highlight=True, bounds=b)
+            elif s["type"] == "text":
+                if bars:
+                    self._draw_text_bars(s, s.get("color", app.current_color))
+                else:
+                    self.draw_shape(s, bounds=b)
+            elif b is not None and b[2] - b[0] < tiny and b[3] - b[1] < tiny:
+                x = (b[0] + b[2]) / 2 * scale + ox
+                y = (b[1] + b[3]) / 2 * scale + oy
+                cv.create_rectangle(x - 1, y - 1, x + 1, y + 1, outline="",
+                                    fill=s.get("color", app.current_color))
+            else:
+                self.draw_shape(s, bounds=b)
+        if app.selection:
+            marked = {id(s) for s in app.selection}
+            if group:
+                marked -= group
+            self._draw_selection_marks([bounds[i] for i in order if id(shapes[i]) in marked])
+        if group:
+            self._draw_group()
+        self.drawn_count = len(order)
+        return len(order)
+
+    def _draw_selection_marks(self, bounds):
+        """複数選択中の図形を点線の枠で囲む"""
+        app = self.app
+        scale, ox, oy = app.scale, app.offset_x, app.offset_y
+        for b in bounds:
+            if b is None:
+                continue
+            app.canvas.create_rectangle(b[0] * scale + ox - 3, b[1] * scale + oy - 3,
+                                        b[2] * scale + ox + 3, b[3] * scale + oy + 3,
+                                        outline="#0078d7", dash=(3, 2), tags="selection")
+
+    # =====================================================
+    # グループ移動（複数選択をまとめてドラッグ）
+    # =====================================================
+    def begin_group_drag(self, shapes):
+        """ドラッグ中は選択図形を "group" タグでまとめて描き、canvas.move でずらす
+        （動かすたびにページを描き直さない。図形の座標は end_group_drag のあとで1回だけ変える）"""
+        self.group_shapes = shapes
+        self.group_ids = {id(s) for s in shapes}
+        self.group_offset = [0, 0]
+
+    def move_group(self, dx, dy):
+        """グループをキャンバス上で (dx, dy) ピクセルずらす"""
+        self.group_offset[0] += dx
+        self.group_offset[1] += dy
+        self.app.canvas.move("group", dx, dy)
+
+    def end_group_drag(self):
+        """グループ移動を終え、ずらした量（PDF座標）を返す"""
+        scale = self.app.scale
+        dx, dy = self.group_offset
+        self.group_shapes = self.group_ids = None
+        self.group_offset = [0, 0]
+        return dx / scale, dy / scale
+
+    def _draw_group(self):
+        cv = self.app.canvas
+        # 作った項目の番号は連番なので、目印の間の項目にタグを付ける
+        first = cv.create_line(0, 0, 0, 0)
+        for s in self.group_shapes:
+            self.draw_shape(s)
+        self._draw_selection_marks([shape_bounds(s) for s in self.group_shapes])
+        last = cv.create_line(0, 0, 0, 0)
+        for item in range(first + 1, last):
+            cv.addtag_withtag("group", item)
+        cv.delete(first, last)
+        if self.group_offset != [0, 0]:
+            # ドラッグ中に描き直したときは、ずらした位置に描く
+            cv.move("group", *self.group_offset)
+
+    # =====================================================
+    # 範囲選択（矩形・投げ縄）
+    # =====================================================
+    def shapes_in_region(self, x0, y0, x1, y1, lasso=None):
+        """PDF座標の矩形に収まる図形。lasso（頂点の並び）があれば、さらに外接矩形の中心が
+        その内側にある図形だけ。表示範囲の格子索引で候補を絞るので、ページ全体はなめない"""
+        shapes = self.model.shapes_on(self.app.page_index)
+        grid = self._cull_grid(shapes, self._text_size_pdf())
+        area = polygon_lod.PolygonGeometry(lasso) if lasso and len(lasso) >= 3 else None
+        bounds = grid.bounds
+        out = []
+        for i in grid.query(x0, y0, x1, y1):
+            b = bounds[i]
+            if b is None or b[0] < x0 or b[1] < y0 or b[2] > x1 or b[3] > y1:
+                continue
+            if area is not None and not area.contains((b[0] + b[2]) / 2, (b[1] + b[3]) / 2):
+                continue
+            out.append(shapes[i])
+        return out
+
+    @monitor.timed("draw_shape")
+    def draw_shape(self, s, highlight=False, bounds=None):
         t = s["type"]
         cv = self.app.canvas
         color = s.get("color", self.app.current_color)
@@ -61,6 +306,19 @@ class ShapeManager:
             if highlight:
                 self._draw_triangle_handles(pts)
 
+        elif t == "polygon":
+            # 縮小表示では前計算した簡略化輪郭を描く
+            idx = polygon_lod.geometry(s).outline(scale)
+            pts = s["points"] if idx is None else [s["points"][i] for i in idx]
+            ox, oy = self.app.offset_x, self.app.offset_y
+            flat = []
+            for x, y in pts:
+                flat.append(x * scale + ox)
+                flat.append(y * scale + oy)
+            cv.create_polygon(*flat, outline=color, fill="", width=width)
+            if highlight:
+                self._draw_polygon_handles(s, idx)
+
         elif t == "text":
             x, y = self.app.pdf_to_canvas(s["x"], s["y"])
             size = max(10, int(14 * scale))
@@ -83,6 +341,33 @@ class ShapeManager:
                 # ハンドル（四隅）
                 self._draw_rect_handles(x1, y1, x2, y2)
 
+        # --- 名前付き図形は名前を左上に表示（数式からの参照用、小さく見えるときは省く）---
+        if s.get("name") and t != "text" and (highlight or self._label_visible(s, bounds)):
+            if t == "line":
+                nx, ny = self.app.pdf_to_canvas(s["x1"], s["y1"])
+            elif t in ("triangle", "polygon"):
+                nx, ny = self.app.pdf_to_canvas(*s["points"][0])
+            else:
+                nx, ny = self.app.pdf_to_canvas(s["x"], s["y"])
+            cv.create_text(nx, ny - 2, anchor="sw", text=s["name"], fill=color, font=("Arial", 10, "bold"))
+
+    def _label_visible(self, s, bounds):
+        b = bounds or shape_bounds(s)
+        return b is None or max(b[2] - b[0], b[3] - b[1]) * self.app.scale >= LOD_LABEL_PX
+
+    def _draw_text_bars(self, s, color):
+        """読めない大きさのテキストを、行ごとの細い帯で表す"""
+        cv = self.app.canvas
+        size = TEXT_SIZE * self.app.scale
+        lh = size * TEXT_LINE_HEIGHT
+        x, y = self.app.pdf_to_canvas(s["x"], s["y"])
+        for i, line in enumerate(str(s.get("text", "")).split("\n")):
+            if not line.strip():
+                continue
+            top = y + i * lh + lh * 0.3
+            cv.create_rectangle(x, top, x + max(1, text_width_em(line) * size),
+                                top + max(1, lh * 0.4), outline="", fill=color)
+
     # =====================================================
     # 計算式を同色で追加（図形近くに配置）
     # =====================================================
@@ -91,10 +376,10 @@ class ShapeManager:
         app = self.app
 
         # --- テキストの配置位置を図形タイプ別に決定 ---
-        if t == "triangle":
+        if t in ("triangle", "polygon"):
             pts = s["points"]
-            avg_x = sum(x for x, _ in pts) / 3
-            avg_y = sum(y for _, y in pts) / 3 - 20
+            avg_x = sum(x for x, _ in pts) / len(pts)
+            avg_y = sum(y for _, y in pts) / len(pts) - 20
             tx, ty = avg_x, avg_y
         elif t == "line":
             tx = (s["x1"] + s["x2"]) / 2
@@ -141,31 +426,46 @@ class ShapeManager:
         for i, (x, y) in enumerate(pts):
             self._draw_handle(x, y, self.app.selected_shape, i)
 
+    def _draw_polygon_handles(self, s, idx):
+        """画面内の頂点にハンドル（簡略化表示中は残した頂点だけ）"""
+        app = self.app
+        w = app.canvas.winfo_width() or 1
+        h = app.canvas.winfo_height() or 1
+        pts = s["points"]
+        visible = []
+        for i in (range(len(pts)) if idx is None else idx):
+            x, y = app.pdf_to_canvas(*pts[i])
+            if 0 <= x <= w and 0 <= y <= h:
+                visible.append((i, x, y))
+                if len(visible) > MAX_VERTEX_HANDLES:
+                    return
+        for i, x, y in visible:
+            self._draw_handle(x, y, self.app.selected_shape, i)
+
     # =====================================================
     # ハンドル検出
     # =====================================================
     def detect_handle(self, cx, cy):
         """クリック位置(cx, cy)がハンドル上か判定"""
-        if not hasattr(self, "handles_ids") or not self.handles_ids:
+        if not self.handle_targets:
             return False
 
-        valid_handles = []
-        for hid in self.handles_ids:
-            coords = self.app.canvas.coords(hid)
+        # 再描画で消えたハンドルを除く
+        valid = []
+        for target in self.handle_targets:
+            coords = self.app.canvas.coords(target[0])
             if len(coords) == 4:  # 有効なハンドルのみ
-                valid_handles.append(hid)
-        self.handles_ids = valid_handles
+                valid.append((target, coords))
+        self.handle_targets = [t for t, _ in valid]
+        self.handles_ids = [t[0] for t in self.handle_targets]
 
         shape = getattr(self.app, "selected_shape", None)
         if not shape:
             return False
 
-        for idx, hid in enumerate(self.handles_ids):
-            coords = self.app.canvas.coords(hid)
-            if len(coords) != 4:
-                continue
-            x1, y1, x2, y2 = coords
-            if x1 <= cx <= x2 and y1 <= cy <= y2:
+        # ハンドルの番号は描いたときの頂点番号（多角形の簡略化表示では飛び飛び）
+        for (hid, s, idx), (x1, y1, x2, y2) in valid:
+            if s is shape and x1 <= cx <= x2 and y1 <= cy <= y2:
                 self.active_handle = (shape, idx)
                 return True
         return False
@@ -184,117 +484,38 @@ class ShapeManager:
     # ハンドルによるリサイズ処理
     # =====================================================
     def resize_by_handle(self, shape, idx, cx, cy):
-        t = shape["type"]
         px, py = self.app.canvas_to_pdf(cx, cy)
-
-        if t == "rect":
-            x, y, w, h = shape["x"], shape["y"], shape["w"], shape["h"]
-            if idx == 0:  # 左上
-                shape["w"] = (x + w) - px
-                shape["h"] = (y + h) - py
-                shape["x"], shape["y"] = px, py
-            elif idx == 1:  # 右上
-                shape["w"] = px - x
-                shape["h"] = (y + h) - py
-                shape["y"] = py
-            elif idx == 2:  # 右下
-                shape["w"] = px - x
-                shape["h"] = py - y
-            elif idx == 3:  # 左下
-                shape["x"] = px
-                shape["w"] = (x + w) - px
-                shape["h"] = py - y
-
-        elif t == "ellipse":
-            x, y, w, h = shape["x"], shape["y"], shape["w"], shape["h"]
-            if idx == 0:
-                shape["y"] = py
-                shape["h"] = (y + h) - py
-            elif idx == 1:
-                shape["w"] = px - x
-            elif idx == 2:
-                shape["h"] = py - y
-            elif idx == 3:
-                shape["x"] = px
-                shape["w"] = (x + w) - px
-
-        elif t == "line":
-            if idx == 0:
-                shape["x1"], shape["y1"] = px, py
-            elif idx == 1:
-                shape["x2"], shape["y2"] = px, py
-
-        elif t == "triangle":
-            shape["points"][idx] = (px, py)
-
+        self.model.resize_shape(shape, idx, px, py, self.app.page_index)
         self.app.display_page(highlight_shape=shape)
-        self.app.shapes.update_shape_value(shape)
 
     # =====================================================
     # 図形クリック検出（選択判定）
     # =====================================================
+    @monitor.timed("find_shape")
     def find_shape(self, cx, cy):
-        for s in reversed(self.app.shapes_by_page.get(self.app.page_index, [])):
-            t = s["type"]
-
-            if t == "rect":
-                x1, y1 = self.app.pdf_to_canvas(s["x"], s["y"])
-                x2, y2 = self.app.pdf_to_canvas(s["x"] + s["w"], s["y"] + s["h"])
-                if dist_point_to_segment(cx, cy, x1, y1, x2, y1) < 6 or \
-                   dist_point_to_segment(cx, cy, x2, y1, x2, y2) < 6 or \
-                   dist_point_to_segment(cx, cy, x2, y2, x1, y2) < 6 or \
-                   dist_point_to_segment(cx, cy, x1, y2, x1, y1) < 6:
-                    return s, "edge"
-                if x1 <= cx <= x2 and y1 <= cy <= y2:
-                    return s, "inside"
-
-            elif t == "ellipse":
-                x1, y1 = self.app.pdf_to_canvas(s["x"], s["y"])
-                x2, y2 = self.app.pdf_to_canvas(s["x"] + s["w"], s["y"] + s["h"])
-                cx0, cy0 = (x1 + x2) / 2, (y1 + y2) / 2
-                rx, ry = abs(x2 - x1) / 2, abs(y2 - y1) / 2
-                d = ((cx - cx0) ** 2) / (rx ** 2) + ((cy - cy0) ** 2) / (ry ** 2)
-                if abs(d - 1.0) < 0.05:
-                    return s, "edge"
-                if d < 1.0:
-                    return s, "inside"
-
-            elif t == "line":
-                x1, y1 = self.app.pdf_to_canvas(s["x1"], s["y1"])
-                x2, y2 = self.app.pdf_to_canvas(s["x2"], s["y2"])
-                if dist_point_to_segment(cx, cy, x1, y1, x2, y2) < 6:
-                    return s, "edge"
-
-            elif t == "triangle":
-                pts = [self.app.pdf_to_canvas(x, y) for x, y in s["points"]]
-                if point_in_triangle((cx, cy), *pts):
-                    return s, "inside"
-                for i in range(3):
-                    x1, y1 = pts[i]
-                    x2, y2 = pts[(i + 1) % 3]
-                    if dist_point_to_segment(cx, cy, x1, y1, x2, y2) < 6:
-                        return s, "edge"
-
-            elif t == "text":
-                x, y = self.app.pdf_to_canvas(s["x"], s["y"])
-                size = int(14 * self.app.scale)
-
-                # 1) 仮の text を描いて bbox を取得
-                tid = self.app.canvas.create_text(
-                    x, y,
-                    anchor="nw",
-                    text=s["text"],
-                    font=("Arial", size),
-                    fill=s.get("color", "black"),
-                )
-                x1, y1, x2, y2 = self.app.canvas.bbox(tid)
-                self.app.canvas.delete(tid)
-
-                # 2) クリック座標が bbox に入っていればヒット
-                if x1 <= cx <= x2 and y1 <= cy <= y2:
-                    return s, "inside"
-
-        return None, None
+        """キャンバス座標 (cx, cy) の図形を探す（許容距離は画面上で 6px）"""
+        px, py = self.app.canvas_to_pdf(cx, cy)
+        return self.model.hit_test(
+            self.app.page_index, px, py, tol=6 / self.app.scale, text_bbox=self._text_bbox
+        )
+
+    def _text_bbox(self, s):
+        """テキストを仮に描いて実際の矩形を得る（PDF座標）"""
+        cv = self.app.canvas
+        x, y = self.app.pdf_to_canvas(s["x"], s["y"])
+        size = int(14 * self.app.scale)
+        tid = cv.create_text(
+            x, y,
+            anchor="nw",
+            text=s["text"],
+            font=("Arial", size),
+            fill=s.get("color", "black"),
+        )
+        x1, y1, x2, y2 = cv.bbox(tid)
+        cv.delete(tid)
+        px1, py1 = self.app.canvas_to_pdf(x1, y1)
+        px2, py2 = self.app.canvas_to_pdf(x2, y2)
+        return px1, py1, px2, py2
 
     # =====================================================
     # 三角形プレビュー
@@ -319,142 +540,53 @@ class ShapeManager:
             )
 
     # =====================================================
-    # value（面積・長さ・計算結果）を更新する汎用関数（完全版）
+    # 多角形プレビュー
     # =====================================================
-    def update_shape_value(self, s):
-        if not s:
-            return
-
-        t = s.get("type")
-
-        # -------------------------------------------
-        # 図形タイプが text 以外で、
-        # ユーザー入力で value を固定している場合は上書きしない
-        # （手入力した寸法・面積を尊重する）
-        # -------------------------------------------
-        if t != "text" and s.get("manual_value"):
-            return
-
-        # ===========================
-        #  TEXT（数式評価もここで統一）
-        # ===========================
-        if t == "text":
-            raw = s.get("text", "")
-            if raw is None:
-                s["value"] = None
-                return
-
-            raw = raw.strip()
-            if raw == "":
-                s["value"] = None
-                return
-
-            # "= のついた式は表示形式（例: '5+3=' → '5+3=8'）
-            if raw.endswith("="):
-                expr = raw[:-1]
-                try:
-                    val = eval_and_truncate_3(expr)
-                    # 表示を常に正しい計算式に更新
-                    s["text"] = f"{expr}={val}"
-                    s["value"] = val
-                except MathEvalError:
-                    # 表示はそのまま、value だけ None
-                    s["value"] = None
-                return
-
-            # "= なしの純粋な式"
-            try:
-                val = eval_and_truncate_3(raw)
-                # 表示を計算結果にそろえる
-                s["text"] = str(val)
-                s["value"] = val
-            except MathEvalError:
-                # 数式でない → 単なるメモ扱い
-                s["value"] = None
-
-            return
-
-        # ===========================
-        #  RECT（面積）
-        # ===========================
-        if t == "rect":
-            w = abs(s.get("w", 0))
-            h = abs(s.get("h", 0))
-            area = w * h
-            s["value"] = round(area, 5)
+    def show_polygon_preview(self, cx, cy):
+        """多角形作成中に、これまでの辺とカーソルまでの予測線を表示"""
+        cv = self.app.canvas
+        self.clear_polygon_preview()
+        if not self.polygon_points:
             return
+        flat = []
+        for x, y in self.polygon_points:
+            flat.extend(self.app.pdf_to_canvas(x, y))
+        if len(flat) >= 4:
+            self.poly_preview_ids.append(cv.create_line(*flat, fill=self.app.current_color, width=2))
+        self.poly_preview_ids.append(
+            cv.create_line(flat[-2], flat[-1], cx, cy, fill="orange", dash=(4, 2), width=2)
+        )
+        if len(self.polygon_points) >= 2:
+            self.poly_preview_ids.append(
+                cv.create_line(cx, cy, flat[0], flat[1], fill="orange", dash=(2, 4), width=1)
+            )
 
-        # ===========================
-        #  ELLIPSE（円/楕円の面積）
-        # ===========================
-        if t == "ellipse":
-            w = abs(s.get("w", 0))
-            h = abs(s.get("h", 0))
-            r1 = w / 2
-            r2 = h / 2
-            area = math.pi * r1 * r2
-            s["value"] = round(area, 5)
-            return
+    def clear_polygon_preview(self):
+        for pid in self.poly_preview_ids:
+            self.app.canvas.delete(pid)
+        self.poly_preview_ids.clear()
 
-        # ===========================
-        #  LINE（長さ）
-        # ===========================
-        if t == "line":
-            x1, y1 = s.get("x1"), s.get("y1")
-            x2, y2 = s.get("x2"), s.get("y2")
-
-            if None in (x1, y1, x2, y2):
-                s["value"] = None
-                return
-
-            dx = x2 - x1
-            dy = y2 - y1
-            length = math.sqrt(dx * dx + dy * dy)
-            s["value"] = round(length, 5)
-            return
+    # =====================================================
+    # value・参照式（DocumentModel に委譲。page 省略時は表示中ページ）
+    # =====================================================
+    def update_shape_value(self, s, page=None):
+        """value を再計算し、その図形を参照している式も順に再計算する"""
+        if page is None:
+            page = self.app.page_index
+        self.model.update_shape_value(s, page)
 
-        # ===========================
-        #  TRIANGLE（三角形の3点）
-        # ===========================
-        if t == "triangle":
-            pts = s.get("points")
-            if not pts or len(pts) != 3:
-                s["value"] = None
-                return
-
-            try:
-                (x1, y1), (x2, y2), (x3, y3) = pts
-                area = abs(
-                    (x1 * (y2 - y3)
-                     + x2 * (y3 - y1)
-                     + x3 * (y1 - y2)) / 2.0
-                )
-                s["value"] = round(area, 5)
-            except Exception:
-                s["value"] = None
-            return
+    def set_shape_name(self, s, name, page=None):
+        """図形の名前を設定（空なら解除）し、旧名・新名を参照する式を再計算"""
+        if page is None:
+            page = self.app.page_index
+        self.model.set_shape_name(s, name, page)
 
-        # ===========================
-        #  フォールバック（メモなど）
-        # ===========================
-        s["value"] = None
+    def rebuild_graph(self):
+        self.model.rebuild_graph()
 
     def get_slope_factor(self, s, page_index=None):
         """屋根の倍率を返す。shape 個別設定 > ページデフォルト > 1.0"""
-        if not s:
-            return 1.0
-
-        # shape 個別設定があれば優先
-        slope = s.get("slope")
-        if slope is not None:
-            return slope
-
-        # ページデフォルト
         if page_index is None:
             # 呼び出し元からページ指定が無いときは、現在ページを使う
-            page = self.app.page_index
-        else:
-            page = page_index
-
-        return self.app.page_slope_default.get(page, 1.0)
-
+            page_index = self.app.page_index
+        return self.model.get_slope_factor(s, page_index)
@@ -0,0 +1,212 @@
+# snap_index.py
+# PDF のベクタ線（壁・通り芯など）から線分を取り出し、格子状の空間索引でスナップ先を探す。
+#   GUI不要。線分の抽出はワーカープロセス、索引の構築は本体のスレッドで行う想定
+import math
+from array import array
+
+# 格子の1マスの大きさ（PDF座標、pt）
+CELL = 8.0
+# 交点を調べる線分の数の上限（近い順）
+MAX_CROSS_SEGMENTS = 24
+# ベジェ曲線を何本の線分で近似するか
+CURVE_STEPS = 4
+
+
+def _bezier(p0, p1, p2, p3, t):
+    u = 1 - t
+    a, b, c, d = u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t
+    return (a * p0[0] + b * p1[0] + c * p2[0] + d * p3[0],
+            a * p0[1] + b * p1[1] + c * p2[1] + d * p3[1])
+
+
+def extract_segments(page):
+    """ページの描画パスを線分の配列 [x1, y1, x2, y2, ...]（表示と同じ座標）にする"""
+    segs = array("d")
+    add = segs.extend
+    get = getattr(page, "get_cdrawings", None) or page.get_drawings
+    for path in get():
+        for item in path["items"]:
+            kind = item[0]
+            if kind == "l":
+                (x1, y1), (x2, y2) = item[1], item[2]
+                add((x1, y1, x2, y2))
+            elif kind == "re":
+                x0, y0, x1, y1 = item[1]
+                add((x0, y0, x1, y0, x1, y0, x1, y1, x1, y1, x0, y1, x0, y1, x0, y0))
+            elif kind == "qu":
+                ul, ur, ll, lr = [tuple(p) for p in item[1]]
+                for a, b in ((ul, ur), (ur, lr), (lr, ll), (ll, ul)):
+                    add((a[0], a[1], b[0], b[1]))
+            elif kind == "c":
+                p0, p1, p2, p3 = [tuple(p) for p in item[1:5]]
+                prev = p0
+                for i in range(1, CURVE_STEPS + 1):
+                    cur = p3 if i == CURVE_STEPS else _bezier(p0, p1, p2, p3, i / CURVE_STEPS)
+                    add((prev[0], prev[1], cur[0], cur[1]))
+                    prev = cur
+
+    # 回転したページは表示の向きにそろえる
+    if page.rotation:
+        m = page.rotation_matrix
+        for i in range(0, len(segs), 2):
+            x, y = segs[i], segs[i + 1]
+            segs[i] = m.a * x + m.c * y + m.e
+            segs[i + 1] = m.b * x + m.d * y + m.f
+    return segs
+
+
+def page_segments(path, source_page):
+    """ワーカー側：元PDFのページから線分を取り出し、bytes で返す（受け渡しを軽くするため）"""
+    from render_service import _worker_doc
+    return extract_segments(_worker_doc(path).load_page(source_page)).tobytes()
+
+
+class SnapIndex:
+    """線分の格子索引。query() で端点・交点・線上の最寄り点を探す"""
+
+    def __init__(self, segs, cell=CELL):
+        self.segs = segs
+        self.cell = cell
+        self.grid = {}
+        self._build()
+
+    @classmethod
+    def from_bytes(cls, data, cell=CELL):
+        segs = array("d")
+        segs.frombytes(data)
+        return cls(segs, cell)
+
+    def __len__(self):
+        return len(self.segs) // 4
+
+    def _build(self):
+        """各線分を、通過するマスすべてに登録する（格子の走査 Amanatides-Woo）"""
+        grid = self.grid
+        cell = self.cell
+        segs = self.segs
+        floor = math.floor
+        for i in range(len(segs) // 4):
+            x1, y1, x2, y2 = segs[4 * i: 4 * i + 4]
+            ix, iy = floor(x1 / cell), floor(y1 / cell)
+            ex, ey = floor(x2 / cell), floor(y2 / cell)
+            dx, dy = x2 - x1, y2 - y1
+            sx = 1 if dx > 0 else -1
+            sy = 1 if dy > 0 else -1
+            # 次のマス境界までの t と、1マス進むごとの t
+            if dx:
+                nx = (ix + (sx > 0)) * cell
+                tx, tdx = (nx - x1) / dx, cell / abs(dx)
+            else:
+                tx, tdx = math.inf, math.inf
+            if dy:
+                ny = (iy + (sy > 0)) * cell
+                ty, tdy = (ny - y1) / dy, cell / abs(dy)
+            else:
+                ty, tdy = math.inf, math.inf
+            n = abs(ex - ix) + abs(ey - iy)
+            for _ in range(n + 1):
+                lst = grid.get((ix, iy))
+                if lst is None:
+                    grid[(ix, iy)] = [i]
+                else:
+                    lst.append(i)
+                if tx < ty:
+                    ix += sx
+                    tx += tdx
+                else:
+                    iy += sy
+                    ty += tdy
+
+    def _candidates(self, x, y, tol):
+        cell = self.cell
+        floor = math.floor
+        ix0, ix1 = floor((x - tol) / cell), floor((x + tol) / cell)
+        iy0, iy1 = floor((y - tol) / cell), floor((y + tol) / cell)
+        grid = self.grid
+        if ix0 == ix1 and iy0 == iy1:
+            return grid.get((ix0, iy0), ())
+        found = set()
+        for ix in range(ix0, ix1 + 1):
+            for iy in range(iy0, iy1 + 1):
+                lst = grid.get((ix, iy))
+                if lst:
+                    found.update(lst)
+        return found
+
+    def query(self, x, y, tol):
+        """(x, y) から tol 以内のスナップ先 (sx, sy, 種類) を返す。なければ None。
+
+        種類は "end"（端点）/ "cross"（交点）/ "edge"（線上）。端点・交点を線上より優先する。
+        """
+        segs = self.segs
+        tol2 = tol * tol
+        best_pt = None      # (距離², x, y, 種類)
+        near = []           # (距離², 線分番号, 最寄り点x, 最寄り点y)
+
+        best_end = tol2
+        for i in self._candidates(x, y, tol):
+            j = 4 * i
+            x1, y1, x2, y2 = segs[j], segs[j + 1], segs[j + 2], segs[j + 3]
+            ax, ay = x - x1, y - y1
+            dx, dy = x2 - x1, y2 - y1
+            ll = dx * dx + dy * dy
+            t = (ax * dx + ay * dy) / ll if ll else 0.0
+            if t <= 0.0:
+                px, py = x1, y1
+            elif t >= 1.0:
+                px, py = x2, y2
+            else:
+                px, py = x1 + dx * t, y1 + dy * t
+            d2 = (px - x) * (px - x) + (py - y) * (py - y)
+            if d2 > tol2:
+                continue
+            near.append((d2, i, px, py))
+
+            # 端点（線分が tol 以内を通るときだけ調べれば足りる）
+            d2 = ax * ax + ay * ay
+            if d2 <= best_end:
+                best_end = d2
+                best_pt = (d2, x1, y1, "end")
+            d2 = (x - x2) * (x - x2) + (y - y2) * (y - y2)
+            if d2 <= best_end:
+                best_end = d2
+                best_pt = (d2, x2, y2, "end")
+
+        # 交点（近くを通る線分どうし）
+        if len(near) > 1:
+            near.sort()
+            cand = near[:MAX_CROSS_SEGMENTS]
+            for a in range(len(cand)):
+                ia = cand[a][1]
+                ax1, ay1, ax2, ay2 = segs[4 * ia: 4 * ia + 4]
+                for b in range(a + 1, len(cand)):
+                    ib = cand[b][1]
+                    bx1, by1, bx2, by2 = segs[4 * ib: 4 * ib + 4]
+                    p = _intersect(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2)
+                    if p is None:
+                        continue
+                    d2 = (p[0] - x) ** 2 + (p[1] - y) ** 2
+                    if d2 <= tol2 and (best_pt is None or d2 < best_pt[0]):
+                        best_pt = (d2, p[0], p[1], "cross")
+
+        if best_pt is not None:
+            return best_pt[1], best_pt[2], best_pt[3]
+        if near:
+            d2, _, px, py = min(near)
+            return px, py, "edge"
+        return None
+
+
+def _intersect(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2):
+    """2線分の交点（平行・交わらなければ None）"""
+    rx, ry = ax2 - ax1, ay2 - ay1
+    sx, sy = bx2 - bx1, by2 - by1
+    den = rx * sy - ry * sx
+    if abs(den) < 1e-12:
+        return None
+    qx, qy = bx1 - ax1, by1 - ay1
+    t = (qx * sy - qy * sx) / den
+    u = (qx * ry - qy * rx) / den
+    if -1e-9 <= t <= 1 + 1e-9 and -1e-9 <= u <= 1 + 1e-9:
+        return ax1 + rx * t, ay1 + ry * t
+    return None
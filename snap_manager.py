@@ -0,0 +1,154 @@
+# snap_manager.py
+# 描画中のクリック位置を PDF の線（端点・交点・線上）に吸着させる
+#   線分の抽出はワーカープロセス、索引の構築はスレッドで行い、ページごとに覚えておく
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from snap_index import SnapIndex, page_segments
+
+# 吸着する距離（画面上のピクセル）
+SNAP_PX = 8
+# 索引を覚えておくページ数
+SNAP_CACHE_PAGES = 16
+# 結果の確認間隔（ミリ秒）
+POLL_MS = 50
+# 吸着する図形タイプ
+SNAP_TYPES = ("rect", "line", "triangle", "polygon")
+# 吸着先の種類ごとのマーカー色
+MARKER_COLORS = {"end": "#00aa00", "cross": "#ff00ff", "edge": "#0088ff"}
+
+
+class SnapManager:
+    def __init__(self, app):
+        self.app = app
+        self.enabled = True
+        self._indexes = OrderedDict()   # (pdf_path, 元ページ番号) -> SnapIndex（失敗時は None）
+        self._pending = {}              # (pdf_path, 元ページ番号) -> Future
+        self._executor = None
+        self._poll_id = None
+        self.marker_ids = []
+
+    # ---------- 索引の準備（バックグラウンド） ----------
+    def _key(self, page_index):
+        app = self.app
+        if not app.doc or not app.pdf_path or page_index >= len(app.page_map):
+            return None
+        return app.pdf_path, app.page_map[page_index]
+
+    def prepare(self, page_index=None):
+        """ページの索引がなければ作り始める（表示のたびに呼んでよい）"""
+        if not self.enabled:
+            return
+        if page_index is None:
+            page_index = self.app.page_index
+        key = self._key(page_index)
+        if key is None or key in self._indexes or key in self._pending:
+            return
+        try:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=1)
+            self._pending[key] = self._executor.submit(page_segments, *key)
+        except Exception:
+            # ワーカーが使えない環境では吸着なし
+            self._executor = None
+            self._store(key, None)
+            return
+        self._schedule_poll()
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.app.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        self._poll_id = None
+        for key, fut in list(self._pending.items()):
+            if isinstance(fut, threading.Thread):
+                if not fut.is_alive():
+                    del self._pending[key]
+                continue
+            if not fut.done():
+                continue
+            try:
+                data = fut.result()
+            except Exception:
+                del self._pending[key]
+                self._store(key, None)
+                continue
+            # 索引の構築は純 Python なのでスレッドで（GIL は細かく手放される）
+            th = threading.Thread(target=self._build, args=(key, data), daemon=True)
+            self._pending[key] = th
+            th.start()
+        if self._pending:
+            self._schedule_poll()
+
+    def _build(self, key, data):
+        self._store(key, SnapIndex.from_bytes(data))
+
+    def _store(self, key, index):
+        self._indexes[key] = index
+        self._indexes.move_to_end(key)
+        while len(self._indexes) > SNAP_CACHE_PAGES:
+            self._indexes.popitem(last=False)
+
+    def index_for(self, page_index=None):
+        """ページの索引（まだできていなければ None）"""
+        if page_index is None:
+            page_index = self.app.page_index
+        key = self._key(page_index)
+        return self._indexes.get(key) if key else None
+
+    def shutdown(self):
+        if self._poll_id is not None:
+            self.app.root.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # ---------- 吸着 ----------
+    def snap(self, cx, cy):
+        """キャンバス座標を吸着させて (cx, cy, 種類) を返す（吸着しなければ種類は None）"""
+        app = self.app
+        if not self.enabled or app.mode != "draw" or app.shape_type not in SNAP_TYPES:
+            self.clear_marker()
+            return cx, cy, None
+        idx = self.index_for()
+        if idx is None:
+            self.prepare()
+            return cx, cy, None
+
+        px, py = app.canvas_to_pdf(cx, cy)
+        hit = idx.query(px, py, SNAP_PX / app.scale)
+        if hit is None:
+            self.clear_marker()
+            return cx, cy, None
+        sx, sy = app.pdf_to_canvas(hit[0], hit[1])
+        self.show_marker(sx, sy, hit[2])
+        return sx, sy, hit[2]
+
+    def show_marker(self, cx, cy, kind):
+        self.clear_marker()
+        cv = self.app.canvas
+        r = 5
+        color = MARKER_COLORS.get(kind, "#0088ff")
+        if kind == "end":
+            mid = cv.create_rectangle(cx - r, cy - r, cx + r, cy + r, outline=color, width=2)
+        elif kind == "cross":
+            mid = cv.create_line(cx - r, cy - r, cx + r, cy + r, cx, cy, cx + r, cy - r, cx - r, cy + r,
+                                 fill=color, width=2)
+        else:
+            mid = cv.create_oval(cx - r, cy - r, cx + r, cy + r, outline=color, width=2)
+        self.marker_ids.append(mid)
+
+    def clear_marker(self):
+        for mid in self.marker_ids:
+            self.app.canvas.delete(mid)
+        self.marker_ids.clear()
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        if self.enabled:
+            self.prepare()
+        else:
+            self.clear_marker()
+        return self.enabled
@@ -0,0 +1,60 @@
+# tests/conftest.py
+# モジュールはリポジトリ直下に並んでいるので、そこを import パスに入れる
+# テストで共通に使う図形・PDF・Tk の代役もここに置く（from conftest import ...）
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 数量の分類の色（quantity.ATTR）
+WALL = "#ff0000"
+ROOF = "#0000ff"
+WINDOW = "#800080"
+
+
+def rect(x, y, w, h, color=WALL, **kw):
+    return dict(type="rect", x=x, y=y, w=w, h=h, color=color, **kw)
+
+
+def formula(text="sum(wall)"):
+    """参照式のテキスト図形（末尾の = で式として扱われる）"""
+    return dict(type="text", x=0, y=0, text=text + "=")
+
+
+def write_pdf(path, pages=3, text=False, toc=False):
+    """白紙ページの PDF を作ってパスを返す。text なら各ページに "page <番号>"、toc なら1ページ1項目の目次"""
+    import fitz
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        if text:
+            page.insert_text((72, 72), f"page {i}")
+    if toc:
+        doc.set_toc([[1, f"p{i}", i + 1] for i in range(pages)])
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+class Root:
+    """Tk の root の代役（after で予約した関数を run で呼ぶ）"""
+    def __init__(self):
+        self.queue = []
+
+    def after(self, ms, fn):
+        self.queue.append(fn)
+        return fn
+
+    def after_cancel(self, ident):
+        self.queue.remove(ident)
+
+    def run(self):
+        """いま予約されている分だけ実行する（未完了なら _poll は予約し直す）"""
+        queue, self.queue = self.queue, []
+        for fn in queue:
+            fn()
+
+    def run_until_idle(self):
+        """予約がなくなるまで実行する（すべて終わる代役のワーカー用）"""
+        while self.queue:
+            self.run()
@@ -0,0 +1,135 @@
+# tests/test_bulk_ops.py
+# 図形の一括変換・複製と、その取り消し（参照式の再計算を含む）
+import pytest
+import bulk_ops
+from document_model import DocumentModel
+from conftest import ROOF, rect, formula
+
+
+def _model(*pages):
+    m = DocumentModel()
+    for page, shapes in enumerate(pages):
+        for s in shapes:
+            m.add_shape(page, s)
+    return m
+
+
+def test_make_transform_scales_about_origin():
+    sx, sy, tx, ty = bulk_ops.make_transform(scale=2, origin=(10, 10))
+    assert (sx * 10 + tx, sy * 10 + ty) == (10, 10)
+    assert (sx * 20 + tx, sy * 30 + ty) == (30, 50)
+
+
+def test_apply_transform_mirror_keeps_positive_size():
+    s = rect(10, 20, 30, 40)
+    bulk_ops.apply_transform([s], bulk_ops.make_transform(mirror_x=True, origin=(0, 0)))
+    assert (s["x"], s["y"], s["w"], s["h"]) == (-40, 20, 30, 40)
+
+
+def test_apply_transform_points_and_lines():
+    tri = dict(type="triangle", points=[(0, 0), (10, 0), (0, 10)])
+    line = dict(type="line", x1=0, y1=0, x2=10, y2=0)
+    before = tri["points"]
+    bulk_ops.apply_transform([tri, line], bulk_ops.make_transform(dx=5, dy=1))
+    assert tri["points"] == [(5, 1), (15, 1), (5, 11)]
+    assert tri["points"] is not before
+    assert (line["x1"], line["y1"], line["x2"], line["y2"]) == (5, 1, 15, 1)
+
+
+def test_scaling_scales_manual_values():
+    s = rect(0, 0, 10, 10, value=7.0, manual_value=True)
+    bulk_ops.apply_transform([s], bulk_ops.make_transform(scale=2))
+    assert s["value"] == 28.0
+
+
+def test_parse_pages():
+    assert bulk_ops.parse_pages("2-4, 7、3", 10) == [1, 2, 3, 6]
+    assert bulk_ops.parse_pages("5-3", 10) == [2, 3, 4]
+    with pytest.raises(ValueError):
+        bulk_ops.parse_pages("0-2", 10)
+    with pytest.raises(ValueError):
+        bulk_ops.parse_pages("11", 10)
+
+
+def test_new_ids_are_unique():
+    ids = bulk_ops.new_ids(1000)
+    assert len(set(ids)) == 1000
+
+
+def test_transform_in_place_undo_restores_geometry_and_formula():
+    a = rect(0, 0, 10, 10)
+    f = formula()
+    m = _model([a, f])
+    assert f["value"] == 100
+    bulk_ops.transform_in_place(m, 0, [a], bulk_ops.make_transform(scale=2))
+    assert (a["w"], a["h"], a["value"]) == (20, 20, 400)
+    assert f["value"] == 400
+    assert m.undo() == "一括変換"
+    assert (a["x"], a["y"], a["w"], a["h"]) == (0, 0, 10, 10)
+    assert f["value"] == 100
+
+
+def test_replicate_updates_formulas_and_undo_removes_copies():
+    src = [rect(0, 0, 10, 10, name="A"), rect(0, 0, 5, 2)]
+    f1 = formula(text="sum(wall)")
+    f2 = formula(text="A*2")
+    m = _model(src, [f1, f2])
+    assert f1["value"] == 0 and f2["value"] is None
+
+    added = bulk_ops.replicate(m, src, 0, [1, 2], bulk_ops.make_transform(dx=100))
+    assert len(added) == 4
+    assert [s["x"] for p, s in added] == [100, 100, 100, 100]
+    assert f1["value"] == 110
+    assert f2["value"] == 200
+    # 元のページへの名前の付け替えはなく、コピー先ごとに名前が残る
+    assert m.named_shapes[(1, "A")]["x"] == 100
+    assert m.named_shapes[(0, "A")] is src[0]
+
+    m.undo()
+    assert [s for s in m.shapes_on(1)] == [f1, f2]
+    assert m.shapes_on(2) == []
+    assert f1["value"] == 0
+    assert f2["value"] is None
+    assert (1, "A") not in m.named_shapes
+
+
+def test_replicate_to_same_page_drops_names():
+    a = rect(0, 0, 10, 10, name="A")
+    m = _model([a])
+    added = bulk_ops.replicate(m, [a], 0, [0])
+    assert "name" not in added[0][1]
+    assert m.named_shapes[(0, "A")] is a
+
+
+def test_recolor_moves_category_totals_and_undo():
+    src = [rect(0, 0, 10, 10), rect(0, 0, 10, 1)]
+    wall = formula(text="sum(wall)")
+    roof = formula(text="sum(roof)")
+    m = _model([], [wall, roof])
+    copies = [s for _, s in bulk_ops.replicate(m, src, 0, [1])]
+    assert (wall["value"], roof["value"]) == (110, 0)
+    bulk_ops.recolor(m, 1, copies[:1], ROOF)
+    assert (wall["value"], roof["value"]) == (10, 100)
+    m.undo()
+    assert (wall["value"], roof["value"]) == (110, 0)
+
+
+def test_remove_bulk_added_shape_recalculates_category():
+    f = formula()
+    m = _model([f])
+    (_, c), = bulk_ops.replicate(m, [rect(0, 0, 3, 3)], 0, [0])
+    assert f["value"] == 9
+    m.remove_shape(c, 0)
+    assert f["value"] == 0
+    m.remove_shapes([(0, f)], label="削除")
+    m.undo()
+    assert m.shapes_on(0) == [f]
+
+
+def test_remove_shapes_undo_restores_order():
+    shapes = [rect(i, 0, 1, 1) for i in range(6)]
+    m = _model(shapes)
+    m.remove_shapes([(0, shapes[1]), (0, shapes[4])], label="削除")
+    assert m.shapes_on(0) == [shapes[i] for i in (0, 2, 3, 5)]
+    m.undo()
+    assert m.shapes_on(0) == shapes
@@ -0,0 +1,75 @@
+# tests/test_document_model.py
+# 図形の名前と、名前を参照する式の再計算
+import pytest
+from document_model import DocumentModel
+from conftest import rect, formula
+
+
+def test_set_shape_name_rejects_name_used_on_same_page():
+    m = DocumentModel()
+    a, b = rect(0, 0, 10, 10, name="A"), rect(0, 0, 5, 2)
+    f = formula("A*2")
+    for s in (a, b, f):
+        m.add_shape(0, s)
+    with pytest.raises(ValueError):
+        m.set_shape_name(b, "A", 0)
+    assert "name" not in b
+    assert m.named_shapes[(0, "A")] is a
+    assert f["value"] == 200
+
+
+def test_set_shape_name_allows_same_name_on_other_page():
+    m = DocumentModel()
+    a, b = rect(0, 0, 10, 10, name="A"), rect(0, 0, 5, 2)
+    m.add_shape(0, a)
+    m.add_shape(1, b)
+    m.set_shape_name(b, "A", 1)
+    assert m.named_shapes[(1, "A")] is b
+
+
+def test_duplicate_names_make_formula_fail_until_resolved():
+    # 読み込んだプロジェクトなどで、同じページに同じ名前が既にある場合
+    m = DocumentModel()
+    a, b = rect(0, 0, 10, 10, name="A"), rect(0, 0, 5, 2, name="A")
+    f = formula("A*2")
+    for s in (a, b, f):
+        m.add_shape(0, s)
+    assert (0, "A") in m.name_clashes
+    assert f["value"] is None
+
+    m.set_shape_name(b, "B", 0)
+    assert (0, "A") not in m.name_clashes
+    assert m.named_shapes[(0, "A")] is a
+    assert f["value"] == 200
+
+
+def test_removing_duplicate_resolves_clash():
+    m = DocumentModel()
+    a, b = rect(0, 0, 10, 10, name="A"), rect(0, 0, 5, 2, name="A")
+    f = formula("A*2")
+    for s in (a, b, f):
+        m.add_shape(0, s)
+    m.remove_shape(a, 0)
+    assert m.named_shapes[(0, "A")] is b
+    assert f["value"] == 20
+
+
+@pytest.mark.parametrize("label", ["LDK", "Kitchen", "WC", "A-301"])
+def test_bare_label_is_not_a_formula(label):
+    m = DocumentModel()
+    m.add_shape(0, rect(0, 0, 10, 10, name="LDK"))
+    t = dict(type="text", x=0, y=0, text=label)
+    m.add_shape(0, t)
+    assert t["text"] == label
+    assert t["value"] is None
+    assert "formula" not in t
+
+
+@pytest.mark.parametrize("text", ["LDK*2=", "=LDK*2"])
+def test_marked_text_is_a_formula(text):
+    m = DocumentModel()
+    m.add_shape(0, rect(0, 0, 10, 10, name="LDK"))
+    t = dict(type="text", x=0, y=0, text=text)
+    m.add_shape(0, t)
+    assert t["formula"] == "LDK*2"
+    assert (t["value"], t["text"]) == (200, "LDK*2=200.0")
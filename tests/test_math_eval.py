@@ -0,0 +1,101 @@
+# tests/test_math_eval.py
+# 固定小数点（ミリ単位）・式の上限・依存グラフ
+import pytest
+import math_eval
+from math_eval import (
+    MathEvalError, EvalBudgetError, CircularReferenceError, DependencyGraph,
+    to_milli, format_milli, mul_milli, eval_expr, eval_to_milli, compile_expr,
+)
+
+
+@pytest.mark.parametrize("x, m", [
+    (4.2325, 4232), (4.35, 4350), (-1.2345, -1234), (0.1 + 0.2, 300),
+    (2.675, 2675), (1e-4, 0), (123456789.9999, 123456789999), (0, 0),
+])
+def test_to_milli_truncates_decimal_repr(x, m):
+    assert to_milli(x) == m
+
+
+def test_to_milli_large_exponent_and_non_finite():
+    assert to_milli(1e20) == 10**23
+    for x in (float("inf"), float("nan")):
+        with pytest.raises(ValueError):
+            to_milli(x)
+
+
+@pytest.mark.parametrize("m, s", [(4232, "4.232"), (-5, "-0.005"), (0, "0.000"), (-1234, "-1.234")])
+def test_format_milli(m, s):
+    assert format_milli(m) == s
+
+
+def test_mul_milli_truncates_toward_zero():
+    assert mul_milli(1500, 1500) == 2250
+    assert mul_milli(1001, 1001) == 1002
+    assert mul_milli(-1001, 1001) == -1002
+
+
+def test_eval_basic_and_caret_power():
+    assert eval_expr("1+2*3") == 7
+    assert eval_expr("2^3") == 8
+    assert eval_to_milli("4.2325") == 4232
+
+
+@pytest.mark.parametrize("expr", ["", "1+", "__import__('os')", "a.b", "(lambda: 1)()"])
+def test_eval_rejects_invalid(expr):
+    with pytest.raises(MathEvalError):
+        eval_expr(expr)
+
+
+@pytest.mark.parametrize("expr", [
+    "1+" * (math_eval.MAX_EXPR_LENGTH // 2 + 1) + "1",
+    "(" * (math_eval.MAX_DEPTH + 1) + "1" + ")" * (math_eval.MAX_DEPTH + 1),
+    "2**" + str(math_eval.MAX_EXPONENT + 1),
+    "10**15*10**15",
+])
+def test_budget_errors(expr):
+    with pytest.raises(EvalBudgetError):
+        eval_expr(expr)
+
+
+def test_rejected_long_expression_is_not_cached():
+    math_eval.clear_cache()
+    long = "1+" * math_eval.MAX_EXPR_LENGTH + "1"
+    for _ in range(2):
+        with pytest.raises(EvalBudgetError):
+            compile_expr(long)
+    assert math_eval.cache_info().currsize == 0
+    compile_expr("1+1")
+    assert math_eval.cache_info().currsize == 1
+
+
+def test_dependency_graph_affected_in_topological_order():
+    g = DependencyGraph()
+    g.set_inputs("b", ["a"])
+    g.set_inputs("c", ["a", "b"])
+    g.set_inputs("d", ["c"])
+    order, cyclic = g.affected(["a"])
+    assert not cyclic
+    assert order.index("a") < order.index("b") < order.index("c") < order.index("d")
+    assert g.affected(["c"])[0] == ["c", "d"]
+
+
+def test_dependency_graph_detects_cycle_and_downstream():
+    g = DependencyGraph()
+    g.set_inputs("b", ["a"])
+    g.set_inputs("c", ["b"])
+    g.set_inputs("b", ["a", "c"])
+    g.set_inputs("d", ["c"])
+    with pytest.raises(CircularReferenceError) as e:
+        g.check_acyclic(["a"])
+    assert e.value.nodes == {"b", "c", "d"}
+
+    g.discard_input("b", "c")
+    assert g.check_acyclic(["a"]) == ["a", "b", "c", "d"]
+
+
+def test_dependency_graph_remove_many():
+    g = DependencyGraph()
+    g.add_inputs("sum", ["x", "y", "z"])
+    g.remove_many(["x", "y"])
+    assert g.affected(["z"])[0] == ["z", "sum"]
+    assert g.affected(["x"])[0] == ["x"]
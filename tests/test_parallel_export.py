@@ -0,0 +1,50 @@
+# tests/test_parallel_export.py
+# ページ範囲ごとの並列出力：元PDFは document_manager のマップ（または開いている文書）から読む
+import fitz
+import pytest
+import parallel_export
+from document_manager import documents
+from conftest import write_pdf
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = write_pdf(tmp_path / "plan.pdf", 6, text=True, toc=True)
+    yield path
+    documents.close(path)
+
+
+def _shapes(pages):
+    return {p: [{"type": "rect", "x": 10, "y": 10, "w": 50, "h": 20, "color": "#ff0000"}] for p in pages}
+
+
+def test_parent_does_not_reparse_source(pdf, tmp_path, monkeypatch):
+    opened = []
+    real_open = fitz.open
+
+    def spy(*args, **kw):
+        opened.append(args[0] if args else kw.get("filename"))
+        return real_open(*args, **kw)
+
+    monkeypatch.setattr(fitz, "open", spy)
+    out = str(tmp_path / "out.pdf")
+    base = parallel_export.export_parallel(pdf, _shapes(range(6)), out, workers=2, page_map=[0, 2, 4, 5])
+    assert pdf not in opened
+    assert documents.stats(pdf)["mapped"]
+    with real_open(out) as done:
+        assert len(done) == 4
+        assert [t[1] for t in done.get_toc()] == ["p0", "p2", "p4", "p5"]
+        assert all(done[i].get_drawings() for i in range(4))
+    assert sorted(base) == [0, 1, 2, 3]
+
+
+def test_uses_open_document_without_changing_it(pdf, tmp_path):
+    doc = documents.open(pdf)
+    doc.select([1, 3])
+    out = str(tmp_path / "out.pdf")
+    parallel_export.export_parallel(pdf, _shapes([1]), out, workers=2, page_map=[1, 3], doc=doc)
+    assert not doc.is_closed and len(doc) == 2
+    doc.close()
+    with fitz.open(out) as done:
+        assert [done[i].get_text().strip() for i in range(2)] == ["page 1", "page 3"]
+        assert not done[0].get_drawings() and done[1].get_drawings()
@@ -0,0 +1,42 @@
+# tests/test_pdfannotator.py
+# コマンドライン（GUIなし）の出力
+import fitz
+import pytest
+import project_io
+import pdfannotator
+from document_manager import documents
+from conftest import write_pdf
+
+
+def test_export_project_releases_mapping(tmp_path):
+    pdf = write_pdf(tmp_path / "plan.pdf")
+    proj = str(tmp_path / "plan.json")
+    project_io.save_project(proj, pdf, {1: [{"type": "rect", "x": 10, "y": 10, "w": 50, "h": 20}]})
+    out = str(tmp_path / "out.pdf")
+    assert pdfannotator.export_project(proj, out) == out
+    assert documents._key(pdf) not in documents._maps
+    with fitz.open(out) as doc:
+        assert len(doc) == 3
+        assert doc[1].get_drawings()
+
+
+def test_export_project_releases_mapping_on_failure(tmp_path):
+    pdf = write_pdf(tmp_path / "plan.pdf")
+    proj = str(tmp_path / "plan.json")
+    project_io.save_project(proj, pdf, {})
+    # 出力先のフォルダがない（PyMuPDF の例外は RuntimeError などの派生ではない）
+    with pytest.raises(Exception, match="out.pdf"):
+        pdfannotator.export_project(proj, str(tmp_path / "missing" / "out.pdf"))
+    assert documents._key(pdf) not in documents._maps
+
+
+def test_export_command_with_out_dir(tmp_path):
+    pdf = write_pdf(tmp_path / "plan.pdf")
+    projects = []
+    for name in ("a", "b"):
+        p = str(tmp_path / f"{name}.json")
+        project_io.save_project(p, pdf, {})
+        projects.append(p)
+    out_dir = tmp_path / "out"
+    assert pdfannotator.main(["export", *projects, "--out-dir", str(out_dir), "--jobs", "1"]) == 0
+    assert sorted(p.name for p in out_dir.iterdir()) == ["a.pdf", "b.pdf"]
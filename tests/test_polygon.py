@@ -0,0 +1,97 @@
+# tests/test_polygon.py
+# 多角形の面積・簡略化（LOD）・当たり判定
+import math
+import random
+import pytest
+import polygon_lod
+from polygon_lod import PolygonGeometry, LOD_MIN_VERTICES
+from utils_geometry import dist_point_to_segment, polygon_area, point_in_polygon, simplify_polygon
+
+
+def _circle(n, r=100.0, cx=300.0, cy=400.0):
+    return [(cx + r * math.cos(2 * math.pi * i / n), cy + r * math.sin(2 * math.pi * i / n))
+            for i in range(n)]
+
+
+def _star(n, r1=100.0, r2=40.0, cx=0.0, cy=0.0):
+    return [(cx + (r1 if i % 2 == 0 else r2) * math.cos(math.pi * i / n),
+             cy + (r1 if i % 2 == 0 else r2) * math.sin(math.pi * i / n)) for i in range(2 * n)]
+
+
+def test_polygon_area_square_either_orientation():
+    sq = [(0, 0), (10, 0), (10, 5), (0, 5)]
+    assert polygon_area(sq) == 50
+    assert polygon_area(sq[::-1]) == 50
+    assert polygon_area(sq[:2]) == 0.0
+
+
+def test_polygon_area_far_from_origin_keeps_precision():
+    ox, oy = 1e7, 1e7
+    sq = [(ox, oy), (ox + 0.1, oy), (ox + 0.1, oy + 0.1), (ox, oy + 0.1)]
+    assert polygon_area(sq) == pytest.approx(0.01, rel=1e-6)
+
+
+def test_polygon_area_concave():
+    # L字：10x10 から 5x5 を欠いたもの
+    pts = [(0, 0), (10, 0), (10, 5), (5, 5), (5, 10), (0, 10)]
+    assert polygon_area(pts) == 75
+
+
+def test_simplify_polygon_drops_collinear_vertices():
+    pts = [(i, 0) for i in range(11)] + [(10, i) for i in range(1, 11)] + [(0, 10)]
+    idx = simplify_polygon(pts, 0.5)
+    assert [pts[i] for i in idx] == [(0, 0), (10, 0), (10, 10), (0, 10)]
+
+
+def test_simplify_polygon_keeps_error_within_tolerance():
+    pts = _circle(2000)
+    for tol in (0.25, 1.0, 4.0):
+        idx = simplify_polygon(pts, tol)
+        assert idx == sorted(idx) and len(idx) < len(pts)
+        # 落とした頂点は、残した輪郭から tol 以内
+        kept = [pts[i] for i in idx]
+        for x, y in pts:
+            assert min(dist_point_to_segment(x, y, *kept[k - 1], *kept[k])
+                       for k in range(len(kept))) <= tol + 1e-9
+    coarse = simplify_polygon(pts, 4.0, simplify_polygon(pts, 1.0))
+    assert set(coarse) <= set(simplify_polygon(pts, 1.0))
+
+
+def test_simplify_polygon_keeps_at_least_a_triangle():
+    pts = [(0, 0), (100, 0.01), (200, 0), (100, -0.01)]
+    assert len(simplify_polygon(pts, 1.0)) == 3
+
+
+def test_outline_only_for_large_polygons_when_zoomed_out():
+    assert PolygonGeometry(_circle(LOD_MIN_VERTICES - 1)).outline(0.1) is None
+    g = PolygonGeometry(_circle(5000))
+    assert g.outline(100.0) is None
+    small = g.outline(0.05)
+    assert small is not None and len(small) < len(g.outline(0.5)) < 5000
+
+
+@pytest.mark.parametrize("n", [12, 1000])
+def test_contains_matches_point_in_polygon(n):
+    pts = _star(n)
+    g = PolygonGeometry(pts)
+    rnd = random.Random(1)
+    for _ in range(2000):
+        x, y = rnd.uniform(-110, 110), rnd.uniform(-110, 110)
+        assert g.contains(x, y) == point_in_polygon(x, y, pts)
+    assert g.contains(0, 0)
+    assert not g.contains(200, 0)
+
+
+def test_near_edge():
+    g = PolygonGeometry(_circle(1000, r=100, cx=0, cy=0))
+    assert g.near_edge(100.5, 0, 1.0)
+    assert not g.near_edge(0, 0, 1.0)
+    assert not g.near_edge(103, 0, 1.0)
+
+
+def test_geometry_rebuilds_when_points_replaced():
+    s = {"id": "poly-test", "type": "polygon", "points": _circle(10)}
+    g = polygon_lod.geometry(s)
+    assert polygon_lod.geometry(s) is g
+    s["points"] = _circle(10, r=5)
+    assert polygon_lod.geometry(s) is not g
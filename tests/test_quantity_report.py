@@ -0,0 +1,129 @@
+# tests/test_quantity_report.py
+# 一括集計：フォルダからのプロジェクトの列挙と、ページ別・合計行、図形ごとの明細
+import io
+import csv
+import json
+import project_io
+import quantity
+from quantity_report import (
+    find_projects, write_report, iter_shape_rows, iter_projects_shape_rows, write_rows, TOTAL_KEYS,
+)
+from conftest import WALL, ROOF, WINDOW
+
+
+def _project(path, shapes_by_page, slopes=None):
+    project_io.save_project(str(path), "plan.pdf", shapes_by_page, slopes)
+    return str(path)
+
+
+def test_find_projects_skips_other_json(tmp_path):
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    a = _project(tmp_path / "a.json", {})
+    b = _project(sub / "b.json", {})
+    (tmp_path / "perf.json").write_text(json.dumps({"stages": {"render_page": {"n": 1}}}))
+    (tmp_path / "baseline.json").write_text(json.dumps({"results": {}, "environment": {}}))
+    (tmp_path / "list.json").write_text("[1, 2, 3]")
+    (tmp_path / "broken.json").write_text("{not json")
+    (tmp_path / "notes.txt").write_text("pdf_path")
+    assert sorted(find_projects([str(tmp_path)])) == sorted([a, b])
+
+
+def test_find_projects_keeps_explicit_files(tmp_path):
+    other = tmp_path / "perf.json"
+    other.write_text("{}")
+    assert list(find_projects([str(other)])) == [str(other)]
+
+
+def test_hand_written_project_is_found(tmp_path):
+    p = tmp_path / "hand.json"
+    p.write_text('{\n  "shapes_by_page": {"0": []},\n  "pdf_path": "x.pdf"\n}')
+    assert list(find_projects([str(tmp_path)])) == [str(p)]
+
+
+def test_write_report_pages_and_totals(tmp_path):
+    a = _project(tmp_path / "a.json", {
+        0: [{"type": "rect", "color": WALL, "value": 10.5}],
+        1: [{"type": "rect", "color": ROOF, "value": 2}],
+    }, {1: 1.5})
+    b = _project(tmp_path / "b.json", {0: [{"type": "rect", "color": WALL, "value": 0.25}]})
+    out = io.StringIO()
+    grand = write_report([a, b], out, fmt="csv", jobs=1)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert [(r["project"], r["page"]) for r in rows] == [
+        (a, "1"), (a, "2"), (a, "TOTAL"), (b, "1"), (b, "TOTAL"), ("ALL", "TOTAL")]
+    assert rows[1]["roof"] == "3.000"
+    assert rows[-1]["wall"] == "10.750"
+    assert grand["roof"] == 3000
+
+
+def test_write_report_reports_unreadable_project(tmp_path):
+    bad = tmp_path / "bad.json"
+    bad.write_text("{broken")
+    errors = []
+    out = io.StringIO()
+    write_report([str(bad)], out, fmt="jsonl", jobs=1, on_error=lambda p, m: errors.append(p))
+    assert errors == [str(bad)]
+    assert json.loads(out.getvalue())["project"] == "ALL"
+
+
+def _shapes():
+    return {
+        0: [
+            {"id": "w1", "type": "rect", "color": WALL, "value": 10.1235},
+            {"id": "w2", "type": "rect", "color": WALL, "value": 0.1 + 0.2},
+            {"id": "r1", "type": "rect", "color": ROOF, "value": 3.3333},
+            {"id": "r2", "type": "rect", "color": ROOF, "value": 1.25, "slope": 1.118},
+            {"id": "n1", "type": "rect", "color": WINDOW, "value": 1.5},
+            {"id": "x", "type": "rect", "color": "#123456", "value": 99},
+            {"id": "t", "type": "text", "text": "1+1", "value": 2},
+        ],
+        2: [{"id": "w3", "type": "rect", "color": WALL, "value": 4.0005}],
+    }
+
+
+def test_shape_rows_match_page_stats():
+    shapes, slopes = _shapes(), {0: 1.2}
+    rows = list(iter_shape_rows(shapes, slopes, "p"))
+    for p in shapes:
+        page_rows = [r for r in rows if r["page"] == p + 1]
+        totals, _ = quantity.calc_page_stats_milli(shapes[p], slopes.get(p))
+        page_totals = {r["category"]: r["result"] for r in page_rows if r["kind"] == "page_total"}
+        assert page_totals == {k: totals[k] for k in TOTAL_KEYS}
+        # 図形行の結果の合計が合計行と一致する
+        for k in quantity.CATEGORIES:
+            assert sum(r["result"] for r in page_rows
+                       if r["kind"] == "shape" and r["category"] == k) == totals[k]
+
+    shape_ids = [r["id"] for r in rows if r["kind"] == "shape"]
+    assert shape_ids == ["w1", "w2", "r1", "r2", "n1", "w3"]
+    r1 = next(r for r in rows if r["id"] == "r1")
+    assert (r1["value"], r1["slope"], r1["result"]) == (3333, 1200, 3999)
+    r2 = next(r for r in rows if r["id"] == "r2")
+    assert r2["slope"] == 1118
+
+
+def test_shape_rows_total_matches_total_stats():
+    shapes, slopes = _shapes(), {0: 1.2}
+    rows = list(iter_shape_rows(shapes, slopes, "p"))
+    total = {r["category"]: r["result"] for r in rows if r["kind"] == "total"}
+    expected, _ = quantity.calc_total_stats_milli(shapes, slopes)
+    for k in quantity.GRAND_KEYS:
+        assert total[k] == expected[k]
+    assert total["wall_final"] == total["wall"] - total["window"] - total["door"]
+
+
+def test_projects_shape_rows_grand_total_and_csv(tmp_path):
+    a = _project(tmp_path / "a.json", _shapes(), {0: 1.2})
+    b = _project(tmp_path / "b.json", {0: [{"id": "w", "type": "rect", "color": WALL, "value": 0.5}]})
+    out = io.StringIO()
+    n = write_rows(iter_projects_shape_rows([a, b]), out, fmt="csv")
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert len(rows) == n
+    grand = {r["category"]: r["result"] for r in rows if r["project"] == "ALL"}
+    totals = {(r["project"], r["category"]): r["result"]
+              for r in rows if r["kind"] == "total" and r["project"] != "ALL"}
+    assert grand["wall"] == "14.923"
+    assert float(grand["wall"]) == float(totals[(a, "wall")]) + float(totals[(b, "wall")])
+    shape = next(r for r in rows if r["id"] == "w2")
+    assert (shape["value"], shape["slope"]) == ("0.300", "")
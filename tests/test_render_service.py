@@ -0,0 +1,127 @@
+# tests/test_render_service.py
+# 非同期描画の依頼の扱い（ワーカーは使わず、結果を手で返す）
+from concurrent.futures import Future
+import render_service
+from render_service import RenderService
+from conftest import Root
+
+
+class _Pool:
+    """submit したら Future を返すだけのプール（finish で結果を入れる）"""
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        fut = Future()
+        self.jobs.append((args, fut))
+        return fut
+
+    def finish(self):
+        for _, fut in self.jobs:
+            if not fut.done():
+                fut.set_result((1, 1, b"\0\0\0", 1.0))
+
+    def shutdown(self, **kw):
+        pass
+
+
+class _App:
+    pass
+
+
+def _service():
+    app = _App()
+    app.root = Root()
+    got = []
+    svc = RenderService(app, got.append)
+    svc._executor = _Pool()
+    return app, svc, got
+
+
+def test_identical_requests_are_not_resubmitted():
+    app, svc, got = _service()
+    first = svc.request("a.pdf", 0, 0, 4.0, (0, 0, 100, 100))
+    for _ in range(20):
+        assert svc.request("a.pdf", 0, 0, 4.0, (0, 0, 100, 100)) is first
+    # 実行中のものに含まれる範囲も出し直さない
+    assert svc.request("a.pdf", 0, 0, 4.0, (10, 10, 90, 90)) is first
+    assert len(svc._executor.jobs) == 1
+    svc._executor.finish()
+    app.root.run()
+    assert [r.request for r in got] == [first]
+    assert svc.dropped == 0
+
+
+def test_superseded_result_is_still_delivered():
+    app, svc, got = _service()
+    first = svc.request("a.pdf", 0, 0, 1.0)
+    second = svc.request("a.pdf", 1, 1, 1.0)
+    third = svc.request("a.pdf", 2, 2, 1.0)
+    # 未着手だった second だけが捨てられる
+    assert svc.dropped == 1
+    svc._executor.finish()
+    app.root.run()
+    svc._executor.finish()
+    app.root.run()
+    assert [r.request for r in got] == [first, third]
+    assert second not in [r.request for r in got]
+
+
+def test_request_covered_by_running_discards_pending():
+    app, svc, got = _service()
+    first = svc.request("a.pdf", 0, 0, 2.0)
+    svc.request("a.pdf", 1, 1, 2.0)
+    # 表示がページ0に戻った：実行中の描画で足りるので未着手の依頼は要らない
+    assert svc.request("a.pdf", 0, 0, 2.0, (0, 0, 50, 50)) is first
+    svc._executor.finish()
+    app.root.run()
+    assert [r.request for r in got] == [first]
+    assert len(svc._executor.jobs) == 1
+
+
+def test_render_clip_whole_page_when_small():
+    assert render_service.render_clip((0, 0, 595, 842), 1.0, (0, 0, 500, 500)) is None
+
+
+def test_render_clip_stays_inside_page():
+    x0, y0, x1, y1 = render_service.render_clip((0, 0, 5000, 5000), 4.0, (100, 100, 300, 300))
+    assert 0 <= x0 <= 100 and 0 <= y0 <= 100
+    assert 300 <= x1 <= 5000 and 300 <= y1 <= 5000
+
+
+def _result(path, page, scale, size=(10, 10)):
+    from PIL import Image
+    req = render_service.RenderRequest(path, page, page, scale, None, 0)
+    return render_service.RenderResult(req, Image.new("RGB", size), 1.0)
+
+
+def test_raster_cache_evicts_oldest_over_budget():
+    cache = render_service.RasterCache(budget=3 * 300)
+    for page in range(3):
+        cache.put(_result("a.pdf", page, 1.0))
+    assert cache.nbytes == 900 and cache.evicted == 0
+    # 読んだものは新しい扱いになる
+    cache.get("a.pdf", 0, 1.0)
+    cache.put(_result("b.pdf", 0, 1.0))
+    assert cache.get("a.pdf", 1, 1.0) is None
+    assert cache.get("a.pdf", 0, 1.0) is not None
+    assert cache.evicted == 1
+    assert cache.usage() == {"a.pdf": 600, "b.pdf": 300}
+
+
+def test_raster_cache_keeps_newest_even_if_too_big():
+    cache = render_service.RasterCache(budget=100)
+    cache.put(_result("a.pdf", 0, 1.0))
+    cache.put(_result("a.pdf", 1, 1.0, size=(20, 20)))
+    assert len(cache) == 1
+    assert cache.get("a.pdf", 1, 1.0) is not None
+
+
+def test_raster_cache_replaces_same_key_and_drops_by_path():
+    cache = render_service.RasterCache()
+    cache.put(_result("a.pdf", 0, 1.0))
+    cache.put(_result("a.pdf", 0, 1.0, size=(20, 20)))
+    assert len(cache) == 1 and cache.nbytes == 1200
+    cache.put(_result("b.pdf", 0, 1.0))
+    cache.drop("a.pdf")
+    assert cache.usage() == {"b.pdf": 300}
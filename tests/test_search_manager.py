@@ -0,0 +1,83 @@
+# tests/test_search_manager.py
+# 文字索引の作成：ワーカーが失敗したページ範囲は投入し直し、それでも駄目なら索引なしとして残す
+from concurrent.futures import Future
+import pytest
+import search_manager
+from search_manager import SearchManager
+from conftest import Root, write_pdf
+
+
+class _Pool:
+    """submit したその場で結果を入れるプール（bad のページを含む範囲は fails 回まで失敗）"""
+    def __init__(self, bad=(), fails=1):
+        self.bad = set(bad)
+        self.fails = fails
+        self.calls = []
+
+    def submit(self, fn, path, chunk):
+        self.calls.append(list(chunk))
+        fut = Future()
+        if self.bad & set(chunk) and self.fails > 0:
+            self.fails -= 1
+            fut.set_exception(RuntimeError("worker died"))
+        else:
+            fut.set_result([(p, [(f"w{p}", 0, 0, 1, 1, 0, 0, 0)]) for p in chunk])
+        return fut
+
+    def shutdown(self, **kw):
+        pass
+
+
+class _Model:
+    project_path = None
+
+
+class _App:
+    def __init__(self, path, pages):
+        self.root = Root()
+        self.pdf_path = path
+        self.page_map = list(range(pages))
+        self.model = _Model()
+        self.status = ""
+
+    def set_status(self, text):
+        self.status = text
+
+
+@pytest.fixture
+def app(tmp_path):
+    return _App(write_pdf(tmp_path / "plan.pdf", 40), 40)
+
+
+def _build(app, pool):
+    mgr = SearchManager(app)
+    mgr._executor = pool
+    mgr.start_index()
+    app.root.run_until_idle()
+    return mgr
+
+
+def test_failed_chunk_is_resubmitted(app):
+    pool = _Pool(bad=[20], fails=1)
+    mgr = _build(app, pool)
+    assert len(mgr.index) == 40
+    assert pool.calls.count(pool.calls[1]) == 2
+    assert app.status == "文字索引: 40 ページ"
+
+
+def test_chunk_failing_again_is_reported_not_indexed(app, capsys):
+    pool = _Pool(bad=[20], fails=1 + search_manager.INDEX_RETRIES)
+    mgr = _build(app, pool)
+    chunk = next(c for c in pool.calls if 20 in c)
+    assert len(mgr.index) == 40 - len(chunk)
+    assert not set(chunk) & set(mgr.index.pages)
+    assert f"{len(chunk)} ページは索引を作れませんでした" in app.status
+    assert "worker died" in capsys.readouterr().err
+
+    # 開き直すと足りないページだけ作り直す
+    pool.calls.clear()
+    mgr.start_index()
+    app.root.run_until_idle()
+    assert pool.calls == [chunk]
+    assert len(mgr.index) == 40
+    assert app.status == "文字索引: 40 ページ"
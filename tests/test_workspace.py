@@ -0,0 +1,83 @@
+# tests/test_workspace.py
+# タブを閉じたときのメモリマップ・描画キャッシュの扱いと、全タブ集計
+import pytest
+from PIL import Image
+from document_manager import documents
+from render_service import RenderRequest, RenderResult, raster_cache
+from workspace import Workspace
+from conftest import write_pdf
+
+
+def _cached(path):
+    img = Image.new("RGB", (4, 4))
+    raster_cache.put(RenderResult(RenderRequest(path, 0, 0, 1.0, None, 1), img, 1.0))
+
+
+@pytest.fixture
+def pdfs(tmp_path):
+    a, b = write_pdf(tmp_path / "a.pdf", 2), write_pdf(tmp_path / "b.pdf", 2)
+    yield a, b
+    raster_cache.drop()
+    documents.close_all_except()
+
+
+def _open(ws, path, new_tab=True):
+    tab = ws.add() if new_tab else ws.current
+    tab.model.open_pdf(path, keep=ws.paths(exclude=tab.model))
+    return tab
+
+
+def test_close_keeps_mapping_shared_with_other_tab(pdfs):
+    a, b = pdfs
+    ws = Workspace()
+    _open(ws, a, new_tab=False)
+    _open(ws, a)
+    _open(ws, b)
+    _cached(a)
+    _cached(b)
+
+    ws.close(0)
+    # もう1つのタブが同じPDFを開いているので、マップもキャッシュも残す
+    assert documents._key(a) in documents._maps
+    assert raster_cache.get(a, 0, 1.0) is not None
+    assert len(ws.tabs[0].model.doc) == 2
+
+    ws.close(0)
+    assert documents._key(a) not in documents._maps
+    assert raster_cache.get(a, 0, 1.0) is None
+    assert documents._key(b) in documents._maps
+    assert raster_cache.get(b, 0, 1.0) is not None
+
+
+def test_opening_other_pdf_keeps_mappings_of_other_tabs(pdfs):
+    a, b = pdfs
+    ws = Workspace()
+    _open(ws, a, new_tab=False)
+    _open(ws, b)
+    assert documents._key(a) in documents._maps
+    assert documents._key(b) in documents._maps
+
+
+def test_closing_last_tab_leaves_empty_tab(pdfs):
+    a, _ = pdfs
+    ws = Workspace()
+    _open(ws, a, new_tab=False)
+    ws.close(0)
+    assert len(ws) == 1
+    assert ws.current.model.doc is None
+    assert ws.titles() == ["(なし)"]
+
+
+def test_total_stats_adds_up_documents():
+    ws = Workspace()
+    plan, elevation = ws.current.model, ws.add().model
+    plan.pdf_path, elevation.pdf_path = "plan.pdf", "elevation.pdf"
+    plan.shapes_by_page = {0: [{"color": "#ff0000", "value": 1.5}]}
+    elevation.shapes_by_page = {0: [{"color": "#ff0000", "value": 2.25}],
+                                1: [{"color": "#800080", "value": 1}]}
+    # PDF を開いていないタブは数えない
+    ws.add()
+    total, per_doc, _ = ws.total_stats()
+    assert total["wall_final"] == pytest.approx(2.75)
+    assert total["window"] == 1
+    assert len(per_doc) == 2
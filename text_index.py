@@ -0,0 +1,196 @@
+# text_index.py
+# PDF の文字（図面番号・室名など）の転置索引。GUI不要
+#   単語は page.get_text("words") から取り、位置（矩形）と一緒に持つ。
+#   ページ番号は元PDFのページ番号（ページを削除しても索引は作り直さない）。
+import os
+import gzip
+import json
+import bisect
+import unicodedata
+
+INDEX_VERSION = 1
+# 索引ファイルの拡張子（プロジェクトJSONの隣に置く。一括集計の *.json 探索に混ざらないよう .json にしない）
+INDEX_EXT = ".textindex"
+
+
+def normalize(word):
+    """検索用に正規化（全角・半角と大文字・小文字の違いを無視）"""
+    return unicodedata.normalize("NFKC", word).casefold()
+
+
+def index_path_for(project_path):
+    return os.path.splitext(project_path)[0] + INDEX_EXT
+
+
+def pdf_signature(pdf_path):
+    """索引が同じPDFから作られたかを確かめるための (サイズ, 更新時刻)"""
+    st = os.stat(pdf_path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def page_words(page):
+    """ページの単語 [(語, x0, y0, x1, y1, ブロック, 行, 語番号), ...]（表示と同じ座標）"""
+    import fitz
+    out = []
+    m = page.rotation_matrix if page.rotation else None
+    for w in page.get_text("words"):
+        x0, y0, x1, y1 = w[:4]
+        if m is not None:
+            # 回転したページは表示の向きにそろえる
+            r = fitz.Rect(x0, y0, x1, y1) * m
+            x0, y0, x1, y1 = r.x0, r.y0, r.x1, r.y1
+        out.append((w[4], round(x0, 1), round(y0, 1), round(x1, 1), round(y1, 1), w[5], w[6], w[7]))
+    return out
+
+
+def extract_words(pdf_path, source_pages):
+    """ワーカー側：[(ページ, page_words の結果), ...]"""
+    from render_service import _worker_doc
+    doc = _worker_doc(pdf_path)
+    return [(pno, page_words(doc.load_page(pno))) for pno in source_pages]
+
+
+class SearchHit:
+    """検索結果1件（ページは元PDFのページ番号、rect は PDF座標）"""
+    __slots__ = ("source_page", "rect", "text")
+
+    def __init__(self, source_page, rect, text):
+        self.source_page = source_page
+        self.rect = rect
+        self.text = text
+
+    def __repr__(self):
+        return f"SearchHit({self.source_page}, {self.rect}, {self.text!r})"
+
+
+class TextIndex:
+    """正規化した語 → 出現位置 [(ページ, ブロック, 行, 語番号, x0, y0, x1, y1, 元の語)] の索引"""
+
+    def __init__(self, pdf_signature=None):
+        self.pdf_signature = pdf_signature
+        self.postings = {}
+        self.pages = set()      # 索引済みの元ページ番号
+        self._terms = None      # 前方一致用の語の一覧（ソート済み、必要になったら作る）
+
+    def add_page(self, pno, words):
+        """1ページ分の単語を追加（extract_words の結果）"""
+        if pno in self.pages:
+            return
+        postings = self.postings
+        for word, x0, y0, x1, y1, block, line, wno in words:
+            key = normalize(word)
+            entry = (pno, block, line, wno, x0, y0, x1, y1, word)
+            lst = postings.get(key)
+            if lst is None:
+                postings[key] = [entry]
+            else:
+                lst.append(entry)
+        self.pages.add(pno)
+        self._terms = None
+
+    def __len__(self):
+        return len(self.pages)
+
+    # ---------- 検索 ----------
+    def _terms_sorted(self):
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        return self._terms
+
+    def _lookup(self, token, prefix):
+        """語に一致（prefix=True なら前方一致）する出現位置"""
+        if not prefix:
+            return self.postings.get(token, [])
+        terms = self._terms_sorted()
+        i = bisect.bisect_left(terms, token)
+        out = []
+        while i < len(terms) and terms[i].startswith(token):
+            out.extend(self.postings[terms[i]])
+            i += 1
+        return out
+
+    def search(self, query, limit=1000):
+        """語（空白区切りなら連続した語の並び）を探す。
+
+        完全一致がなければ前方一致で探す。結果はページ順・上から順。
+        """
+        tokens = [normalize(t) for t in query.split()]
+        if not tokens:
+            return []
+        for prefix in (False, True):
+            hits = self._search_tokens(tokens, prefix)
+            if hits:
+                break
+        hits.sort(key=lambda h: (h.source_page, h.rect[1], h.rect[0]))
+        return hits[:limit]
+
+    def _search_tokens(self, tokens, prefix):
+        first = self._lookup(tokens[0], prefix and len(tokens) == 1)
+        if len(tokens) == 1:
+            return [SearchHit(e[0], (e[4], e[5], e[6], e[7]), e[8]) for e in first]
+
+        # 2語目以降は同じ行の次の語として続いているものだけ（最後の語だけ前方一致）
+        following = []
+        for i, tok in enumerate(tokens[1:], 1):
+            last = i == len(tokens) - 1
+            following.append({e[:4]: e for e in self._lookup(tok, prefix and last)})
+
+        hits = []
+        for e in first:
+            pno, block, line, wno = e[:4]
+            x0, y0, x1, y1 = e[4:8]
+            text = [e[8]]
+            ok = True
+            for k, pos in enumerate(following, 1):
+                nxt = pos.get((pno, block, line, wno + k))
+                if nxt is None:
+                    ok = False
+                    break
+                x0, y0 = min(x0, nxt[4]), min(y0, nxt[5])
+                x1, y1 = max(x1, nxt[6]), max(y1, nxt[7])
+                text.append(nxt[8])
+            if ok:
+                hits.append(SearchHit(pno, (x0, y0, x1, y1), " ".join(text)))
+        return hits
+
+    # ---------- 保存・読み込み ----------
+    def save(self, path):
+        """gzip した JSON で保存（一時ファイルに書いてから置き換える）"""
+        data = {
+            "version": INDEX_VERSION,
+            "pdf_signature": self.pdf_signature,
+            "pages": sorted(self.pages),
+            "postings": self.postings,
+        }
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, pdf_signature=None):
+        """保存した索引を読む。版・PDF が違えば None"""
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION:
+            return None
+        if pdf_signature is not None and data.get("pdf_signature") != list(pdf_signature):
+            return None
+        idx = cls(data.get("pdf_signature"))
+        idx.postings = {k: [tuple(e) for e in v] for k, v in data["postings"].items()}
+        idx.pages = set(data["pages"])
+        return idx
+
+
+def build_index(pdf_path, source_pages=None):
+    """GUIなしで索引を一括作成（このプロセスで順に処理）"""
+    import fitz
+    idx = TextIndex(pdf_signature(pdf_path))
+    with fitz.open(pdf_path) as doc:
+        pages = range(len(doc)) if source_pages is None else source_pages
+        for pno in pages:
+            idx.add_page(pno, page_words(doc.load_page(pno)))
+    return idx
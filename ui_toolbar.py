@@ -20,12 +20,15 @@ class UIToolbar:
         tk.Button(file_frame, text="Save JSON", command=self.app.save_project_dialog).pack(side=tk.LEFT, padx=2)
         tk.Button(file_frame, text="Load JSON", command=self.app.load_project_dialog).pack(side=tk.LEFT, padx=2)
         tk.Button(file_frame, text="PDF", command=self.app.export_pdf_dialog).pack(side=tk.LEFT, padx=2)
+        tk.Button(file_frame, text="画像", command=self.app.export_images_dialog).pack(side=tk.LEFT, padx=2)
         tk.Button(file_frame, text="集計", command=self.app.run_total_and_page_summary).pack(side=tk.LEFT, padx=2)
+        tk.Button(file_frame, text="明細", command=self.app.export_quantities_dialog).pack(side=tk.LEFT, padx=2)
         tk.Button(
             file_frame,
             text="全ページ集計",
             command=self.app.run_total_and_all_page_summary
         ).pack(side=tk.LEFT, padx=2)
+        tk.Button(file_frame, text="全タブ集計", command=self.app.show_workspace_totals_dialog).pack(side=tk.LEFT, padx=2)
 
         # ==== ページ操作 ====
         nav_frame = tk.Frame(tb, bg="#f0f0f0")
@@ -34,6 +37,15 @@ class UIToolbar:
         tk.Button(nav_frame, text="◀ Prev", command=self.app.prev_page).pack(side=tk.LEFT, padx=2)
         tk.Button(nav_frame, text="Next ▶", command=self.app.next_page).pack(side=tk.LEFT, padx=2)
 
+        # ==== 文字検索 ====
+        search_frame = tk.Frame(tb, bg="#f0f0f0")
+        search_frame.pack(side=tk.LEFT, padx=5)
+        self.app.search_var = tk.StringVar()
+        entry = tk.Entry(search_frame, textvariable=self.app.search_var, width=14)
+        entry.pack(side=tk.LEFT, padx=2)
+        entry.bind("<Return>", self.app.search_text)
+        tk.Button(search_frame, text="検索", command=self.app.search_text).pack(side=tk.LEFT, padx=2)
+
         # ==== モード切り替え ====
         mode_frame = tk.Frame(tb, bg="#f0f0f0")
         mode_frame.pack(side=tk.LEFT, padx=5)
@@ -42,6 +54,11 @@ class UIToolbar:
         self.app.btn_draw = tk.Button(mode_frame, text="Draw", command=lambda: self.app.toggle_mode(self.app.btn_draw, "draw"))
         self.app.btn_move.pack(side=tk.LEFT, padx=2)
         self.app.btn_draw.pack(side=tk.LEFT, padx=2)
+        tk.Button(mode_frame, text="名前", command=self.app.name_selected_dialog).pack(side=tk.LEFT, padx=2)
+        tk.Button(mode_frame, text="一括", command=self.app.bulk_edit_dialog).pack(side=tk.LEFT, padx=2)
+        tk.Button(mode_frame, text="↶", width=2, command=self.app.undo).pack(side=tk.LEFT, padx=2)
+        self.app.btn_snap = tk.Button(mode_frame, text="Snap", bg="lightblue", command=self.app.toggle_snap)
+        self.app.btn_snap.pack(side=tk.LEFT, padx=2)
 
         # ==== 図形ボタン ====
         shape_frame = tk.Frame(tb, bg="#f0f0f0")
@@ -53,6 +70,7 @@ class UIToolbar:
             ("🟣 Ellipse", "ellipse"),
             ("➖ Line", "line"),
             ("🔺 Triangle", "triangle"),
+            ("⬟ Polygon", "polygon"),
             ("📝 Text", "text"),
         ]:
             b = tk.Button(shape_frame, text=text, command=lambda s=name: self.app.toggle_shape(s))
@@ -104,6 +122,8 @@ class UIToolbar:
         tk.Label(zoom_frame, text="🔍 Zoom:", bg="#f0f0f0").pack(side=tk.LEFT)
         tk.Button(zoom_frame, text="+", command=self.app.zoom_in, width=3).pack(side=tk.LEFT, padx=2)
         tk.Button(zoom_frame, text="-", command=self.app.zoom_out, width=3).pack(side=tk.LEFT, padx=2)
+        tk.Button(zoom_frame, text="HUD", command=self.app.toggle_hud).pack(side=tk.LEFT, padx=2)
+        tk.Button(zoom_frame, text="計測保存", command=self.app.dump_perf_dialog).pack(side=tk.LEFT, padx=2)
 
         # ==== ステータスバー ====
         self.app.status = tk.Label(root, text="No PDF loaded", anchor="w", bg="#eaeaea", relief="sunken")
@@ -131,20 +151,42 @@ class UIToolbar:
 
         self.bind_slope_events()
 
+        # ==== タブ（開いている図面） ====
+        self.tab_frame = tk.Frame(root, bg="#d8d8d8")
+        self.tab_frame.pack(side=tk.TOP, fill=tk.X, before=self.app.canvas)
+        self.refresh_tabs()
+
+    def refresh_tabs(self):
+        """タブのボタンを作り直す（選択中は強調、× で閉じる）"""
+        for w in self.tab_frame.winfo_children():
+            w.destroy()
+        ws = self.app.workspace
+        for i, title in enumerate(ws.titles()):
+            active = i == ws.active
+            bg = "white" if active else "#d8d8d8"
+            tk.Button(
+                self.tab_frame, text=title, bg=bg, relief="sunken" if active else "raised",
+                command=lambda i=i: self.app.switch_tab(i),
+            ).pack(side=tk.LEFT, padx=(2, 0), pady=2)
+            tk.Button(
+                self.tab_frame, text="×", bg=bg, width=2,
+                command=lambda i=i: self.app.close_tab(i),
+            ).pack(side=tk.LEFT, pady=2)
+
     # =====================================================
     # 色切り替え・カスタムカラー選択
     # =====================================================
     def set_color(self, color):
-        """固定色／基本色ボタン押下時"""
+        """固定色／基本色ボタン押下時（複数選択中はその図形の色も変える）"""
         self.app.current_color = color
         self.app.color_preview.config(bg=color)
+        self.app.recolor_selection(color)
 
     def choose_color(self):
         """カラーピッカーで色を選ぶ"""
         color_code = colorchooser.askcolor(title="色を選択")
         if color_code and color_code[1]:
-            self.app.current_color = color_code[1]
-            self.app.color_preview.config(bg=color_code[1])
+            self.set_color(color_code[1])
 
     def bind_slope_events(self):
         self.slope_combo.bind("<<ComboboxSelected>>", self.on_slope_selected)
@@ -27,4 +27,94 @@ def point_in_triangle(pt, v1, v2, v3):
     a = ((y2 - y3)*(x - x3) + (x3 - x2)*(y - y3)) / denom
     b = ((y3 - y1)*(x - x3) + (x1 - x3)*(y - y3)) / denom
     c = 1 - a - b
-    return 0 <= a <= 1 and 0 <= b <= 1 and 0 <= c <= 1
\ No newline at end of file
+    return 0 <= a <= 1 and 0 <= b <= 1 and 0 <= c <= 1
+
+
+def polygon_area(points):
+    """多角形の面積（靴ひも公式）。頂点の順は時計回り・反時計回りどちらでもよい"""
+    n = len(points)
+    if n < 3:
+        return 0.0
+    # 桁落ちを抑えるため最初の頂点を原点にして計算
+    ox, oy = points[0]
+    s = 0.0
+    px, py = points[-1][0] - ox, points[-1][1] - oy
+    for x, y in points:
+        x -= ox
+        y -= oy
+        s += px * y - x * py
+        px, py = x, y
+    return abs(s) / 2.0
+
+
+def point_in_polygon(px, py, points):
+    """点(px,py)が多角形内か（レイキャスティング、偶奇規則）"""
+    inside = False
+    x1, y1 = points[-1]
+    for x2, y2 in points:
+        if (y1 > py) != (y2 > py):
+            if px < x1 + (py - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+def simplify_polygon(points, tol, indices=None):
+    """Douglas–Peucker で閉じた多角形を簡略化し、残す頂点の番号（昇順）を返す。
+
+    indices を渡すとその頂点だけを対象にする（細かい簡略化の結果をさらに粗くするとき）。
+    """
+    if indices is None:
+        # 前処理：直前に残した頂点から tol 未満の頂点は落とす（DP の対象を減らす）
+        tol2 = tol * tol
+        indices = [0]
+        lx, ly = points[0]
+        for i in range(1, len(points)):
+            x, y = points[i]
+            if (x - lx) * (x - lx) + (y - ly) * (y - ly) >= tol2:
+                indices.append(i)
+                lx, ly = x, y
+    n = len(indices)
+    if n <= 3:
+        return list(indices)
+
+    xs = [points[i][0] for i in indices]
+    ys = [points[i][1] for i in indices]
+    # 先頭と、そこから最も遠い頂点で2本の折れ線に分けて、それぞれを簡略化
+    x0, y0 = xs[0], ys[0]
+    far = max(range(1, n), key=lambda k: (xs[k] - x0) ** 2 + (ys[k] - y0) ** 2)
+    keep = [False] * n
+    keep[0] = keep[far] = True
+    tol2 = tol * tol
+    stack = [(0, far), (far, n)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        ax, ay = xs[a], ys[a]
+        bx, by = xs[b % n], ys[b % n]
+        dx, dy = bx - ax, by - ay
+        ll = dx * dx + dy * dy
+        best, best_d = -1, tol2
+        for k in range(a + 1, b):
+            px, py = xs[k] - ax, ys[k] - ay
+            t = (px * dx + py * dy) / ll if ll else 0.0
+            if t < 0.0:
+                t = 0.0
+            elif t > 1.0:
+                t = 1.0
+            ex, ey = px - t * dx, py - t * dy
+            d = ex * ex + ey * ey
+            if d > best_d:
+                best, best_d = k, d
+        if best >= 0:
+            keep[best] = True
+            stack.append((a, best))
+            stack.append((best, b))
+
+    out = [indices[k] for k in range(n) if keep[k]]
+    if len(out) < 3:
+        # 細すぎて線に潰れるときも三角形は残す
+        extra = next(k for k in range(1, n) if k != far)
+        out = sorted(out + [indices[extra]])
+    return out
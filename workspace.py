@@ -0,0 +1,91 @@
+# workspace.py
+# 複数の図面（平面図・立面図など）をタブで同時に開いておく。GUI不要
+#   タブごとに DocumentModel と表示状態を持ち、描画キャッシュ（render_service.raster_cache）と
+#   メモリマップ（document_manager.documents）は全タブで共有する。
+#   タブの切り替えはファイルを開き直さない。
+import os
+from document_model import DocumentModel
+import quantity
+
+
+class WorkspaceTab:
+    """1つのタブ：図面のモデルと、最後に見ていたページ・倍率・スクロール位置"""
+    __slots__ = ("model", "page_index", "scale", "offset_x", "offset_y")
+
+    def __init__(self, model=None):
+        self.model = model if model is not None else DocumentModel()
+        self.page_index = 0
+        self.scale = 1.0
+        self.offset_x = 0
+        self.offset_y = 0
+
+    @property
+    def title(self):
+        path = self.model.project_path or self.model.pdf_path
+        return os.path.basename(path) if path else "(なし)"
+
+
+class Workspace:
+    """開いているタブの一覧と、選択中のタブ"""
+
+    def __init__(self):
+        self.tabs = [WorkspaceTab()]
+        self.active = 0
+
+    @property
+    def current(self):
+        return self.tabs[self.active]
+
+    def __len__(self):
+        return len(self.tabs)
+
+    def add(self, model=None):
+        """タブを追加して選択する"""
+        tab = WorkspaceTab(model)
+        self.tabs.append(tab)
+        self.active = len(self.tabs) - 1
+        return tab
+
+    def select(self, index):
+        self.active = max(0, min(index, len(self.tabs) - 1))
+        return self.current
+
+    def paths(self, exclude=None):
+        """開いているPDFのパス（exclude のモデルの分は除く）"""
+        return {t.model.pdf_path for t in self.tabs
+                if t.model.pdf_path and t.model is not exclude}
+
+    def close(self, index):
+        """タブを閉じる。ほかのタブが使っていないPDFのメモリマップと描画キャッシュも解放。
+        最後の1枚を閉じたら空のタブを残す"""
+        from document_manager import documents
+        from render_service import raster_cache
+        tab = self.tabs.pop(index)
+        path = tab.model.pdf_path
+        tab.model.close()
+        if not self.tabs:
+            self.tabs.append(WorkspaceTab())
+        if path and path not in self.paths():
+            documents.close(path)
+            raster_cache.drop(path)
+        if self.active >= index and self.active > 0:
+            self.active -= 1
+        self.active = min(self.active, len(self.tabs) - 1)
+        return tab
+
+    def titles(self):
+        """タブ名の一覧（同じ名前には (2) などを付けて区別）"""
+        out = []
+        seen = {}
+        for t in self.tabs:
+            name = t.title
+            n = seen.get(name, 0) + 1
+            seen[name] = n
+            out.append(name if n == 1 else f"{name} ({n})")
+        return out
+
+    def total_stats(self):
+        """開いているすべての図面の総合集計 (合計, {タブ名: 図面ごとの合計}, 式一覧)"""
+        docs = [(name, t.model.shapes_by_page, t.model.page_slope_default)
+                for name, t in zip(self.titles(), self.tabs) if t.model.pdf_path]
+        return quantity.calc_documents_total_stats(docs)